@@ -0,0 +1,13 @@
+"""Benchmarks do Crypt of Little Echoes.
+
+Rode a partir da raiz do projeto, por exemplo:
+
+    python -m benchmarks.entity_memory
+    python -m benchmarks.suite
+
+O jogo é importado sem janela e sem áudio (drivers "dummy" do SDL).
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
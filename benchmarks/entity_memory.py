@@ -0,0 +1,124 @@
+"""Compara memória e alocações por frame de 10k entidades: layout antigo vs. __slots__.
+
+O layout antigo (classes com __dict__ e rect() criando um Rect novo a cada
+chamada) é reproduzido aqui só para a comparação.
+"""
+import sys
+import time
+import tracemalloc
+
+from pygame import Rect
+
+import main
+
+COUNT = 10_000
+
+
+class LegacyEnemy:
+    """Mesmo formato do Enemy antes de __slots__: atributos soltos no __dict__."""
+
+    def __init__(self, e):
+        self.x = e.x
+        self.y = e.y
+        self.territory_center = e.territory_center
+        self.territory_radius = e.territory_radius
+        self.speed = e.speed
+        self.width = e.width
+        self.height = e.height
+        self.frame = e.frame
+        self.frame_timer = e.frame_timer
+        self.target = e.target
+        self.pause_until = e.pause_until
+        self.is_alert = e.is_alert
+        self.chase_timeout = e.chase_timeout
+
+    def rect(self):
+        return Rect(int(self.x - self.width / 2), int(self.y - self.height / 2), self.width, self.height)
+
+
+class LegacyPlayer:
+    def __init__(self, p):
+        self.x = p.x
+        self.y = p.y
+        self.width = p.width
+        self.height = p.height
+
+    def rect(self):
+        return Rect(int(self.x - self.width / 2), int(self.y - self.height / 2), self.width, self.height)
+
+
+def measure_build(factory):
+    """Bytes retidos para construir as entidades com factory()."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    entities = factory()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return entities, after - before
+
+
+def measure_frame(entities, player):
+    """Bytes alocados e tempo de uma passada de colisão (rect da entidade + rect do jogador)."""
+    # Os retângulos são mantidos vivos durante a medição para contar o lixo que
+    # um frame gera; a lista que os guarda é pré-alocada e descontada
+    frame_rects = [None] * (2 * len(entities))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    i = 0
+    for e in entities:
+        frame_rects[i] = e.rect()
+        frame_rects[i + 1] = player.rect()
+        i += 2
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del frame_rects
+
+    start = time.perf_counter()
+    for e in entities:
+        main.rect_collide(e.rect(), player.rect())
+    elapsed = time.perf_counter() - start
+    return allocated, elapsed
+
+
+def spawn(count):
+    """Exatamente count inimigos; sem separação, senão o posicionamento devolve bem menos que o pedido."""
+    enemies = main.spawn_enemies(count, separation=0)
+    if len(enemies) != count:
+        raise RuntimeError(f"{len(enemies)} inimigos gerados, {count} pedidos")
+    return enemies
+
+
+def main_benchmark(count=COUNT):
+    player = main.Player(main.WIDTH // 2, main.HEIGHT // 2)
+
+    legacy, legacy_bytes = measure_build(lambda: [LegacyEnemy(e) for e in spawn(count)])
+    slotted, slotted_bytes = measure_build(lambda: spawn(count))
+    legacy_frame, legacy_time = measure_frame(legacy, LegacyPlayer(player))
+    slotted_frame, slotted_time = measure_frame(slotted, player)
+
+    # Os slotted não guardam Rect próprio: rect() devolve um Rect de rascunho da classe.
+    # O grosso da memória retida são os valores dos atributos (floats, ints,
+    # tuplas), os mesmos nos dois layouts; __slots__ só encolhe o objeto em si
+    slotted_obj = sys.getsizeof(slotted[0])
+    values = slotted_bytes - count * slotted_obj
+    # Medido pela diferença: getsizeof(__dict__) materializaria o dict, que o
+    # Python 3.11+ guarda compacto no próprio objeto enquanto ninguém o pede
+    legacy_obj = (legacy_bytes - values) // count
+
+    print(f"{count} inimigos")
+    print(f"  bytes por objeto  antigo: {legacy_obj:9d}       __slots__: {slotted_obj:9d}")
+    print(f"  memória retida    antigo: {legacy_bytes / 1024:9.1f} KiB   __slots__: {slotted_bytes / 1024:9.1f} KiB"
+          f"   ({legacy_bytes / max(1, slotted_bytes):.2f}x)")
+    print(f"    dos quais valores dos atributos (iguais nos dois layouts): {values / 1024:.1f} KiB")
+    print(f"  alocado por frame antigo: {legacy_frame / 1024:9.1f} KiB   __slots__: {slotted_frame / 1024:9.1f} KiB")
+    print(f"  passada de colisão antigo: {legacy_time * 1000:8.2f} ms    __slots__: {slotted_time * 1000:8.2f} ms")
+    return {
+        "legacy_bytes": legacy_bytes,
+        "slotted_bytes": slotted_bytes,
+        "legacy_frame_bytes": legacy_frame,
+        "slotted_frame_bytes": slotted_frame,
+    }
+
+
+if __name__ == "__main__":
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else COUNT)
@@ -0,0 +1,135 @@
+"""Teste de carga do servidor multijogador em loopback: 2, 8 e 32 jogadores.
+
+Servidor e clientes rodam no mesmo processo e no mesmo laço asyncio, em
+127.0.0.1. Cada cliente troca de direção ao acaso (semente fixa) a cada
+CHANGE_INTERVAL segundos. Mede-se só o trabalho do servidor: tempo por tick
+de simulação, tempo por rodada de snapshots e a fração de um núcleo que a
+sessão ocupa, de onde sai quantas sessões iguais um núcleo aguenta. A banda
+é medida em bytes por cliente (snapshots recebidos e entradas enviadas).
+
+    python -m benchmarks.netload --duration 10
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+
+from tools import server as net
+
+PLAYER_COUNTS = (2, 8, 32)
+DURATION = 10.0  # segundos de relógio por rodada
+CHANGE_INTERVAL = 0.3
+DIRECTIONS = (0, 1, 2, 4, 8, 1 | 4, 1 | 8, 2 | 4, 2 | 8)  # combinações de INPUT_*
+
+
+async def drive(client, rnd, stop):
+    """Muda a entrada do cliente ao acaso até stop."""
+    while not stop.is_set():
+        client.send_input(rnd.choice(DIRECTIONS))
+        await asyncio.sleep(CHANGE_INTERVAL)
+
+
+def p95(values):
+    values = sorted(values)
+    return values[int(0.95 * (len(values) - 1))] if values else 0.0
+
+
+async def run_round(game, players, duration, send_hz, seed):
+    server = net.GameServer(game, send_hz, seed)
+    listener = await server.serve(net.HOST, 0)
+    port = listener.sockets[0].getsockname()[1]
+    stop = asyncio.Event()
+    server_task = asyncio.create_task(server.run(stop))
+
+    clients = []
+    for _ in range(players):
+        client = net.GameClient()
+        await client.connect(net.HOST, port)
+        clients.append(client)
+    rnd = random.Random(seed)
+    tasks = [asyncio.create_task(c.receive()) for c in clients]
+    tasks += [asyncio.create_task(drive(c, random.Random(rnd.random()), stop)) for c in clients]
+
+    # Descarta o começo (conexões e partida nova) antes de medir
+    await asyncio.sleep(1.0)
+    server.tick_times.clear()
+    server.send_times.clear()
+    busy0, ticks0 = server.busy, server.ticks
+    in0 = [c.bytes_in for c in clients]
+    out0 = [c.bytes_out for c in clients]
+    snaps0 = [c.snapshots for c in clients]
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await asyncio.sleep(duration)
+    wall = loop.time() - start
+    busy = server.busy - busy0
+    ticks = server.ticks - ticks0
+    down = [(c.bytes_in - b) / wall for c, b in zip(clients, in0)]
+    up = [(c.bytes_out - b) / wall for c, b in zip(clients, out0)]
+    snaps = [(c.snapshots - n) / wall for c, n in zip(clients, snaps0)]
+    in_view = statistics.fmean(len(c.entities) for c in clients)
+    # Para comparar: o mesmo snapshot sem delta (tudo como entidade nova)
+    full = statistics.fmean(len(net.encode_state(0, game.mode, 0, server.view(conn.player), {}))
+                            for conn in server.clients) + 2
+
+    stop.set()
+    for c in clients:
+        c.close()
+    await server_task
+    listener.close()
+    await listener.wait_closed()
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Fração de um núcleo que o servidor gastou por segundo de jogo
+    load = busy / wall
+    return {
+        "players": players,
+        "tick_ms": statistics.fmean(server.tick_times) * 1000 if server.tick_times else 0.0,
+        "tick_p95_ms": p95(server.tick_times) * 1000,
+        "send_ms": statistics.fmean(server.send_times) * 1000 if server.send_times else 0.0,
+        "ticks_per_s": ticks / wall,
+        "load": load,
+        "sessions_per_core": 1 / load if load else 0.0,
+        "down_bps": statistics.fmean(down),
+        "full_bps": full * statistics.fmean(snaps),
+        "up_bps": statistics.fmean(up),
+        "snapshots_per_s": statistics.fmean(snaps),
+        "entities_in_view": in_view,
+    }
+
+
+def print_report(results):
+    print(f"{'jogadores':>9} {'tick ms':>8} {'p95':>7} {'envio ms':>9} {'ticks/s':>8} "
+          f"{'núcleo':>7} {'sessões/núcleo':>15} {'desce KB/s':>11} {'sem delta':>10} {'sobe B/s':>9} "
+          f"{'entidades':>10}")
+    for r in results:
+        print(f"{r['players']:9d} {r['tick_ms']:8.3f} {r['tick_p95_ms']:7.3f} {r['send_ms']:9.3f} "
+              f"{r['ticks_per_s']:8.0f} {r['load'] * 100:6.1f}% {r['sessions_per_core']:15.1f} "
+              f"{r['down_bps'] / 1024:11.2f} {r['full_bps'] / 1024:10.2f} {r['up_bps']:9.1f} "
+              f"{r['entities_in_view']:10.1f}")
+    print("desce/sobe: por cliente; sem delta: o que desceria mandando o snapshot inteiro;\n"
+          "núcleo: fração de um núcleo ocupada pelo servidor (simulação + snapshots), sem contar os clientes")
+
+
+async def main_benchmark(counts=PLAYER_COUNTS, duration=DURATION, send_hz=net.SEND_HZ, seed=1):
+    game = net.load_game()
+    results = [await run_round(game, n, duration, send_hz, seed) for n in counts]
+    print_report(results)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, nargs="+", default=list(PLAYER_COUNTS))
+    parser.add_argument("--duration", type=float, default=DURATION)
+    parser.add_argument("--send-hz", type=int, default=net.SEND_HZ)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    return asyncio.run(main_benchmark(args.players, args.duration, args.send_hz, args.seed))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
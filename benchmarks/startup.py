@@ -0,0 +1,43 @@
+"""Mede o tempo de inicialização a frio: da importação do main.py ao primeiro frame.
+
+Cada rodada inicia o jogo num processo novo (pgzrun com drivers "dummy" do
+SDL); o jogo imprime startup_ms e sai logo após apresentar o primeiro frame.
+Também é medido o tempo total do processo, que inclui o interpretador e o
+import do PgZero.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Mesmo nome de main.STARTUP_EXIT_ENV (o jogo não é importado aqui, para não iniciar o áudio à toa)
+STARTUP_EXIT_ENV = "CRYPT_STARTUP_EXIT"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+
+
+def measure_once():
+    env = dict(os.environ)
+    env[STARTUP_EXIT_ENV] = "1"
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-m", "pgzero", "main.py"], cwd=ROOT, env=env,
+                          capture_output=True, text=True, timeout=60)
+    wall = time.perf_counter() - start
+    for line in proc.stdout.splitlines():
+        if line.startswith("startup_ms="):
+            return float(line.split("=", 1)[1]), wall * 1000
+    raise RuntimeError(f"o jogo não informou startup_ms:\n{proc.stdout}\n{proc.stderr}")
+
+
+def main_benchmark(runs=RUNS):
+    samples = [measure_once() for _ in range(runs)]
+    startup = statistics.median(s for s, _ in samples)
+    wall = statistics.median(w for _, w in samples)
+    print(f"importação -> primeiro frame: {startup:7.1f} ms (mediana de {runs})")
+    print(f"processo completo:            {wall:7.1f} ms")
+    return {"startup_ms": startup, "process_ms": wall}
+
+
+if __name__ == "__main__":
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else RUNS)
@@ -0,0 +1,339 @@
+"""Suíte de benchmarks com histórico em JSON e limites de regressão.
+
+Cenários (todos sem janela e sem áudio, drivers "dummy" do SDL):
+
+- sim_10 ... sim_10000: um tick de simulação com 10, 100, 1k e 10k inimigos
+  em volta do jogador (o jogador fica parado e invulnerável);
+- horde_10000: o mesmo com a horda vetorizada (requer NumPy);
+- draw_menu, draw_playing, draw_gameover: draw() inteiro em cada modo;
+- draw_map: só o chão (draw_map) com a câmera seguindo o jogador;
+- wave_burst: o tick do update() em que o último item é coletado e a onda
+  seguinte nasce (inimigos e itens novos);
+- particles_20000: atualizar e desenhar um frame com o sistema de
+  partículas cheio (PARTICLE_CAPACITY vivas em volta do jogador; requer NumPy);
+- cold_start: da importação do main.py ao primeiro frame, num processo novo
+  (benchmarks.startup).
+
+Cada cenário dá um tempo em ms (mediana das amostras). O resultado é
+comparado com a mediana das últimas HISTORY_WINDOW execuções gravadas na
+mesma máquina; se algum cenário ficar mais de --threshold mais lento, a
+suíte lista as regressões e sai com código 1 (e a execução não entra no
+histórico, a menos que se passe --accept).
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --only sim_1000 draw_playing --threshold 0.1
+    python -m benchmarks.suite --threshold-for cold_start=0.5 --history bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from types import ModuleType
+
+import pygame
+
+from benchmarks import startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_FILE = os.path.join(ROOT, "benchmarks", "history.json")
+HISTORY_WINDOW = 5  # execuções anteriores que formam a linha de base
+THRESHOLD = 0.25  # fração de piora tolerada antes de acusar regressão
+# Diferença mínima em ms para acusar regressão: abaixo disso é ruído de medição
+MIN_DELTA_MS = 0.02
+SEED = 1
+WARMUP_TICKS = 60
+SIM_TICKS = 240
+DRAW_FRAMES = 120
+WAVE_BURSTS = 40
+COLD_START_RUNS = 3
+
+
+def load_game():
+    """Carrega o main.py como o pgzrun faz (com screen, keyboard etc.), sem janela e sem a saída da importação."""
+    path = os.path.join(ROOT, "main.py")
+    with open(path, encoding="utf-8") as f:
+        code = compile(f.read(), path, "exec", dont_inherit=True)
+    from pgzero.game import PGZeroGame
+    from pgzero.runner import prepare_mod
+
+    mod = ModuleType("main")
+    mod.__file__ = path
+    sys.modules["main"] = mod
+    with contextlib.redirect_stdout(io.StringIO()):
+        prepare_mod(mod)
+        exec(code, mod.__dict__)
+        PGZeroGame(mod).reinit_screen()
+        mod.wait_for_audio()
+    return mod
+
+
+def start_game(game, seed=SEED):
+    """Partida headless com o jogador invulnerável (os cenários não podem acabar em fim de jogo)."""
+    game.start_headless_game(seed)
+    game.player.invulnerable_until = float("inf")
+
+
+def median_ms(samples):
+    return statistics.median(samples) * 1000
+
+
+def time_ticks(game, ticks, inputs=0):
+    """Tempo de cada um de ticks ticks de simulação."""
+    samples = []
+    for _ in range(ticks):
+        t = time.perf_counter()
+        game.simulate_tick(game.SIM_DT, inputs)
+        samples.append(time.perf_counter() - t)
+    return samples
+
+
+# ----------------------------
+# CENÁRIOS
+# ----------------------------
+def sim_scenario(count):
+    def run(game):
+        # Sem os inimigos dos chunks, para a contagem ser exatamente count
+        chunk_enemies = game.CHUNK_ENEMIES
+        game.CHUNK_ENEMIES = 0
+        try:
+            start_game(game)
+        finally:
+            game.CHUNK_ENEMIES = chunk_enemies
+        # Sem separação mínima: a região em volta do jogador não comporta 10k inimigos espaçados
+        game.add_enemies(game.spawn_enemies(count, separation=0))
+        if len(game.enemies) != count:
+            raise RuntimeError(f"sim_{count}: {len(game.enemies)} inimigos gerados")
+        time_ticks(game, WARMUP_TICKS)
+        return median_ms(time_ticks(game, SIM_TICKS))
+    return run
+
+
+def horde_scenario(count):
+    def run(game):
+        game.start_horde_game(count, SEED)
+        game.player.invulnerable_until = float("inf")
+        time_ticks(game, WARMUP_TICKS)
+        return median_ms(time_ticks(game, SIM_TICKS))
+    return run
+
+
+def draw_scenario(mode):
+    def run(game):
+        start_game(game)
+        # O jogador anda em círculos para a câmera (e o chão) mudar entre os frames
+        moves = (game.INPUT_RIGHT, game.INPUT_DOWN, game.INPUT_LEFT, game.INPUT_UP)
+        samples = []
+        for frame in range(WARMUP_TICKS + DRAW_FRAMES):
+            if mode == "playing":
+                game.simulate_tick(game.SIM_DT, moves[frame // 30 % 4])
+            game.mode = mode
+            t = time.perf_counter()
+            game.draw()
+            samples.append(time.perf_counter() - t)
+        return median_ms(samples[WARMUP_TICKS:])
+    return run
+
+
+def draw_map_scenario(game):
+    start_game(game)
+    moves = (game.INPUT_RIGHT, game.INPUT_DOWN, game.INPUT_LEFT, game.INPUT_UP)
+    samples = []
+    for frame in range(WARMUP_TICKS + DRAW_FRAMES):
+        game.simulate_tick(game.SIM_DT, moves[frame // 30 % 4])
+        game.camera.follow(*game.player.render_pos())
+        t = time.perf_counter()
+        game.draw_map()
+        samples.append(time.perf_counter() - t)
+    return median_ms(samples[WARMUP_TICKS:])
+
+
+def wave_burst_scenario(game):
+    """Tick do update() que fecha a onda: todos os itens coletados, inimigos e itens novos gerados."""
+    start_game(game)
+    time_ticks(game, WARMUP_TICKS)
+    before = game.save_snapshot()
+    samples = []
+    for _ in range(WAVE_BURSTS):
+        game.restore_snapshot(before)
+        for it in list(game.items):
+            game.collect_item(it)
+        game.sim_accumulator = 0.0
+        t = time.perf_counter()
+        game.update(game.SIM_DT)  # exatamente um tick, pelo mesmo caminho do jogo
+        samples.append(time.perf_counter() - t)
+    if not game.items:
+        raise RuntimeError("wave_burst: a onda seguinte não foi gerada")
+    return median_ms(samples)
+
+
+def particles_scenario(game):
+    """Um frame (update + draw) com o sistema de partículas cheio; a vida longa mantém todas vivas."""
+    start_game(game)
+    ps = game.particles
+    ps.clear()
+    ps.burst(game.player.x, game.player.y, ps.capacity, (250, 215, 110), 300, 3600.0)
+    game.camera.follow(game.player.x, game.player.y)
+    surf = game.screen.surface
+    samples = []
+    for _ in range(DRAW_FRAMES):
+        t = time.perf_counter()
+        ps.update(1 / 60)
+        ps.draw(surf)
+        samples.append(time.perf_counter() - t)
+    if ps.count != ps.capacity:
+        raise RuntimeError(f"particles_20000: {ps.count} partículas vivas, esperava {ps.capacity}")
+    ps.clear()
+    return median_ms(samples)
+
+
+def cold_start_scenario(game):
+    return statistics.median(startup.measure_once()[0] for _ in range(COLD_START_RUNS))
+
+
+SCENARIOS = {
+    "sim_10": sim_scenario(10),
+    "sim_100": sim_scenario(100),
+    "sim_1000": sim_scenario(1000),
+    "sim_10000": sim_scenario(10_000),
+    "horde_10000": horde_scenario(10_000),
+    "draw_menu": draw_scenario("menu"),
+    "draw_playing": draw_scenario("playing"),
+    "draw_gameover": draw_scenario("gameover"),
+    "draw_map": draw_map_scenario,
+    "wave_burst": wave_burst_scenario,
+    "particles_20000": particles_scenario,
+    "cold_start": cold_start_scenario,
+}
+
+
+# ----------------------------
+# HISTÓRICO E REGRESSÕES
+# ----------------------------
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Aviso: histórico {path} ilegível ({e}); começando um novo.")
+        return []
+
+
+def save_history(path, history):
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=1)
+    except OSError as e:
+        print(f"Aviso: não foi possível gravar o histórico em {path}: {e}")
+
+
+def git_commit():
+    try:
+        proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return proc.stdout.strip() or None
+
+
+def baseline(history, name, machine, window=HISTORY_WINDOW):
+    """Mediana das últimas window medições de name nesta máquina (None se não houver)."""
+    values = [run["results"][name] for run in history
+              if run.get("machine") == machine and name in run.get("results", {})]
+    return statistics.median(values[-window:]) if values else None
+
+
+def find_regressions(results, history, machine, threshold, overrides):
+    """Lista (nome, atual, base, piora) dos cenários acima do limite."""
+    regressions = []
+    for name, value in results.items():
+        base = baseline(history, name, machine)
+        if base is None:
+            continue
+        limit = overrides.get(name, threshold)
+        if value > base * (1 + limit) and value - base > MIN_DELTA_MS:
+            regressions.append((name, value, base, value / base - 1))
+    return regressions
+
+
+def print_report(results, history, machine):
+    print(f"{'cenário':<14} {'ms':>10} {'base':>10} {'variação':>9}")
+    for name, value in results.items():
+        base = baseline(history, name, machine)
+        if base is None:
+            print(f"{name:<14} {value:10.3f} {'-':>10} {'-':>9}")
+        else:
+            print(f"{name:<14} {value:10.3f} {base:10.3f} {(value / base - 1) * 100:+8.1f}%")
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep or name not in SCENARIOS:
+            raise SystemExit(f"--threshold-for espera CENÁRIO=FRAÇÃO com um cenário conhecido: {pair}")
+        overrides[name] = float(value)
+    return overrides
+
+
+def run_suite(names=None, history_path=HISTORY_FILE, threshold=THRESHOLD, overrides=None,
+              record=True, accept=False):
+    """Roda os cenários, compara com o histórico e devolve (resultados, regressões)."""
+    names = names or list(SCENARIOS)
+    game = load_game()
+    results = {}
+    for name in names:
+        if name in ("horde_10000", "particles_20000") and game.np is None:
+            print(f"{name}: NumPy não instalado; cenário ignorado")
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[name] = SCENARIOS[name](game)
+    game.mode = "menu"
+
+    history = load_history(history_path)
+    machine = platform.node()
+    print_report(results, history, machine)
+    regressions = find_regressions(results, history, machine, threshold, overrides or {})
+    for name, value, base, worse in regressions:
+        print(f"REGRESSÃO: {name} {value:.3f} ms contra {base:.3f} ms ({worse * 100:+.1f}%)")
+
+    if record and (accept or not regressions):
+        history.append({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "machine": machine,
+            "python": platform.python_version(),
+            "results": results,
+        })
+        save_history(history_path, history)
+    return results, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIOS), metavar="CENÁRIO",
+                        help="roda só estes cenários: " + ", ".join(SCENARIOS))
+    parser.add_argument("--history", default=HISTORY_FILE)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="piora tolerada, em fração da linha de base (padrão %(default)s)")
+    parser.add_argument("--threshold-for", action="append", default=[], metavar="CENÁRIO=FRAÇÃO",
+                        help="limite próprio para um cenário")
+    parser.add_argument("--no-record", action="store_true", help="não grava esta execução no histórico")
+    parser.add_argument("--accept", action="store_true",
+                        help="grava no histórico mesmo com regressões (aceita a nova linha de base)")
+    args = parser.parse_args(argv)
+    _, regressions = run_suite(args.only, args.history, args.threshold, parse_overrides(args.threshold_for),
+                               not args.no_record, args.accept)
+    pygame.quit()
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -2,7 +2,8 @@
 #
 # Jogo simples de roguelike com visão de cima escrito para PgZero,
 # seguindo as restrições do projeto:
-# - Apenas PgZero, math, random e Rect do pygame são usados.
+# - Usa PgZero (e o pygame que vem com ele) e a biblioteca padrão do Python;
+#   NumPy é opcional e só liga o modo horda e as partículas.
 # - Nenhuma imagem externa é necessária (a animação dos sprites é desenhada proceduralmente).
 # - Músicas e sons devem ser fornecidos pelo usuário nas pastas /music e /sounds.
 #
@@ -10,9 +11,31 @@
 # Autor: Cauê Franco
 # Nome do jogo: "Crypt of Little Echoes"
 
+import time
+
+# Marca o início da importação, para medir o tempo até o primeiro frame
+STARTUP_T0 = time.perf_counter()
+
+import csv
+import hashlib
 import math
+import os
 import random
+import struct
+import sys
+import threading
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+
+import pygame
 from pygame import Rect
+from pgzero import ptext
+
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional: sem ele o modo horda fica indisponível
+    np = None
 
 # ----------------------------
 # PREFERÊNCIAS E CONSTANTES
@@ -23,8 +46,31 @@ HEIGHT = 600
 
 # Constantes de jogabilidade
 TILE_SIZE = 40
-MAP_COLS = WIDTH // TILE_SIZE
-MAP_ROWS = HEIGHT // TILE_SIZE
+
+# Mundo em pedaços (chunks): o mapa é maior que a tela e é dividido em chunks
+# quadrados, criados e povoados só quando o jogador se aproxima
+CHUNK_TILES = 10  # ladrilhos por lado de cada chunk
+CHUNK_SIZE = CHUNK_TILES * TILE_SIZE
+WORLD_CHUNKS_X = 8
+WORLD_CHUNKS_Y = 6
+MAP_COLS = WORLD_CHUNKS_X * CHUNK_TILES
+MAP_ROWS = WORLD_CHUNKS_Y * CHUNK_TILES
+WORLD_WIDTH = MAP_COLS * TILE_SIZE
+WORLD_HEIGHT = MAP_ROWS * TILE_SIZE
+CHUNK_LOAD_RADIUS = 2  # chunks em volta do jogador que já existem (e foram povoados)
+CHUNK_ACTIVE_RADIUS = 2  # chunks cujos inimigos são simulados; os demais ficam suspensos
+ITEM_SPAWN_RADIUS = 1  # itens e reforços das ondas surgem nestes chunks em volta do jogador
+CHUNK_SURFACE_CACHE = 32  # chãos de chunk pré-renderizados mantidos em cache (LRU)
+
+# Masmorra: salas e corredores gerados a cada partida sobre a grade de ladrilhos
+DUNGEON_ROOMS = 40  # salas tentadas (as que encostam em outras são descartadas)
+DUNGEON_ROOM_MIN = 5  # lado da sala, em ladrilhos
+DUNGEON_ROOM_MAX = 12
+DUNGEON_START_ROOM = 9  # lado da sala inicial, centrada no jogador
+DUNGEON_LOOPS = 8  # corredores extras, que criam caminhos alternativos
+CORRIDOR_WIDTH = 2
+# Alcance (em passos de ladrilho) do campo de fluxo que guia os inimigos até o jogador
+FLOW_FIELD_RADIUS = 160
 
 PLAYER_SPEED = 130  # pixels por segundo
 ENEMY_SPEED = 70
@@ -32,26 +78,133 @@ PLAYER_MAX_HEALTH = 5
 INVULNERABILITY_TIME = 1.0  # segundos após ser atingido
 
 # Configuração do inimigo
-ENEMY_COUNT = 6
+CHUNK_ENEMIES = 1  # inimigos gerados num chunk novo todo de chão (proporcional ao chão que ele tiver)
 ENEMY_MIN_PATROL = 60
 ENEMY_MAX_PATROL = 220
+ENEMY_PERCEPTION = 100  # raio em que o inimigo percebe o jogador
+ENEMY_CHASE_TIME = 2.0  # segundos de perseguição após perder o jogador de vista
+
+# Nível de detalhe da IA: inimigos longe do jogador são atualizados com menos
+# frequência (acumulando o dt). Até ENEMY_PERCEPTION + AI_LOD_NEAR_MARGIN todos
+# rodam a cada tick; a folga garante que nenhum inimigo entre no raio de
+# percepção entre duas atualizações. Além disso, cada faixa é
+# (distância máxima, intervalo em ticks).
+AI_LOD_ENABLED = True
+AI_LOD_NEAR_MARGIN = 60
+AI_LOD_TIERS = ((280, 2), (float("inf"), 4))
+AI_LOD_IDLE_INTERVAL = 8  # inimigos pausados fora da faixa próxima
+
+# Progressão das ondas
+START_ITEMS = 10  # itens no início da partida
+WAVE_ITEMS = 6  # itens gerados a cada onda concluída
+WAVE_NEW_ENEMIES = 2  # inimigos acrescentados a cada onda concluída
+WAVE_BONUS = 50  # pontos por onda concluída
+
+# Posicionamento de inimigos e itens novos (amostragem de Poisson-disk por tentativas), por tipo
+SPAWN_SEPARATION = {"item": 48, "enemy": 28}  # distância mínima até qualquer item ou inimigo
+SPAWN_PLAYER_CLEARANCE = {"item": 48, "enemy": 120}  # zona de exclusão em volta de cada jogador
+SPAWN_ATTEMPTS = 30  # sorteios por posição pedida: limita o pior caso quando falta espaço
+ITEM_SCORE = 10  # pontos por item
+
+# Teto de inimigos em jogo: passado dele, cada inimigo que uma onda deixaria de
+# criar acelera todos os inimigos em ENEMY_OVERFLOW_SPEEDUP (até ENEMY_MAX_SPEEDUP)
+ENEMY_CAP = 40
+ENEMY_OVERFLOW_SPEEDUP = 0.03
+ENEMY_MAX_SPEEDUP = 1.8
+
+# Bot roteirizado (simulação headless e ferramentas)
+BOT_DANGER_RADIUS = 130  # inimigos mais perto que isso repelem o bot
+BOT_STALL_TIME = 1.5  # segundos sem sair do lugar até o bot ignorar os inimigos e forçar passagem
+
+# Modo horda (requer NumPy): milhares de inimigos em arrays paralelos
+HORDE_SIZE = 5000
+HORDE_CAP = 2 * HORDE_SIZE  # teto próprio da horda, que já começa muito acima de ENEMY_CAP
+
+# Partículas (requer NumPy; sem ele os efeitos ficam desligados): efeito -> (quantidade, cor, velocidade, vida em s)
+PARTICLE_CAPACITY = 20_000
+PARTICLE_DRAG = 0.05  # fração da velocidade que sobra depois de 1 s
+PARTICLE_EFFECTS = {
+    "pickup": (24, (120, 220, 160), 110, 0.5),
+    "hit": (40, (230, 60, 60), 150, 0.6),
+    "wave": (200, (250, 215, 110), 260, 1.1),
+    "alert": (8, (240, 160, 60), 70, 0.35),
+}
+
+# Bits da máscara de entrada: o teclado, a simulação headless e entradas
+# roteirizadas/gravadas descrevem o movimento do jogador do mesmo jeito
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_UP = 4
+INPUT_DOWN = 8
+
+# Simulação em passo fixo: a lógica sempre avança em ticks de SIM_DT segundos,
+# não importa o dt que o PgZero entregar; o desenho interpola entre ticks
+SIM_HZ = 120
+SIM_DT = 1 / SIM_HZ
+MAX_FRAME_TIME = 0.25  # limita o atraso acumulado após um travamento longo
+
+# Snapshots do estado da simulação (F5 salva, F9 carrega; F6 liga o rollback, F7 volta ROLLBACK_SECONDS)
+QUICKSAVE_FILE = "quicksave.bin"
+ROLLBACK_FRAMES = 2 * SIM_HZ  # ticks guardados no buffer circular de rollback
+ROLLBACK_SECONDS = 1.0
+
+# Replays: as partidas jogadas (fora do modo horda) são gravadas em REPLAY_DIR ao terminar.
+# Assistindo um: ←/→ voltam/avançam REPLAY_SEEK_SECONDS, +/- mudam a velocidade, ESC sai
+REPLAY_RECORD = True
+REPLAY_DIR = "replays"
+REPLAY_KEYFRAME_SECONDS = 5.0  # intervalo entre keyframes: limita o que seek() precisa simular
+REPLAY_SEEK_SECONDS = 10.0
+REPLAY_SPEEDS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+REPLAY_ENV = "CRYPT_REPLAY"  # caminho de um replay para passar assim que o jogo abre
 
 # UI / Menu
 MENU_BG_COLOR = (18, 18, 24)
+TEXT_CACHE_SIZE = 64  # superfícies de texto mantidas em cache (LRU)
+# Acima deste número de retângulos sujos um frame completo sai mais barato
+DIRTY_RECT_LIMIT = 256
+
+# Profiler de frames (F2 mostra o overlay, F4 grava CSV)
+PROFILER_WINDOW = 300  # frames usados nos percentis móveis
+PROFILER_OVERLAY_REFRESH = 0.5  # segundos entre atualizações do texto do overlay
+PROFILER_CSV = "profile.csv"
+
+# Qualidade adaptativa (F8 liga/desliga): cada nível acima de 0 abre mão de mais um detalhe do desenho
+QUALITY_AUTO = True
+QUALITY_LEVELS = ("completa", "itens parados", "animação reduzida", "sprites simples", "só perto")
+QUALITY_STATIC_ITEMS = 1  # itens sem o pulso (sin) do raio
+QUALITY_SLOW_ANIMATION = 2  # inimigos sem interpolação e com uma só pose, a meia velocidade
+QUALITY_FLAT_SPRITES = 3  # inimigos como um retângulo em vez do sprite
+QUALITY_NEAR_ONLY = 4  # só os inimigos a até QUALITY_NEAR_RADIUS do jogador são desenhados
+QUALITY_NEAR_RADIUS = 320
+QUALITY_PARTICLES = (1.0, 0.5, 0.25, 0.25, 0.1)  # fração de PARTICLE_CAPACITY liberada em cada nível
+QUALITY_BUDGET_MS = 16.6  # orçamento de trabalho (update + draw) por frame
+QUALITY_WINDOW = 30  # frames por medição
+QUALITY_DOWN_RATIO = 0.85  # média acima desta fração do orçamento: baixa um nível na hora
+QUALITY_UP_RATIO = 0.5  # abaixo desta fração por QUALITY_UP_WINDOWS medições seguidas: sobe um nível
+QUALITY_UP_WINDOWS = 4
 
 # Cores (RGB)
 COLOR_BG = (20, 20, 30)
 COLOR_WALL = (40, 40, 60)
 COLOR_FLOOR = (28, 28, 38)
+COLOR_FLOOR_ALT = (24, 24, 34)
 COLOR_TEXT = (230, 230, 230)
 COLOR_HIGHLIGHT = (100, 160, 255)
 COLOR_PLAYER = (200, 200, 70)
+COLOR_ENEMY = (200, 100, 100)
+COLOR_ENEMY_ALERT = (240, 80, 60)
 
 # Nomes dos arquivos de áudio (coloque seus arquivos nos locais corretos)
 BGM_FILENAME = "bg_loop"  # nome do arquivo sem extensão na pasta music/
 SOUND_HIT = "hit"
 SOUND_PICKUP = "pickup"
 SOUND_CLICK = "menu_click"
+MUSIC_DIR = "music"
+SOUNDS_DIR = "sounds"
+MUSIC_VOLUME = 0.6
+
+# Com esta variável de ambiente o jogo mede o tempo até o primeiro frame e sai (usado por benchmarks)
+STARTUP_EXIT_ENV = "CRYPT_STARTUP_EXIT"
 
 # ----------------------------
 # ESTADO DO JOGO
@@ -59,10 +212,30 @@ SOUND_CLICK = "menu_click"
 # modo: "menu", "playing" (jogando), "gameover" (fim de jogo), "quit" (sair)
 mode = "menu"
 music_enabled = True
+# Quando True o jogo roda sem janela (step_many): sem áudio e sem desenho
+headless = False
+# Renderização por retângulos sujos (opcional, F3 alterna): só o que mudou é redesenhado e apresentado
+dirty_rendering = False
 
 # Pontuação e nível
 player_score = 0
 level_time = 0.0
+waves_cleared = 0
+# Multiplicador da velocidade dos inimigos; sobe quando as ondas batem no teto de inimigos
+enemy_speed_scale = 1.0
+
+# Tempo (s) da importação até o primeiro frame apresentado; None até lá
+startup_time = None
+frames_drawn = 0
+
+# Passo fixo: tempo real ainda não simulado e fração entre o último tick e o próximo
+sim_accumulator = 0.0
+render_alpha = 1.0
+
+# Gerador aleatório da sessão: toda a aleatoriedade da partida sai daqui, então
+# a mesma semente com as mesmas entradas reproduz exatamente o mesmo estado
+session_seed = None
+rng = random.Random()
 
 # ----------------------------
 # UTILITÁRIOS AUXILIARES
@@ -84,24 +257,793 @@ def distance(a, b):
     return math.hypot(dx, dy)
 
 
+def read_keyboard_input():
+    """Lê o teclado do PgZero e devolve a máscara de entrada (INPUT_*) do frame."""
+    inputs = 0
+    if keyboard.left or keyboard.a:
+        inputs |= INPUT_LEFT
+    if keyboard.right or keyboard.d:
+        inputs |= INPUT_RIGHT
+    if keyboard.up or keyboard.w:
+        inputs |= INPUT_UP
+    if keyboard.down or keyboard.s:
+        inputs |= INPUT_DOWN
+    return inputs
+
+
+# ----------------------------
+# LOTE DE COMANDOS DE DESENHO
+# ----------------------------
+class DrawBatch:
+    """Comandos de desenho do frame, agrupados por tipo e cor e enviados à Surface em lotes.
+
+    O código de desenho só enfileira primitivas (sem o wrapper do screen.draw,
+    a conversão de cor e o Rect novo de cada chamada); flush() desenha as
+    camadas na ordem fixa retângulos cheios, círculos, contornos e por fim
+    todas as cópias de superfície (sprites e textos) num único Surface.blits.
+    Dentro de uma camada a ordem entre cores não é garantida, então quem
+    precisa desenhar por cima de outra coisa chama flush() antes.
+    """
+
+    __slots__ = ("fills", "circles", "outlines", "blit_list", "submitted", "calls",
+                 "last_submitted", "last_calls")
+
+    def __init__(self):
+        self.fills = {}  # cor -> [Rect ou tupla (x, y, w, h)]
+        self.circles = {}  # cor -> [(centro, raio)]
+        self.outlines = {}  # cor -> [retângulo]
+        self.blit_list = []  # (superfície, posição)
+        self.submitted = 0  # primitivas enfileiradas no frame
+        self.calls = 0  # chamadas ao pygame feitas pelos flush() do frame
+        self.last_submitted = 0  # contadores do último frame completo
+        self.last_calls = 0
+
+    def fill(self, rect, color):
+        self.submitted += 1
+        group = self.fills.get(color)
+        if group is None:
+            self.fills[color] = [rect]
+        else:
+            group.append(rect)
+
+    def circle(self, center, radius, color):
+        self.submitted += 1
+        group = self.circles.get(color)
+        if group is None:
+            self.circles[color] = [(center, radius)]
+        else:
+            group.append((center, radius))
+
+    def outline(self, rect, color):
+        self.submitted += 1
+        group = self.outlines.get(color)
+        if group is None:
+            self.outlines[color] = [rect]
+        else:
+            group.append(rect)
+
+    def blit(self, surf, pos):
+        self.submitted += 1
+        self.blit_list.append((surf, pos))
+
+    def blits(self, pairs):
+        """Enfileira vários (superfície, posição) de uma vez (sprites)."""
+        n = len(self.blit_list)
+        self.blit_list.extend(pairs)
+        self.submitted += len(self.blit_list) - n
+
+    def flush(self, surf=None):
+        """Desenha tudo o que está na fila em surf (padrão: a tela) e esvazia a fila."""
+        if surf is None:
+            surf = screen.surface
+        calls = 0
+        if self.fills:
+            fill = surf.fill
+            for color, rects in self.fills.items():
+                for rect in rects:
+                    fill(color, rect)
+                calls += len(rects)
+            self.fills.clear()
+        if self.circles:
+            circle = pygame.draw.circle
+            for color, shapes in self.circles.items():
+                for center, radius in shapes:
+                    circle(surf, color, center, radius)
+                calls += len(shapes)
+            self.circles.clear()
+        if self.outlines:
+            rect_outline = pygame.draw.rect
+            for color, rects in self.outlines.items():
+                for rect in rects:
+                    rect_outline(surf, color, rect, 1)
+                calls += len(rects)
+            self.outlines.clear()
+        if self.blit_list:
+            surf.blits(self.blit_list, False)
+            self.blit_list.clear()
+            calls += 1
+        self.calls += calls
+
+    def end_frame(self):
+        """Desenha o que sobrou na fila e fecha os contadores do frame."""
+        self.flush()
+        self.last_submitted = self.submitted
+        self.last_calls = self.calls
+        self.submitted = 0
+        self.calls = 0
+
+
+render = DrawBatch()
+
+
+# ----------------------------
+# CACHE DE TEXTO
+# ----------------------------
+class TextCache:
+    """Cache LRU das superfícies de texto renderizadas pelo ptext do PgZero.
+
+    A chave é (texto, tamanho, cor, contorno, alinhamento); enquanto o texto
+    não muda, desenhar é só um blit. Conta acertos e falhas para instrumentação.
+    """
+
+    def __init__(self, capacity=TEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def get(self, text, fontsize, color, owidth, align):
+        key = (text, fontsize, color, owidth, align)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surf
+        self.misses += 1
+        surf = ptext.getsurf(text, fontsize=fontsize, color=color, owidth=owidth,
+                             align=align, cache=False)
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surf
+
+    def clear(self):
+        self.surfaces.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+text_cache = TextCache()
+
+
+def draw_text(text, pos=None, center=None, fontsize=None, color=None, owidth=None, align=None):
+    """Substituto de screen.draw.text que reaproveita a superfície do text_cache.
+
+    Posiciona o texto como o ptext: pos é o canto superior esquerdo e center
+    o centro da superfície.
+    """
+    if center is not None:
+        (x, y), hanchor, vanchor = center, 0.5, 0.5
+    else:
+        (x, y), hanchor, vanchor = pos, 0, 0
+    if align is None:
+        align = hanchor
+    surf = text_cache.get(text, fontsize, color, owidth, align)
+    w, h = surf.get_size()
+    render.blit(surf, (int(round(x - hanchor * w)), int(round(y - vanchor * h))))
+
+
+# O texto da pontuação só é formatado de novo quando a pontuação muda
+_score_text = (None, "")
+
+
+def score_text(score):
+    """Retorna "Score: N", reaproveitando a string enquanto a pontuação for a mesma."""
+    global _score_text
+    if _score_text[0] != score:
+        _score_text = (score, f"Score: {score}")
+    return _score_text[1]
+
+
+# ----------------------------
+# PROFILER DE FRAMES
+# ----------------------------
+class FrameProfiler:
+    """Mede o tempo de cada fase do loop, com percentis móveis, overlay e exportação CSV.
+
+    As fases são acumuladas com lap() durante o frame (vários ticks de
+    simulação somam na mesma fase) e fechadas em end_frame(). Desligado,
+    o custo é um teste de booleano por fase.
+    """
+
+    PHASES = ("player", "items", "enemies", "collisions", "waves", "snapshot",
+              "draw_map", "draw_entities", "draw_hud")
+
+    def __init__(self, window=PROFILER_WINDOW):
+        self.enabled = False
+        self.overlay = False
+        self.history = {name: deque(maxlen=window) for name in self.PHASES + ("frame",)}
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        self.frames = 0
+        self.last_frame_end = None
+        self.csv_file = None
+        self.csv_writer = None
+        self.overlay_lines = []
+        self.overlay_refreshed = 0.0
+
+    def lap(self, phase, start):
+        """Soma à fase o tempo desde start e devolve o instante atual (início da próxima fase)."""
+        now = time.perf_counter()
+        self.current[phase] += now - start
+        return now
+
+    def end_frame(self):
+        now = time.perf_counter()
+        frame = now - self.last_frame_end if self.last_frame_end is not None else 0.0
+        self.last_frame_end = now
+        current = self.current
+        for name in self.PHASES:
+            self.history[name].append(current[name])
+        self.history["frame"].append(frame)
+        if self.csv_writer is not None:
+            self.csv_writer.writerow([self.frames, mode] + [f"{current[name] * 1000:.4f}" for name in self.PHASES]
+                                     + [f"{frame * 1000:.4f}", render.last_submitted, render.last_calls,
+                                        governor.level])
+        for name in self.PHASES:
+            current[name] = 0.0
+        self.frames += 1
+
+    def percentiles(self, phase):
+        """(p50, p95, p99) da fase em milissegundos, na janela móvel."""
+        values = sorted(self.history[phase])
+        if not values:
+            return (0.0, 0.0, 0.0)
+        last = len(values) - 1
+        return tuple(values[int(round(q * last))] * 1000 for q in (0.50, 0.95, 0.99))
+
+    def start_csv(self, path=PROFILER_CSV):
+        """Começa a gravar um registro por frame em path (sobrescreve)."""
+        self.stop_csv()
+        self.enabled = True
+        self.csv_file = open(path, "w", newline="")
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(["frame", "mode"] + [f"{name}_ms" for name in self.PHASES]
+                                 + ["frame_ms", "draw_commands", "draw_calls", "quality"])
+        print(f"Profiler: gravando {path}")
+
+    def stop_csv(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+            print(f"Profiler: {self.csv_file.name} fechado")
+        self.csv_file = None
+        self.csv_writer = None
+
+    def overlay_text(self):
+        """Linhas do overlay, recalculadas no máximo a cada PROFILER_OVERLAY_REFRESH segundos."""
+        now = time.perf_counter()
+        if now - self.overlay_refreshed >= PROFILER_OVERLAY_REFRESH:
+            self.overlay_refreshed = now
+            self.overlay_lines = ["fase            p50    p95    p99 (ms)"] + [
+                f"{name:<13} {p50:6.2f} {p95:6.2f} {p99:6.2f}"
+                for name in self.PHASES + ("frame",)
+                for p50, p95, p99 in (self.percentiles(name),)
+            ] + [f"desenho: {render.last_submitted} comandos, {render.last_calls} chamadas"]
+            self.overlay_lines += particle_status_text() + governor.status_text()
+        return self.overlay_lines
+
+
+profiler = FrameProfiler()
+
+
+def particle_status_text():
+    """Partículas vivas, o teto atual e as descartadas por falta de espaço (para o overlay)."""
+    if particles is None:
+        return []
+    return [f"partículas: {particles.count}/{particles.limit}, {particles.dropped} descartadas"]
+
+
+def draw_profiler_overlay():
+    """Desenha a tabela de percentis do profiler no canto inferior direito."""
+    lines = profiler.overlay_text()
+    top = HEIGHT - 40 - 14 * len(lines)
+    render.fill((WIDTH - 300, top - 6, 292, 14 * len(lines) + 12), (10, 10, 14))
+    for i, line in enumerate(lines):
+        draw_text(line, (WIDTH - 292, top + i * 14), fontsize=14, color=(150, 220, 150))
+
+
+# ----------------------------
+# QUALIDADE ADAPTATIVA
+# ----------------------------
+class QualityGovernor:
+    """Sobe e desce o nível de qualidade do desenho conforme o tempo de trabalho por frame.
+
+    O trabalho do frame vai do início de update() ao fim de draw() (a espera
+    pelo vsync do PgZero não conta). A cada QUALITY_WINDOW frames a média é
+    comparada com o orçamento: acima de QUALITY_DOWN_RATIO dele a qualidade
+    desce um nível na hora; para subir, a média precisa ficar abaixo de
+    QUALITY_UP_RATIO por QUALITY_UP_WINDOWS medições seguidas (histerese).
+    Os níveis só mudam o desenho, nunca a simulação.
+    """
+
+    def __init__(self, budget_ms=QUALITY_BUDGET_MS, window=QUALITY_WINDOW):
+        self.enabled = QUALITY_AUTO
+        self.budget = budget_ms / 1000
+        self.window = window
+        self.level = 0
+        self.frame_start = None
+        self.work = 0.0  # trabalho somado na medição em andamento
+        self.frames = 0
+        self.calm_windows = 0
+        self.last_mean = 0.0  # média da última medição, em segundos
+        self.last_end = None
+        self.time_at_level = [0.0] * len(QUALITY_LEVELS)  # segundos de relógio passados em cada nível
+        self.changes = 0
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """Fecha o frame; a cada QUALITY_WINDOW frames decide se o nível muda."""
+        now = time.perf_counter()
+        if self.last_end is not None:
+            self.time_at_level[self.level] += now - self.last_end
+        self.last_end = now
+        if self.frame_start is None:
+            return
+        self.work += now - self.frame_start
+        self.frame_start = None
+        self.frames += 1
+        if self.frames < self.window:
+            return
+        mean = self.last_mean = self.work / self.frames
+        self.work = 0.0
+        self.frames = 0
+        if not self.enabled:
+            return
+        if mean > self.budget * QUALITY_DOWN_RATIO:
+            self.calm_windows = 0
+            if self.level < len(QUALITY_LEVELS) - 1:
+                self.set_level(self.level + 1)
+        elif mean < self.budget * QUALITY_UP_RATIO and self.level > 0:
+            self.calm_windows += 1
+            if self.calm_windows >= QUALITY_UP_WINDOWS:
+                self.set_level(self.level - 1)
+        else:
+            self.calm_windows = 0
+
+    def set_level(self, level):
+        if level != self.level:
+            self.changes += 1
+        self.level = level
+        self.calm_windows = 0
+        if particles is not None:
+            particles.limit = int(particles.capacity * QUALITY_PARTICLES[level])
+        dirty_renderer.invalidate()
+
+    def toggle(self):
+        """Liga/desliga o ajuste automático; desligado, volta à qualidade completa."""
+        self.enabled = not self.enabled
+        if not self.enabled:
+            self.set_level(0)
+        return self.enabled
+
+    def status_text(self):
+        """Nível atual e o tempo passado em cada nível (para o overlay do profiler)."""
+        spent = "  ".join(f"{i}:{t:.0f}s" for i, t in enumerate(self.time_at_level))
+        auto = "auto" if self.enabled else "fixa"
+        return [f"qualidade {self.level} ({QUALITY_LEVELS[self.level]}, {auto}) "
+                f"{self.last_mean * 1000:.1f}/{self.budget * 1000:.1f} ms",
+                f"  {spent}"]
+
+
+governor = QualityGovernor()
+
+
+# ----------------------------
+# GRADE ESPACIAL (BROADPHASE DE COLISÕES)
+# ----------------------------
+class SpatialHash:
+    """Grade uniforme que indexa entidades pelas células que seu retângulo ocupa.
+
+    É mantida incrementalmente: move() só mexe nas células quando a entidade
+    muda de célula, e query() olha apenas as células próximas do retângulo
+    consultado em vez de percorrer todas as entidades.
+    """
+
+    def __init__(self, cell_size=TILE_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # (coluna, linha) -> dict usado como conjunto ordenado
+        self.spans = {}  # entidade -> (col0, lin0, col1, lin1) ocupadas
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __contains__(self, obj):
+        return obj in self.spans
+
+    def span(self, rect: Rect):
+        """Intervalo de células (inclusivo) coberto por rect."""
+        cs = self.cell_size
+        return (rect.left // cs, rect.top // cs,
+                (rect.right - 1) // cs, (rect.bottom - 1) // cs)
+
+    def _add_cells(self, obj, span):
+        c0, r0, c1, r1 = span
+        cells = self.cells
+        for c in range(c0, c1 + 1):
+            for r in range(r0, r1 + 1):
+                bucket = cells.get((c, r))
+                if bucket is None:
+                    bucket = cells[(c, r)] = {}
+                bucket[obj] = None
+
+    def _remove_cells(self, obj, span):
+        c0, r0, c1, r1 = span
+        cells = self.cells
+        for c in range(c0, c1 + 1):
+            for r in range(r0, r1 + 1):
+                bucket = cells[(c, r)]
+                del bucket[obj]
+                if not bucket:
+                    del cells[(c, r)]
+
+    def insert(self, obj, rect: Rect):
+        if obj in self.spans:
+            self.move(obj, rect)
+            return
+        span = self.span(rect)
+        self.spans[obj] = span
+        self._add_cells(obj, span)
+
+    def move(self, obj, rect: Rect):
+        """Atualiza a posição de obj; não faz nada se continuar nas mesmas células."""
+        span = self.span(rect)
+        old = self.spans[obj]
+        if span == old:
+            return
+        self._remove_cells(obj, old)
+        self._add_cells(obj, span)
+        self.spans[obj] = span
+
+    def remove(self, obj):
+        span = self.spans.pop(obj, None)
+        if span is not None:
+            self._remove_cells(obj, span)
+
+    def clear(self):
+        self.cells.clear()
+        self.spans.clear()
+
+    def query(self, rect: Rect):
+        """Entidades cujas células tocam rect (candidatas; confirme com rect_collide)."""
+        c0, r0, c1, r1 = self.span(rect)
+        cells = self.cells
+        found = {}
+        for c in range(c0, c1 + 1):
+            for r in range(r0, r1 + 1):
+                bucket = cells.get((c, r))
+                if bucket:
+                    found.update(bucket)
+        return list(found)
+
+
+# ----------------------------
+# POOL DE ENTIDADES
+# ----------------------------
+class EntityPool:
+    """Reaproveita instâncias de uma classe em vez de criar e descartar objetos a cada onda ou partida.
+
+    acquire() devolve uma instância livre reinicializada com reset(*args)
+    (ou cria uma nova, se não houver); release() a devolve ao pool.
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.free = []
+        self.created = 0
+        self.reused = 0
+
+    def __len__(self):
+        return len(self.free)
+
+    def acquire(self, *args):
+        if self.free:
+            obj = self.free.pop()
+            obj.reset(*args)
+            self.reused += 1
+            return obj
+        self.created += 1
+        return self.cls(*args)
+
+    def release(self, obj):
+        self.free.append(obj)
+
+    def release_all(self, objs):
+        self.free.extend(objs)
+
+
+# ----------------------------
+# MASMORRA (GRADE DE LADRILHOS) E CAMPO DE FLUXO
+# ----------------------------
+class Dungeon:
+    """Grade de ladrilhos do mundo: 1 = parede, 0 = chão.
+
+    generate() escava salas retangulares ligadas por corredores (uma árvore
+    a partir da sala inicial, mais alguns laços). A borda é sempre parede,
+    então vizinhos de um ladrilho de chão nunca saem da grade.
+    """
+
+    def __init__(self, cols=MAP_COLS, rows=MAP_ROWS):
+        self.cols = cols
+        self.rows = rows
+        self.tiles = bytearray(b"\x01") * (cols * rows)
+        self.rooms = []
+        self.version = 0  # muda a cada generate(), para refazer a camada de fundo
+        self.solid_array = None  # cópia NumPy (linhas x colunas) para a horda
+        self._packed = None  # tiles em bits, refeito quando a versão muda
+
+    def tile_at(self, x, y):
+        """(coluna, linha) do ladrilho que contém o ponto (x, y) do mundo."""
+        return (int(x // TILE_SIZE), int(y // TILE_SIZE))
+
+    def solid(self, col, row):
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return self.tiles[row * self.cols + col] == 1
+        return True
+
+    def box_free(self, x, y, half_w, half_h):
+        """True se a caixa centrada em (x, y) não toca nenhuma parede."""
+        c0, r0 = self.tile_at(x - half_w, y - half_h)
+        c1, r1 = self.tile_at(x + half_w - 0.01, y + half_h - 0.01)
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                if self.solid(c, r):
+                    return False
+        return True
+
+    def floor_tiles(self, area: Rect):
+        """Ladrilhos de chão cujo centro fica dentro de area (em pixels), linha por linha."""
+        t = TILE_SIZE
+        c0 = max(0, (area.left - t // 2 + t - 1) // t)
+        r0 = max(0, (area.top - t // 2 + t - 1) // t)
+        c1 = min(self.cols - 1, (area.right - t // 2) // t)
+        r1 = min(self.rows - 1, (area.bottom - t // 2) // t)
+        tiles = self.tiles
+        cols = self.cols
+        return [(c, r) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1) if not tiles[r * cols + c]]
+
+    def carve(self, rect: Rect):
+        """Transforma em chão os ladrilhos de rect (em ladrilhos), sem mexer na borda."""
+        cols = self.cols
+        for r in range(max(1, rect.top), min(self.rows - 1, rect.bottom)):
+            for c in range(max(1, rect.left), min(cols - 1, rect.right)):
+                self.tiles[r * cols + c] = 0
+
+    def carve_corridor(self, a, b):
+        """Corredor em L entre os ladrilhos a e b (horizontal ou vertical primeiro, ao acaso)."""
+        (ac, ar), (bc, br) = a, b
+        w = CORRIDOR_WIDTH
+        horizontal = Rect(min(ac, bc), 0, abs(ac - bc) + w, w)
+        vertical = Rect(0, min(ar, br), w, abs(ar - br) + w)
+        if rng.random() < 0.5:
+            horizontal.top = ar
+            vertical.left = bc
+        else:
+            vertical.left = ac
+            horizontal.top = br
+        self.carve(horizontal)
+        self.carve(vertical)
+
+    def generate(self, start):
+        """Gera uma masmorra nova com a sala inicial centrada no ladrilho start."""
+        self.tiles = bytearray(b"\x01") * (self.cols * self.rows)
+        size = DUNGEON_START_ROOM
+        rooms = [Rect(start[0] - size // 2, start[1] - size // 2, size, size)]
+        for _ in range(DUNGEON_ROOMS):
+            w = rng.randint(DUNGEON_ROOM_MIN, DUNGEON_ROOM_MAX)
+            h = rng.randint(DUNGEON_ROOM_MIN, DUNGEON_ROOM_MAX)
+            room = Rect(rng.randint(1, self.cols - w - 1), rng.randint(1, self.rows - h - 1), w, h)
+            # Mantém pelo menos um ladrilho de parede entre salas
+            if room.inflate(2, 2).collidelist(rooms) == -1:
+                rooms.append(room)
+        for room in rooms:
+            self.carve(room)
+
+        # Cada sala se liga à sala já conectada mais próxima: todas ficam alcançáveis
+        connected = [rooms[0]]
+        for room in sorted(rooms[1:], key=lambda r: distance(r.center, rooms[0].center)):
+            nearest = min(connected, key=lambda r: distance(r.center, room.center))
+            self.carve_corridor(nearest.center, room.center)
+            connected.append(room)
+        for _ in range(DUNGEON_LOOPS if len(rooms) > 2 else 0):
+            a, b = rng.sample(rooms, 2)
+            self.carve_corridor(a.center, b.center)
+
+        self.rooms = rooms
+        self.tiles_changed()
+
+    def tiles_changed(self):
+        """Avisa que tiles mudou: nova versão (refaz o fundo) e nova cópia NumPy."""
+        self.version += 1
+        self._packed = None
+        if np is not None:
+            self.solid_array = np.frombuffer(bytes(self.tiles), dtype=np.uint8).reshape(
+                self.rows, self.cols).astype(bool)
+
+    def packed(self):
+        """tiles com um bit por ladrilho (calculado uma vez por versão), para os snapshots."""
+        if self._packed is None:
+            n = len(self.tiles)
+            bits = self.tiles.translate(_TILE_TO_DIGIT)
+            self._packed = int(bits, 2).to_bytes((n + 7) // 8, "big")
+        return self._packed
+
+    def load_packed(self, data):
+        """Inverso de packed(); não faz nada se a grade já for a mesma."""
+        if data == self.packed():
+            return False
+        n = self.cols * self.rows
+        bits = format(int.from_bytes(data, "big"), "0%db" % n).encode()
+        self.tiles = bytearray(bits.translate(_DIGIT_TO_TILE))
+        self.rooms = []
+        self.tiles_changed()
+        return True
+
+
+_TILE_TO_DIGIT = bytes.maketrans(b"\x00\x01", b"01")
+_DIGIT_TO_TILE = bytes.maketrans(b"01", b"\x00\x01")
+
+
+def move_box(x, y, half_w, half_h, dx, dy):
+    """Move a caixa centrada em (x, y) por (dx, dy), um eixo de cada vez, parando encostada nas paredes.
+
+    Os passos são sempre menores que um ladrilho, então basta olhar a coluna
+    (ou linha) para onde a borda da caixa avança.
+    """
+    t = TILE_SIZE
+    solid = dungeon.solid
+    if dx:
+        nx = x + dx
+        r0 = int((y - half_h) // t)
+        r1 = int((y + half_h - 0.01) // t)
+        if dx > 0:
+            col = int((nx + half_w) // t)
+            if solid(col, r0) or solid(col, r1):
+                nx = col * t - half_w - 0.01
+        else:
+            col = int((nx - half_w) // t)
+            if solid(col, r0) or solid(col, r1):
+                nx = (col + 1) * t + half_w
+        x = nx
+    if dy:
+        ny = y + dy
+        c0 = int((x - half_w) // t)
+        c1 = int((x + half_w - 0.01) // t)
+        if dy > 0:
+            row = int((ny + half_h) // t)
+            if solid(c0, row) or solid(c1, row):
+                ny = row * t - half_h - 0.01
+        else:
+            row = int((ny - half_h) // t)
+            if solid(c0, row) or solid(c1, row):
+                ny = (row + 1) * t + half_h
+        y = ny
+    return x, y
+
+
+class FlowField:
+    """Campo de distâncias (BFS) a partir do ladrilho do jogador, compartilhado por todos os inimigos.
+
+    Só é recalculado quando o jogador muda de ladrilho. Para cada ladrilho
+    alcançado guarda o próximo ladrilho do caminho até o jogador (next), de
+    modo que cada inimigo descobre para onde andar com uma consulta, não
+    importa quantos inimigos estejam perseguindo. Diagonais só são usadas
+    quando os dois ladrilhos ortogonais vizinhos também são chão. Com vários
+    jogadores a BFS parte de todos ao mesmo tempo e o caminho leva ao mais
+    próximo.
+    """
+
+    def __init__(self, radius=FLOW_FIELD_RADIUS):
+        self.radius = radius
+        self.origin = None  # índices dos ladrilhos dos jogadores
+        self.dist = []
+        self.next = []
+        self.recomputes = 0
+        self._next_array = None
+
+    def reset(self):
+        self.origin = None
+        self.dist = []
+        self.next = []
+        self._next_array = None
+
+    def update(self, positions):
+        """Recalcula o campo se algum dos pontos (x, y) dos jogadores mudou de ladrilho."""
+        cols = dungeon.cols
+        origin = tuple(dict.fromkeys(int(y // TILE_SIZE) * cols + int(x // TILE_SIZE) for x, y in positions))
+        if origin != self.origin and origin:
+            self.recompute(origin)
+
+    def recompute(self, origin):
+        cols = dungeon.cols
+        tiles = dungeon.tiles
+        n = len(tiles)
+        dist = [-1] * n
+        nxt = [-1] * n
+        for i in origin:
+            dist[i] = 0
+            nxt[i] = i
+        radius = self.radius
+        steps = ((1, 0), (-1, 0), (cols, 0), (-cols, 0),
+                 (1 + cols, (1, cols)), (1 - cols, (1, -cols)),
+                 (-1 + cols, (-1, cols)), (-1 - cols, (-1, -cols)))
+        queue = deque(origin)
+        while queue:
+            i = queue.popleft()
+            d = dist[i] + 1
+            if d > radius:
+                continue
+            for step, corners in steps:
+                j = i + step
+                if dist[j] != -1 or tiles[j]:
+                    continue
+                if corners and (tiles[i + corners[0]] or tiles[i + corners[1]]):
+                    continue
+                dist[j] = d
+                nxt[j] = i
+                queue.append(j)
+        self.origin = origin
+        self.dist = dist
+        self.next = nxt
+        self._next_array = None
+        self.recomputes += 1
+
+    def next_step(self, x, y):
+        """Centro do próximo ladrilho rumo ao jogador, ou None (mesmo ladrilho ou fora do alcance)."""
+        if self.origin is None:
+            return None
+        col, row = dungeon.tile_at(x, y)
+        i = row * dungeon.cols + col
+        j = self.next[i] if 0 <= i < len(self.next) else -1
+        if j < 0 or j == i:
+            return None
+        half = TILE_SIZE / 2
+        return ((j % dungeon.cols) * TILE_SIZE + half, (j // dungeon.cols) * TILE_SIZE + half)
+
+    def next_array(self):
+        """next como array NumPy (criado uma vez por recálculo, para a horda)."""
+        if self._next_array is None:
+            self._next_array = np.asarray(self.next, dtype=np.int64)
+        return self._next_array
+
+
+dungeon = Dungeon()
+flow_field = FlowField()
+
+
 # ----------------------------
 # CLASSE BOTÃO DA UI
 # ----------------------------
 class Button:
     """Botão clicável usado nos menus."""
 
+    __slots__ = ("text", "rect", "hovered")
+
     def __init__(self, text, x, y, w, h):
         self.text = text
         self.rect = Rect(x, y, w, h)
         self.hovered = False
 
     def draw(self):
-        screen.draw.filled_rect(self.rect, (40, 44, 52) if not self.hovered else (60, 90, 140))
-        screen.draw.rect(self.rect, (180, 180, 180))
+        render.fill(self.rect, (40, 44, 52) if not self.hovered else (60, 90, 140))
+        render.outline(self.rect, (180, 180, 180))
         # Calcula a posição do texto para centralização
         text_x = self.rect.x + self.rect.width // 2
         text_y = self.rect.y + self.rect.height // 2
-        screen.draw.text(
+        draw_text(
             self.text,
             (text_x, text_y),
             color=COLOR_TEXT,
@@ -116,17 +1058,136 @@ class Button:
         return self.rect.collidepoint(mouse_pos)
 
 
+# ----------------------------
+# ATLAS DE SPRITES (POSES PRÉ-RENDERIZADAS)
+# ----------------------------
+# Jogador e inimigos continuam desenhados proceduralmente, mas cada pose
+# distinta (frame, piscar, alerta, olho) é renderizada uma única vez numa
+# Surface e depois só copiada para a tela.
+PLAYER_SPRITE_SIZE = (32, 48)
+PLAYER_SPRITE_ORIGIN = (16, 26)  # posição do centro do jogador dentro da Surface
+ENEMY_SPRITE_SIZE = (28, 32)
+ENEMY_SPRITE_ORIGIN = (14, 14)
+
+
+def render_player_pose(leg_frame, flash, eye_dx, eye_dy):
+    """Desenha o jogador como um corpo pequeno + "pés/cabeça" animados dependendo do frame."""
+    surf = pygame.Surface(PLAYER_SPRITE_SIZE, pygame.SRCALPHA)
+    cx, cy = PLAYER_SPRITE_ORIGIN
+
+    # Corpo
+    body_w = 18
+    body_h = 20
+    body_color = COLOR_PLAYER if not flash else (255, 255, 255)
+    pygame.draw.rect(surf, body_color, Rect(cx - body_w // 2, cy - body_h // 2, body_w, body_h))
+
+    # Cabeça (círculo pequeno)
+    head_pos = (cx, cy - body_h // 2 - 6)
+    pygame.draw.circle(surf, (220, 160, 100) if not flash else (255, 255, 255), head_pos, 7)
+
+    # Animação simples de "pernas" do sprite: dois retângulos que se deslocam
+    leg_offset = leg_frame * 4 - 2  # -2 ou 2
+    pygame.draw.rect(surf, (150, 90, 40), Rect(cx - 6 + leg_offset, cy + 10, 6, 10))
+    pygame.draw.rect(surf, (150, 90, 40), Rect(cx + 0 - leg_offset, cy + 10, 6, 10))
+
+    # Olho direcional para indicar para onde está virado
+    pygame.draw.circle(surf, (10, 10, 10), (cx + eye_dx, cy - body_h // 2 - 6 + eye_dy), 2)
+    return surf
+
+
+def render_enemy_pose(frame, is_alert):
+    """Desenha o inimigo como um corpo colorido com "barbatanas" ou pernas que se animam."""
+    surf = pygame.Surface(ENEMY_SPRITE_SIZE, pygame.SRCALPHA)
+    cx, cy = ENEMY_SPRITE_ORIGIN
+    # A cor do corpo muda se estiver em alerta
+    base_color = COLOR_ENEMY if not is_alert else COLOR_ENEMY_ALERT
+    pygame.draw.rect(surf, base_color, Rect(cx - 10, cy - 12, 20, 22))
+
+    # Olho que olha em direção ao jogador se estiver em alerta
+    pygame.draw.circle(surf, (20, 20, 20), (cx + (frame - 1) * 1, cy - 6), 3)
+
+    # Animação simples de barbatana/perna
+    fin_offset = (frame % 2) * 3 - 1
+    pygame.draw.rect(surf, (120, 70, 40), Rect(cx - 12, cy + 6 + fin_offset, 6, 8))
+    pygame.draw.rect(surf, (120, 70, 40), Rect(cx + 6, cy + 6 - fin_offset, 6, 8))
+    return surf
+
+
+class SpriteAtlas:
+    """Cache de poses: renderiza cada pose na primeira vez que é pedida e a reaproveita depois."""
+
+    def __init__(self):
+        self.poses = {}
+
+    def __len__(self):
+        return len(self.poses)
+
+    def _store(self, key, surf):
+        # Converte para o formato da tela (quando já existe) para acelerar o blit
+        if pygame.display.get_surface() is not None:
+            surf = surf.convert_alpha()
+        self.poses[key] = surf
+        return surf
+
+    def player(self, leg_frame, flash, eye_dx, eye_dy):
+        key = ("player", leg_frame, flash, eye_dx, eye_dy)
+        surf = self.poses.get(key)
+        if surf is None:
+            surf = self._store(key, render_player_pose(leg_frame, flash, eye_dx, eye_dy))
+        return surf
+
+    def enemy(self, frame, is_alert):
+        key = ("enemy", frame, is_alert)
+        surf = self.poses.get(key)
+        if surf is None:
+            surf = self._store(key, render_enemy_pose(frame, is_alert))
+        return surf
+
+    def enemy_flat(self, is_alert):
+        """Só o corpo do inimigo, opaco: o blit mais barato, usado em qualidade reduzida."""
+        key = ("enemy_flat", is_alert)
+        surf = self.poses.get(key)
+        if surf is None:
+            surf = pygame.Surface((20, 22))
+            surf.fill(COLOR_ENEMY_ALERT if is_alert else COLOR_ENEMY)
+            if pygame.display.get_surface() is not None:
+                surf = surf.convert()
+            # Com colorkey (que nunca aparece) e RLEACCEL o SDL copia as linhas direto: ~5x mais rápido que o sprite
+            surf.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+            self.poses[key] = surf
+        return surf
+
+    def clear(self):
+        self.poses.clear()
+
+
+sprites = SpriteAtlas()
+
+
 # ----------------------------
 # CLASSE DO JOGADOR
 # ----------------------------
 class Player:
     """Jogador com visão de cima. Animação controlada pelo índice do frame e desenho procedural."""
 
+    __slots__ = ("x", "y", "prev_x", "prev_y", "width", "height", "health", "score", "speed",
+                 "direction", "frame_timer", "frame", "idle_timer", "invulnerable_until")
+
+    # Um só Rect para todos os jogadores (todos têm o tamanho de __init__): rect() o reposiciona, sem alocar
+    _scratch = Rect(0, 0, 22, 28)
+
     def __init__(self, x, y):
-        self.x = float(x)
-        self.y = float(y)
         self.width = 22
         self.height = 28
+        self.reset(x, y)
+
+    def reset(self, x, y):
+        """(Re)inicializa o jogador em (x, y); uma nova partida reaproveita o mesmo objeto."""
+        self.x = float(x)
+        self.y = float(y)
+        # Posição no tick anterior, para interpolar o desenho
+        self.prev_x = self.x
+        self.prev_y = self.y
         self.health = PLAYER_MAX_HEALTH
         self.score = 0
         self.speed = PLAYER_SPEED
@@ -137,7 +1198,11 @@ class Player:
         self.invulnerable_until = 0.0
 
     def rect(self):
-        return Rect(int(self.x - self.width / 2), int(self.y - self.height / 2), self.width, self.height)
+        """Retângulo de colisão: o Rect de rascunho da classe, válido até a próxima chamada."""
+        r = Player._scratch
+        r.x = int(self.x - self.width / 2)
+        r.y = int(self.y - self.height / 2)
+        return r
 
     def take_damage(self, amount, now):
         if now < self.invulnerable_until:
@@ -145,19 +1210,25 @@ class Player:
         self.health -= amount
         self.invulnerable_until = now + INVULNERABILITY_TIME
         safe_play_sound(SOUND_HIT)
+        spawn_burst(self.x, self.y, "hit")
         return True
 
-    def update(self, dt):
+    def update(self, dt, inputs=None):
+        """Move e anima o jogador; inputs é uma máscara INPUT_* (None lê o teclado)."""
+        if inputs is None:
+            inputs = read_keyboard_input()
+        self.prev_x = self.x
+        self.prev_y = self.y
         # Entrada de movimento
         dx = 0
         dy = 0
-        if keyboard.left or keyboard.a:
+        if inputs & INPUT_LEFT:
             dx -= 1
-        if keyboard.right or keyboard.d:
+        if inputs & INPUT_RIGHT:
             dx += 1
-        if keyboard.up or keyboard.w:
+        if inputs & INPUT_UP:
             dy -= 1
-        if keyboard.down or keyboard.s:
+        if inputs & INPUT_DOWN:
             dy += 1
 
         moving = dx != 0 or dy != 0
@@ -170,9 +1241,9 @@ class Player:
             else:
                 nx = 0
                 ny = 0
-            # Aplica o movimento
-            self.x += nx * self.speed * dt
-            self.y += ny * self.speed * dt
+            # Aplica o movimento, deslizando ao longo das paredes
+            self.x, self.y = move_box(self.x, self.y, self.width / 2, self.height / 2,
+                                      nx * self.speed * dt, ny * self.speed * dt)
             self.direction = (nx, ny)
             self.frame_timer += dt
             self.idle_timer = 0.0
@@ -186,46 +1257,29 @@ class Player:
             self.frame_timer = 0.0
             self.frame = (self.frame + 1) % 4
 
-        # Mantém o jogador dentro dos limites da tela (simples)
-        self.x = clamp(self.x, self.width / 2 + 2, WIDTH - self.width / 2 - 2)
-        self.y = clamp(self.y, self.height / 2 + 2, HEIGHT - self.height / 2 - 2)
+        # Mantém o jogador dentro dos limites do mundo (simples)
+        self.x = clamp(self.x, self.width / 2 + 2, WORLD_WIDTH - self.width / 2 - 2)
+        self.y = clamp(self.y, self.height / 2 + 2, WORLD_HEIGHT - self.height / 2 - 2)
 
     def draw(self, now):
-        # Desenha o jogador como um corpo pequeno + "pés/cabeça" animados dependendo do frame
-        center = (int(self.x), int(self.y))
-
-        # Corpo
-        body_w = 18
-        body_h = 20
-        body_rect = Rect(center[0] - body_w // 2, center[1] - body_h // 2, body_w, body_h)
-
         # Pisca durante a invulnerabilidade
         flash = False
         if now < self.invulnerable_until:
             # Pisca a cada 0.12s
             flash = int(now * 8) % 2 == 0
 
-        body_color = COLOR_PLAYER if not flash else (255, 255, 255)
-        screen.draw.filled_rect(body_rect, body_color)
-
-        # Cabeça (círculo pequeno)
-        head_pos = (center[0], center[1] - body_h // 2 - 6)
-        screen.draw.filled_circle(head_pos, 7, (220, 160, 100) if not flash else (255, 255, 255))
-
-        # Animação simples de "pernas" do sprite: desenha dois retângulos que se deslocam
-        leg_offset = (self.frame % 2) * 4 - 2  # -2 ou 2
-        # Desenha perna esquerda
-        l_leg = Rect(center[0] - 6 + leg_offset, center[1] + 10, 6, 10)
-        # Desenha perna direita
-        r_leg = Rect(center[0] + 0 - leg_offset, center[1] + 10, 6, 10)
-        screen.draw.filled_rect(l_leg, (150, 90, 40))
-        screen.draw.filled_rect(r_leg, (150, 90, 40))
-
         # Olho direcional para indicar para onde está virado
         dx, dy = self.direction
-        eye_x = center[0] + int(dx * 6)
-        eye_y = center[1] - body_h // 2 - 6 + int(dy * 6)
-        screen.draw.filled_circle((eye_x, eye_y), 2, (10, 10, 10))
+        surf = sprites.player(self.frame % 2, flash, int(dx * 6), int(dy * 6))
+        ox, oy = PLAYER_SPRITE_ORIGIN
+        x, y = self.render_pos()
+        render.blit(surf, (x - ox - camera.x, y - oy - camera.y))
+
+    def render_pos(self):
+        """Posição de desenho, interpolada entre o tick anterior e o atual."""
+        a = render_alpha
+        return (int(self.prev_x + (self.x - self.prev_x) * a),
+                int(self.prev_y + (self.y - self.prev_y) * a))
 
 
 # ----------------------------
@@ -234,53 +1288,101 @@ class Player:
 class Enemy:
     """Inimigo simples que patrulha em um retângulo de território. Animado proceduralmente."""
 
+    __slots__ = ("x", "y", "prev_x", "prev_y", "territory_center", "territory_radius", "speed",
+                 "width", "height", "frame", "frame_timer", "target", "pause_until", "is_alert",
+                 "chase_timeout", "ai_next_tick", "ai_dt")
+
+    # Rect de rascunho de rect(), do tamanho de todo inimigo: um Rect por inimigo custaria mais memória que o __slots__ economiza
+    _scratch = Rect(0, 0, 20, 26)
+
     def __init__(self, center_x, center_y, territory_radius):
+        self.width = 20
+        self.height = 26
+        self.reset(center_x, center_y, territory_radius)
+
+    def reset(self, center_x, center_y, territory_radius):
+        """(Re)inicializa o inimigo; usado também ao reaproveitá-lo do enemy_pool."""
         self.x = float(center_x)
         self.y = float(center_y)
+        # Posição no tick anterior, para interpolar o desenho
+        self.prev_x = self.x
+        self.prev_y = self.y
         self.territory_center = (center_x, center_y)
         self.territory_radius = territory_radius
-        self.speed = ENEMY_SPEED * (0.85 + random.random() * 0.4)
-        self.width = 20
-        self.height = 26
-        self.frame = random.randint(0, 3)
-        self.frame_timer = random.random() * 0.5
+        self.speed = ENEMY_SPEED * (0.85 + rng.random() * 0.4)
+        self.frame = rng.randint(0, 3)
+        self.frame_timer = rng.random() * 0.5
         # Escolhe um alvo de patrulha aleatório dentro do território
         self.target = self.random_point_in_territory()
         # Pequenos temporizadores de pausa para ociosidade/patrulha
         self.pause_until = 0.0
         self.is_alert = False  # quando está perseguindo o jogador
         self.chase_timeout = 0.0
+        # Agendamento da IA (AIScheduler): próximo tick de atualização e dt acumulado até lá
+        self.ai_next_tick = 0
+        self.ai_dt = 0.0
 
     def rect(self):
-        return Rect(int(self.x - self.width / 2), int(self.y - self.height / 2), self.width, self.height)
+        """Retângulo de colisão: o Rect de rascunho da classe, compartilhado
+        por todos os inimigos e válido só até a próxima chamada."""
+        r = Enemy._scratch
+        r.x = int(self.x - self.width / 2)
+        r.y = int(self.y - self.height / 2)
+        return r
 
     def random_point_in_territory(self):
-        angle = random.uniform(0, 2 * math.pi)
-        r = random.uniform(10, self.territory_radius)
-        tx = self.territory_center[0] + math.cos(angle) * r
-        ty = self.territory_center[1] + math.sin(angle) * r
-        return (tx, ty)
+        """Ponto de patrulha sorteado no território, sobre o chão (senão, o próprio centro)."""
+        cx, cy = self.territory_center
+        for _ in range(8):
+            angle = rng.uniform(0, 2 * math.pi)
+            r = rng.uniform(10, self.territory_radius)
+            tx = cx + math.cos(angle) * r
+            ty = cy + math.sin(angle) * r
+            if not dungeon.solid(*dungeon.tile_at(tx, ty)):
+                return (tx, ty)
+        return (cx, cy)
+
+    def move(self, dx, dy):
+        """Anda (dx, dy) respeitando as paredes; retorna a distância realmente percorrida."""
+        x, y = move_box(self.x, self.y, self.width / 2, self.height / 2, dx, dy)
+        moved = math.hypot(x - self.x, y - self.y)
+        self.x = x
+        self.y = y
+        return moved
+
+    def render_pos(self):
+        """Posição de desenho, interpolada entre o tick anterior e o atual."""
+        a = render_alpha
+        return (int(self.prev_x + (self.x - self.prev_x) * a),
+                int(self.prev_y + (self.y - self.prev_y) * a))
 
     def update(self, dt, player: Player, now):
+        self.prev_x = self.x
+        self.prev_y = self.y
         # Se viu o jogador recentemente (is_alert), persegue por um tempo
         px, py = player.x, player.y
         dist_to_player = distance((self.x, self.y), (px, py))
 
         # Raio de percepção (inimigo percebe o jogador dentro de um certo alcance)
-        perception = 100
+        perception = ENEMY_PERCEPTION
         if dist_to_player < perception:
+            if not self.is_alert:
+                spawn_burst(self.x, self.y, "alert")
             self.is_alert = True
-            self.chase_timeout = now + 2.0  # persegue por 2 segundos após perder de vista
+            self.chase_timeout = now + ENEMY_CHASE_TIME  # persegue por um tempo após perder de vista
 
         if self.is_alert and now < self.chase_timeout:
-            # Move em direção ao jogador
-            dx = px - self.x
-            dy = py - self.y
+            # Segue o campo de fluxo até o jogador (em linha reta no mesmo ladrilho ou fora do alcance do campo)
+            step = flow_field.next_step(self.x, self.y)
+            tx, ty = step if step is not None else (px, py)
+            dx = tx - self.x
+            dy = ty - self.y
             length = math.hypot(dx, dy) or 1
             nx = dx / length
             ny = dy / length
-            self.x += nx * self.speed * dt * 1.2  # um pouco mais rápido ao perseguir
-            self.y += ny * self.speed * dt * 1.2
+            # um pouco mais rápido ao perseguir
+            speed = self.speed * enemy_speed_scale * 1.2
+            self.move(nx * speed * dt, ny * speed * dt)
         else:
             self.is_alert = False
             # Comportamento de patrulha: vai até o alvo, pausa, escolhe um novo
@@ -294,13 +1396,16 @@ class Enemy:
                 dist = math.hypot(dx, dy)
                 if dist < 6:
                     # alcançou o alvo: pausa e escolhe outro
-                    self.pause_until = now + random.uniform(0.6, 1.6)
+                    self.pause_until = now + rng.uniform(0.6, 1.6)
                     self.target = self.random_point_in_territory()
                 else:
                     nx = dx / dist
                     ny = dy / dist
-                    self.x += nx * self.speed * dt
-                    self.y += ny * self.speed * dt
+                    wanted = self.speed * enemy_speed_scale * dt
+                    if self.move(nx * wanted, ny * wanted) < wanted * 0.5:
+                        # bloqueado por uma parede: pausa e escolhe outro alvo
+                        self.pause_until = now + rng.uniform(0.6, 1.6)
+                        self.target = self.random_point_in_territory()
 
         # Animação do frame
         self.frame_timer += dt
@@ -313,27 +1418,17 @@ class Enemy:
         angle = math.atan2(self.y - cy, self.x - cx)
         r = math.hypot(self.x - cx, self.y - cy)
         if r > self.territory_radius + 10:
-            # empurra de volta para dentro
-            self.x = cx + math.cos(angle) * (self.territory_radius - 6)
-            self.y = cy + math.sin(angle) * (self.territory_radius - 6)
+            # empurra de volta para dentro (ou para o centro, se a borda cair numa parede)
+            x = cx + math.cos(angle) * (self.territory_radius - 6)
+            y = cy + math.sin(angle) * (self.territory_radius - 6)
+            if not dungeon.box_free(x, y, self.width / 2, self.height / 2):
+                x, y = cx, cy
+            self.x = x
+            self.y = y
 
     def draw(self, now):
-        # Desenha o inimigo como um corpo colorido com "barbatanas" ou pernas que se animam
-        center = (int(self.x), int(self.y))
-        # A cor do corpo muda se estiver em alerta
-        base_color = (200, 100, 100) if not self.is_alert else (240, 80, 60)
-        body = Rect(center[0] - 10, center[1] - 12, 20, 22)
-        screen.draw.filled_rect(body, base_color)
-
-        # Olho que olha em direção ao jogador se estiver em alerta
-        screen.draw.filled_circle((center[0] + (self.frame - 1) * 1, center[1] - 6), 3, (20, 20, 20))
-
-        # Animação simples de barbatana/perna
-        fin_offset = (self.frame % 2) * 3 - 1
-        f1 = Rect(center[0] - 12, center[1] + 6 + fin_offset, 6, 8)
-        f2 = Rect(center[0] + 6, center[1] + 6 - fin_offset, 6, 8)
-        screen.draw.filled_rect(f1, (120, 70, 40))
-        screen.draw.filled_rect(f2, (120, 70, 40))
+        x, y = self.render_pos()
+        draw_enemy_sprite(x - camera.x, y - camera.y, self.frame, self.is_alert)
 
         # Dica de território (círculo pequeno e semitransparente) quando pausado ou no menu para ajudar a depurar
         # (não obstrutivo na jogabilidade)
@@ -342,69 +1437,880 @@ class Enemy:
         # depuração opcional: screen.draw.circle(self.territory_center, self.territory_radius, (80,80,80))
 
 
+def draw_enemy_sprite(cx, cy, frame, is_alert):
+    """Desenha um inimigo centrado em (cx, cy), em coordenadas de tela, com a pose em cache."""
+    ox, oy = ENEMY_SPRITE_ORIGIN
+    render.blit(sprites.enemy(frame, is_alert), (cx - ox, cy - oy))
+
+
+def draw_enemies(enemy_list):
+    """Enfileira todos os inimigos da lista no lote de desenho (saem num único Surface.blits)."""
+    if governor.level >= QUALITY_SLOW_ANIMATION:
+        # Qualidade reduzida: posição do último tick, sem interpolar
+        draw_enemies_reduced([int(e.x) for e in enemy_list], [int(e.y) for e in enemy_list],
+                             [e.is_alert for e in enemy_list])
+        return
+    ox, oy = ENEMY_SPRITE_ORIGIN
+    ox += camera.x
+    oy += camera.y
+    pose = sprites.enemy
+    a = render_alpha
+    render.blits([(pose(e.frame, e.is_alert),
+                   (int(e.prev_x + (e.x - e.prev_x) * a) - ox, int(e.prev_y + (e.y - e.prev_y) * a) - oy))
+                  for e in enemy_list])
+
+
+def draw_enemies_reduced(xs, ys, alerts):
+    """Inimigos em qualidade reduzida: uma só pose para todos a meia velocidade, ou só o corpo opaco."""
+    cam_x, cam_y = camera.x, camera.y
+    if governor.level >= QUALITY_FLAT_SPRITES:
+        flat = sprites.enemy_flat
+        render.blits([(flat(alert), (x - cam_x - 10, y - cam_y - 12)) for x, y, alert in zip(xs, ys, alerts)])
+        return
+    ox, oy = ENEMY_SPRITE_ORIGIN
+    ox += cam_x
+    oy += cam_y
+    frame = int(level_time * 3) % 4
+    pose = sprites.enemy
+    render.blits([(pose(frame, alert), (x - ox, y - oy)) for x, y, alert in zip(xs, ys, alerts)])
+
+
+# ----------------------------
+# AGENDADOR DE IA (NÍVEL DE DETALHE)
+# ----------------------------
+class AIScheduler:
+    """Decide a cada tick quais inimigos rodam Enemy.update.
+
+    Inimigos em alerta ou perto do jogador rodam todo tick; os demais rodam a
+    cada N ticks conforme a faixa de distância (AI_LOD_TIERS), recebendo o dt
+    acumulado, e os pausados longe rodam ainda menos. As atualizações são
+    espalhadas entre os ticks para não concentrar o custo.
+    """
+
+    def __init__(self, tiers=AI_LOD_TIERS, idle_interval=AI_LOD_IDLE_INTERVAL):
+        self.enabled = AI_LOD_ENABLED
+        self.tiers = tuple((limit * limit, interval) for limit, interval in tiers)
+        self.idle_interval = idle_interval
+        self.reset()
+
+    def reset(self):
+        self.tick = 0
+        self.updated = 0  # inimigos atualizados no último tick
+        # Recalculado a cada partida, caso ENEMY_PERCEPTION tenha sido ajustado
+        self.near2 = (ENEMY_PERCEPTION + AI_LOD_NEAR_MARGIN) ** 2
+
+    def interval_for(self, e, px, py, now):
+        """Quantos ticks até a próxima atualização do inimigo."""
+        if e.is_alert:
+            return 1
+        dx = e.x - px
+        dy = e.y - py
+        d2 = dx * dx + dy * dy
+        if d2 < self.near2:
+            return 1
+        if now < e.pause_until:
+            return self.idle_interval
+        for limit2, interval in self.tiers:
+            if d2 < limit2:
+                return interval
+        return self.tiers[-1][1]
+
+    def update(self, enemy_list, dt, player_list, now):
+        """Roda os inimigos que estão na vez; cada um reage ao jogador vivo mais próximo de player_list."""
+        self.tick += 1
+        tick = self.tick
+        single = player_list[0] if len(player_list) == 1 else None
+        if not self.enabled:
+            for e in enemy_list:
+                e.update(dt, single or nearest_player(e.x, e.y, player_list), now)
+                entity_grid.move(e, e.rect())
+            self.updated = len(enemy_list)
+            return
+
+        updated = 0
+        for i, e in enumerate(enemy_list):
+            if tick < e.ai_next_tick:
+                # Não se moveu neste tick: nada a interpolar no desenho
+                e.prev_x = e.x
+                e.prev_y = e.y
+                e.ai_dt += dt
+                continue
+            target = single or nearest_player(e.x, e.y, player_list)
+            e.update(e.ai_dt + dt, target, now)
+            e.ai_dt = 0.0
+            entity_grid.move(e, e.rect())
+            interval = self.interval_for(e, target.x, target.y, now)
+            # O deslocamento pelo índice espalha as atualizações de uma mesma faixa
+            e.ai_next_tick = tick + interval - (tick + i) % interval if interval > 1 else tick + 1
+            updated += 1
+        self.updated = updated
+
+
+ai_scheduler = AIScheduler()
+
+
+# ----------------------------
+# HORDA VETORIZADA (NumPy opcional)
+# ----------------------------
+class EnemyHorde:
+    """Inimigos guardados como estrutura de arrays (um array NumPy por atributo).
+
+    Reproduz o comportamento de Enemy.update (percepção, perseguição,
+    patrulha, pausa e limitação ao território), mas em operações sobre o
+    array inteiro, o que permite dezenas de milhares de inimigos por frame.
+    """
+
+    FIELDS = ("x", "y", "cx", "cy", "radius", "speed", "tx", "ty",
+              "frame", "frame_timer", "pause_until", "is_alert", "chase_timeout")
+    WIDTH = 20
+    HEIGHT = 26
+
+    def __init__(self, count=0, seed=None):
+        if np is None:
+            raise RuntimeError("O modo horda requer NumPy (pip install numpy).")
+        if seed is None:
+            # Derivada do gerador da sessão, para que a horda também seja reproduzível
+            seed = rng.getrandbits(32)
+        self.rng = np.random.default_rng(seed)
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.cx = np.empty(0)
+        self.cy = np.empty(0)
+        self.radius = np.empty(0)
+        self.speed = np.empty(0)
+        self.tx = np.empty(0)
+        self.ty = np.empty(0)
+        self.frame = np.empty(0, dtype=np.int8)
+        self.frame_timer = np.empty(0)
+        self.pause_until = np.empty(0)
+        self.is_alert = np.empty(0, dtype=bool)
+        self.chase_timeout = np.empty(0)
+        if count:
+            self.spawn(count)
+
+    def __len__(self):
+        return len(self.x)
+
+    def random_points_in_territory(self, cx, cy, radius):
+        """Versão vetorizada de Enemy.random_point_in_territory."""
+        n = len(cx)
+        angle = self.rng.uniform(0, 2 * math.pi, n)
+        r = self.rng.uniform(10, radius)
+        return cx + np.cos(angle) * r, cy + np.sin(angle) * r
+
+    def spawn(self, count, avoid=None, area=None):
+        """Acrescenta count inimigos, como spawn_enemies, longe do ponto avoid (padrão: o jogador).
+
+        Os centros dos territórios são ladrilhos de chão de area (padrão: o
+        mundo inteiro) fora da zona de exclusão de avoid, sorteados direto da
+        lista de ladrilhos válidos: sem rodadas de rejeição, o custo é fixo.
+        A horda é uma multidão, então não há separação mínima entre inimigos.
+        """
+        if avoid is None:
+            avoid = (player.x, player.y)
+        area = spawn_area(area if area is not None else world.bounds, 80)
+        # Ladrilhos de chão com o centro dentro de area (mesma regra de Dungeon.floor_tiles)
+        t = TILE_SIZE
+        half = t / 2
+        c0 = max(0, (area.left - t // 2 + t - 1) // t)
+        r0 = max(0, (area.top - t // 2 + t - 1) // t)
+        c1 = min(dungeon.cols - 1, (area.right - t // 2) // t)
+        r1 = min(dungeon.rows - 1, (area.bottom - t // 2) // t)
+        rows, cols = np.nonzero(~dungeon.solid_array[r0:r1 + 1, c0:c1 + 1])
+        centers_x = (cols + c0) * t + half
+        centers_y = (rows + r0) * t + half
+        clear = np.hypot(centers_x - avoid[0], centers_y - avoid[1]) > SPAWN_PLAYER_CLEARANCE["enemy"]
+        centers_x = centers_x[clear]
+        centers_y = centers_y[clear]
+        if not count or not len(centers_x):
+            return
+        rng = self.rng
+        pick = rng.integers(0, len(centers_x), count)
+        cx = centers_x[pick].astype(float)
+        cy = centers_y[pick].astype(float)
+        radius = rng.integers(ENEMY_MIN_PATROL, ENEMY_MAX_PATROL, count, endpoint=True).astype(float)
+        x = cx + rng.uniform(-radius / 2, radius / 2)
+        y = cy + rng.uniform(-radius / 2, radius / 2)
+        # Quem nasceria dentro de uma parede começa no centro do território
+        stuck = self.box_blocked(x, y)
+        x[stuck] = cx[stuck]
+        y[stuck] = cy[stuck]
+        tx, ty = self.random_points_in_territory(cx, cy, radius)
+        new = {
+            "x": x, "y": y, "cx": cx, "cy": cy, "radius": radius,
+            "speed": ENEMY_SPEED * (0.85 + rng.random(count) * 0.4),
+            "tx": tx, "ty": ty,
+            "frame": rng.integers(0, 4, count).astype(np.int8),
+            "frame_timer": rng.random(count) * 0.5,
+            "pause_until": np.zeros(count),
+            "is_alert": np.zeros(count, dtype=bool),
+            "chase_timeout": np.zeros(count),
+        }
+        for name in self.FIELDS:
+            setattr(self, name, np.concatenate((getattr(self, name), new[name])))
+
+    @staticmethod
+    def in_wall(x, y):
+        """Máscara dos pontos (x, y) que caem em ladrilhos de parede."""
+        solid = dungeon.solid_array
+        col = np.clip((x // TILE_SIZE).astype(np.int64), 0, dungeon.cols - 1)
+        row = np.clip((y // TILE_SIZE).astype(np.int64), 0, dungeon.rows - 1)
+        return solid[row, col]
+
+    def box_blocked(self, x, y):
+        """Máscara das caixas de inimigo centradas em (x, y) que tocam alguma parede."""
+        hw = self.WIDTH / 2
+        hh = self.HEIGHT / 2
+        return (self.in_wall(x - hw, y - hh) | self.in_wall(x + hw - 0.01, y - hh)
+                | self.in_wall(x - hw, y + hh - 0.01) | self.in_wall(x + hw - 0.01, y + hh - 0.01))
+
+    def move(self, step_x, step_y):
+        """Versão vetorizada de move_box: cada eixo só anda onde a borda da caixa não entra em parede."""
+        x, y = self.x, self.y
+        hw = self.WIDTH / 2
+        hh = self.HEIGHT / 2
+        edge = x + step_x + np.where(step_x > 0, hw - 0.01, -hw)
+        blocked = self.in_wall(edge, y - hh) | self.in_wall(edge, y + hh - 0.01)
+        x += np.where(blocked, 0.0, step_x)
+        edge = y + step_y + np.where(step_y > 0, hh - 0.01, -hh)
+        blocked = self.in_wall(x - hw, edge) | self.in_wall(x + hw - 0.01, edge)
+        y += np.where(blocked, 0.0, step_y)
+
+    def update(self, dt, player: Player, now):
+        x, y = self.x, self.y
+        px, py = player.x, player.y
+        old_x = x.copy()
+        old_y = y.copy()
+
+        # Percepção
+        dx = px - x
+        dy = py - y
+        dist_to_player = np.hypot(dx, dy)
+        seen = dist_to_player < ENEMY_PERCEPTION
+        self.chase_timeout[seen] = now + ENEMY_CHASE_TIME
+        chasing = (self.is_alert | seen) & (now < self.chase_timeout)
+        if not headless and particles is not None:
+            noticed = np.flatnonzero(chasing & ~self.is_alert)
+            if len(noticed):
+                spawn_burst(x[noticed], y[noticed], "alert")
+        self.is_alert = chasing
+
+        # Perseguição pelo campo de fluxo (um pouco mais rápido que a patrulha)
+        chasers = np.flatnonzero(chasing)
+        if len(chasers) and flow_field.origin is not None:
+            cols = dungeon.cols
+            tile = (y[chasers] // TILE_SIZE).astype(np.int64) * cols + (x[chasers] // TILE_SIZE).astype(np.int64)
+            nxt = flow_field.next_array()[tile]
+            follow = (nxt >= 0) & (nxt != tile)
+            half = TILE_SIZE / 2
+            tx = np.where(follow, (nxt % cols) * TILE_SIZE + half, px)
+            ty = np.where(follow, (nxt // cols) * TILE_SIZE + half, py)
+            dx[chasers] = tx - x[chasers]
+            dy[chasers] = ty - y[chasers]
+        length = np.hypot(dx, dy)
+        length[length == 0] = 1.0
+        speed = self.speed * enemy_speed_scale
+        chase_step = np.where(chasing, speed * dt * 1.2 / length, 0.0)
+
+        # Patrulha: vai até o alvo, pausa, escolhe um novo
+        patrolling = ~chasing & (now >= self.pause_until)
+        tdx = self.tx - x
+        tdy = self.ty - y
+        tdist = np.hypot(tdx, tdy)
+        arrived = patrolling & (tdist < 6)
+        walking = patrolling & ~arrived
+        patrol_step = np.where(walking, speed * dt / np.where(walking, tdist, 1.0), 0.0)
+
+        self.move(dx * chase_step + tdx * patrol_step, dy * chase_step + tdy * patrol_step)
+
+        # Patrulheiros barrados por uma parede escolhem outro alvo, como se tivessem chegado
+        moved = np.hypot(x - old_x, y - old_y)
+        arrived |= walking & (moved < speed * dt * 0.5)
+
+        idx = np.flatnonzero(arrived)
+        if len(idx):
+            self.pause_until[idx] = now + self.rng.uniform(0.6, 1.6, len(idx))
+            self.tx[idx], self.ty[idx] = self.random_points_in_territory(
+                self.cx[idx], self.cy[idx], self.radius[idx])
+
+        # Animação do frame
+        self.frame_timer += dt
+        roll = self.frame_timer >= 0.16
+        self.frame_timer[roll] = 0
+        self.frame[roll] = (self.frame[roll] + 1) % 4
+
+        # Mantém os inimigos dentro de seu território (limitação suave)
+        ox = x - self.cx
+        oy = y - self.cy
+        out = np.flatnonzero(np.hypot(ox, oy) > self.radius + 10)
+        if len(out):
+            angle = np.arctan2(oy[out], ox[out])
+            bx = self.cx[out] + np.cos(angle) * (self.radius[out] - 6)
+            by = self.cy[out] + np.sin(angle) * (self.radius[out] - 6)
+            # Se a borda cair numa parede, volta para o centro
+            blocked = self.box_blocked(bx, by)
+            x[out] = np.where(blocked, self.cx[out], bx)
+            y[out] = np.where(blocked, self.cy[out], by)
+
+    def collides(self, rect: Rect) -> bool:
+        """True se algum inimigo (com o mesmo retângulo de Enemy.rect) toca rect."""
+        left = np.trunc(self.x - self.WIDTH / 2)
+        top = np.trunc(self.y - self.HEIGHT / 2)
+        hit = ((left < rect.right) & (left + self.WIDTH > rect.left)
+               & (top < rect.bottom) & (top + self.HEIGHT > rect.top))
+        return bool(hit.any())
+
+    def draw(self, now):
+        # Só os inimigos dentro da visão da câmera são desenhados
+        ew, eh = ENEMY_SPRITE_SIZE
+        view = camera.view_rect()
+        x = self.x.astype(int)
+        y = self.y.astype(int)
+        shown = (x > view.left - ew) & (x < view.right + ew) & (y > view.top - eh) & (y < view.bottom + eh)
+        if governor.level >= QUALITY_NEAR_ONLY:
+            shown &= (x - player.x) ** 2 + (y - player.y) ** 2 < QUALITY_NEAR_RADIUS ** 2
+        idx = np.flatnonzero(shown)
+        if governor.level >= QUALITY_SLOW_ANIMATION:
+            draw_enemies_reduced(x[idx].tolist(), y[idx].tolist(), self.is_alert[idx].tolist())
+            return
+        ox, oy = ENEMY_SPRITE_ORIGIN
+        ox += camera.x
+        oy += camera.y
+        pose = sprites.enemy
+        render.blits([(pose(frame, alert), (cx - ox, cy - oy))
+                      for cx, cy, frame, alert in zip(x[idx].tolist(),
+                                                      y[idx].tolist(),
+                                                      self.frame[idx].tolist(),
+                                                      self.is_alert[idx].tolist())])
+
+
+# ----------------------------
+# PARTÍCULAS
+# ----------------------------
+class ParticleSystem:
+    """Efeitos de partículas em arrays NumPy de capacidade fixa (posição, velocidade, vida e cor).
+
+    Os arrays são alocados uma vez; as partículas vivas ficam compactadas em
+    [0, count), e as que morrem liberam o fim dos arrays para as próximas
+    explosões. Atualizar e desenhar são operações em lote: o desenho escreve
+    os pixels direto na tela (2x2 na primeira metade da vida, 1x1 depois).
+    As partículas são só visuais: não entram nos snapshots nem usam o rng
+    da partida, então não mudam a simulação.
+    """
+
+    FIELDS = ("x", "y", "vx", "vy", "life", "ttl", "color")
+
+    def __init__(self, capacity=PARTICLE_CAPACITY):
+        self.capacity = capacity
+        self.count = 0
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.vx = np.zeros(capacity, dtype=np.float32)
+        self.vy = np.zeros(capacity, dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.float32)  # segundos restantes
+        self.ttl = np.zeros(capacity, dtype=np.float32)  # vida inicial
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+        self._step = np.zeros(capacity, dtype=np.float32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self.rng = np.random.default_rng()
+        self.visible = 0  # partículas desenhadas no último frame
+        self.dropped = 0  # partículas descartadas por falta de espaço nesta partida
+        self.limit = capacity  # teto de partículas vivas (o governor o reduz em qualidade baixa)
+
+    def clear(self):
+        self.count = 0
+        self.dropped = 0
+
+    def burst(self, x, y, count, color, speed, life):
+        """Emite count partículas de cada origem (x, y); x e y podem ser arrays com várias origens."""
+        x = np.repeat(np.asarray(x, dtype=np.float32).reshape(-1), count)
+        y = np.repeat(np.asarray(y, dtype=np.float32).reshape(-1), count)
+        start = self.count
+        # limit pode ter caído abaixo de count (o governor baixou a qualidade): nada entra
+        n = max(0, min(len(x), self.limit - start))
+        self.dropped += len(x) - n
+        if n <= 0:
+            return
+        end = start + n
+        rng = self.rng
+        angle = rng.uniform(0.0, 2 * math.pi, n)
+        velocity = speed * rng.uniform(0.3, 1.0, n)
+        self.x[start:end] = x[:n]
+        self.y[start:end] = y[:n]
+        self.vx[start:end] = np.cos(angle) * velocity
+        self.vy[start:end] = np.sin(angle) * velocity
+        self.life[start:end] = life * rng.uniform(0.6, 1.0, n)
+        self.ttl[start:end] = self.life[start:end]
+        self.color[start:end] = color
+        self.count = end
+
+    def update(self, dt):
+        n = self.count
+        if not n:
+            return
+        step = self._step[:n]
+        np.multiply(self.vx[:n], dt, out=step)
+        self.x[:n] += step
+        np.multiply(self.vy[:n], dt, out=step)
+        self.y[:n] += step
+        drag = PARTICLE_DRAG ** dt
+        self.vx[:n] *= drag
+        self.vy[:n] *= drag
+        life = self.life[:n]
+        life -= dt
+        # Recicla os slots mortos: as vivas são compactadas no começo dos arrays
+        alive = np.greater(life, 0.0, out=self._alive[:n])
+        k = int(np.count_nonzero(alive))
+        if k < n:
+            for name in self.FIELDS:
+                arr = getattr(self, name)
+                arr[:k] = arr[:n][alive]
+            self.count = k
+
+    def draw(self, surf):
+        """Desenha as partículas visíveis pela câmera direto nos pixels de surf."""
+        n = self.count
+        self.visible = 0
+        if not n:
+            return
+        w, h = surf.get_size()
+        xs = self.x[:n].astype(np.int32) - camera.x
+        ys = self.y[:n].astype(np.int32) - camera.y
+        shown = (xs >= 0) & (xs < w - 1) & (ys >= 0) & (ys < h - 1)
+        big = (self.life[:n] > 0.5 * self.ttl[:n])[shown]
+        xs = xs[shown]
+        ys = ys[shown]
+        colors = self.color[:n][shown]
+        self.visible = len(xs)
+        if not self.visible:
+            return
+        try:
+            pixels = pygame.surfarray.pixels3d(surf)
+        except ValueError:
+            # Superfície sem acesso direto aos pixels RGB (8/16 bits): um fill por partícula
+            for x, y, color in zip(xs.tolist(), ys.tolist(), colors.tolist()):
+                surf.fill(color, (x, y, 2, 2))
+            return
+        pixels[xs, ys] = colors
+        xs = xs[big]
+        ys = ys[big]
+        colors = colors[big]
+        pixels[xs + 1, ys] = colors
+        pixels[xs, ys + 1] = colors
+        pixels[xs + 1, ys + 1] = colors
+        del pixels  # destrava a superfície para os próximos blits
+
+
+particles = ParticleSystem() if np is not None else None
+
+
+def spawn_burst(x, y, effect):
+    """Emite o efeito de PARTICLE_EFFECTS em (x, y); não faz nada sem janela (headless) ou sem NumPy."""
+    if headless or particles is None:
+        return
+    count, color, speed, life = PARTICLE_EFFECTS[effect]
+    particles.burst(x, y, count, color, speed, life)
+
+
 # ----------------------------
 # MAPA E ITENS
 # ----------------------------
 class Item:
     """Itens coletáveis simples colocados no chão. Animados como círculos pulsantes."""
 
+    __slots__ = ("x", "y", "collected", "pulse_timer")
+
+    _scratch = Rect(0, 0, 16, 16)  # Rect de rascunho de rect(), como em Enemy
+
     def __init__(self, x, y):
+        self.reset(x, y)
+
+    def reset(self, x, y):
+        """(Re)inicializa o item; usado também ao reaproveitá-lo do item_pool."""
         self.x = x
         self.y = y
         self.collected = False
-        self.pulse_timer = random.random() * 2
+        self.pulse_timer = rng.random() * 2
 
     def rect(self):
-        return Rect(int(self.x - 8), int(self.y - 8), 16, 16)
+        """Retângulo de colisão: o Rect de rascunho da classe, válido até a próxima chamada."""
+        r = Item._scratch
+        r.x = int(self.x - 8)
+        r.y = int(self.y - 8)
+        return r
 
     def update(self, dt):
         self.pulse_timer += dt
 
     def draw(self):
-        # Raio pulsante
-        r = 6 + math.sin(self.pulse_timer * 4) * 2
-        screen.draw.filled_circle((int(self.x), int(self.y)), int(abs(r)), (120, 220, 160))
+        # Raio pulsante (fixo em qualidade reduzida)
+        r = 6 if governor.level >= QUALITY_STATIC_ITEMS else 6 + math.sin(self.pulse_timer * 4) * 2
+        render.circle((int(self.x) - camera.x, int(self.y) - camera.y), int(abs(r)), (120, 220, 160))
+
+
+def spawn_area(area, margin):
+    """Parte de area que fica a pelo menos margin pixels das bordas do mundo."""
+    return area.clip(world.bounds.inflate(-2 * margin, -2 * margin))
+
+
+class PoissonGrid:
+    """Grade de aceleração da amostragem de Poisson-disk: células do tamanho da separação.
+
+    Um ponto a menos de separation de (x, y) só pode estar na célula de (x, y)
+    ou nas oito vizinhas, então fits() testa poucos pontos, não importa
+    quantos já foram colocados.
+    """
+
+    __slots__ = ("cell", "min_dist2", "cells")
+
+    def __init__(self, separation):
+        self.cell = max(1, separation)
+        self.min_dist2 = separation * separation
+        self.cells = {}
+
+    def add(self, x, y):
+        key = (int(x // self.cell), int(y // self.cell))
+        bucket = self.cells.get(key)
+        if bucket is None:
+            self.cells[key] = [(x, y)]
+        else:
+            bucket.append((x, y))
+
+    def fits(self, x, y):
+        """True se nenhum ponto da grade fica a menos da separação de (x, y)."""
+        if not self.min_dist2:
+            return True
+        col = int(x // self.cell)
+        row = int(y // self.cell)
+        cells = self.cells
+        min_dist2 = self.min_dist2
+        for c in (col - 1, col, col + 1):
+            for r in (row - 1, row, row + 1):
+                for px, py in cells.get((c, r), ()):
+                    if (px - x) ** 2 + (py - y) ** 2 < min_dist2:
+                        return False
+        return True
 
 
-def generate_items(count=8):
-    items_list = []
-    margin = 40
-    for _ in range(count):
-        x = random.randint(margin, WIDTH - margin)
-        y = random.randint(margin, HEIGHT - margin)
-        items_list.append(Item(x, y))
-    return items_list
+def place_spawns(count, area, kind, spread, separation=None):
+    """Até count posições (x, y) no chão de area para entidades do tipo kind ("item" ou "enemy").
+
+    Amostragem de Poisson-disk por tentativas (dart throwing): cada candidato
+    é um ladrilho de chão sorteado mais um deslocamento de até spread pixels
+    do centro, aceito se ficar a SPAWN_SEPARATION[kind] (ou separation) de
+    todo item e inimigo, novo ou já em jogo, e fora da zona de exclusão
+    SPAWN_PLAYER_CLEARANCE[kind] dos jogadores. Cada posição tem até
+    SPAWN_ATTEMPTS sorteios; se todos falham, a área está cheia e a busca
+    para ali, devolvendo menos posições. O pior caso é
+    count * SPAWN_ATTEMPTS sorteios, cada um testando só as células vizinhas.
+    """
+    floor = dungeon.floor_tiles(area)
+    if not floor or count <= 0:
+        return []
+    if separation is None:
+        separation = SPAWN_SEPARATION[kind]
+    clearance2 = SPAWN_PLAYER_CLEARANCE[kind] ** 2
+    zones = [(p.x, p.y) for p in players]
+    grid = PoissonGrid(separation)
+    if separation:
+        for obj in entity_grid.query(area.inflate(2 * separation, 2 * separation)):
+            grid.add(obj.x, obj.y)
+    half = TILE_SIZE // 2
+    placed = []
+    misses = 0
+    while len(placed) < count and misses < SPAWN_ATTEMPTS:
+        c, r = rng.choice(floor)
+        x = c * TILE_SIZE + half + rng.randint(-spread, spread)
+        y = r * TILE_SIZE + half + rng.randint(-spread, spread)
+        if (any((x - zx) ** 2 + (y - zy) ** 2 < clearance2 for zx, zy in zones)
+                or not grid.fits(x, y)):
+            misses += 1
+            continue
+        misses = 0
+        grid.add(x, y)
+        placed.append((x, y))
+    return placed
+
+
+def generate_items(count=8, area=None):
+    """Espalha até count itens pelo chão de area (padrão: os chunks em volta do jogador), sem sobreposição."""
+    if area is None:
+        area = world.region(ITEM_SPAWN_RADIUS)
+    return [item_pool.acquire(x, y)
+            for x, y in place_spawns(count, spawn_area(area, 40), "item", spread=TILE_SIZE // 2 - 10)]
+
+
+# ----------------------------
+# MUNDO EM CHUNKS E CÂMERA
+# ----------------------------
+class Chunk:
+    """Pedaço quadrado do mundo com os inimigos que nasceram nele."""
+
+    __slots__ = ("coords", "rect", "enemies")
+
+    def __init__(self, coords, rect):
+        self.coords = coords
+        self.rect = rect
+        # Inimigos cujo centro de território fica neste chunk (eles nunca saem de perto)
+        self.enemies = []
+
+
+class World:
+    """Mapa maior que a tela, dividido em chunks de CHUNK_SIZE pixels.
+
+    Os chunks são criados (e povoados conforme CHUNK_ENEMIES) quando o
+    jogador chega a CHUNK_LOAD_RADIUS chunks deles. Só os inimigos dos chunks
+    a até CHUNK_ACTIVE_RADIUS do jogador são simulados (lista active); os
+    mais distantes ficam suspensos, com o estado congelado, até ele voltar.
+    Com vários jogadores vale a união das vizinhanças de todos; center é o
+    chunk do primeiro (usado para os itens e reforços das ondas).
+    """
+
+    def __init__(self, chunks_x=WORLD_CHUNKS_X, chunks_y=WORLD_CHUNKS_Y, chunk_size=CHUNK_SIZE):
+        self.chunks_x = chunks_x
+        self.chunks_y = chunks_y
+        self.chunk_size = chunk_size
+        self.bounds = Rect(0, 0, chunks_x * chunk_size, chunks_y * chunk_size)
+        self.chunks = {}  # (coluna, linha) -> Chunk
+        self.center = None  # chunk onde o jogador está
+        self.centers = ()  # chunk de cada jogador
+        self.active = []  # inimigos simulados neste momento
+
+    def reset(self):
+        self.chunks.clear()
+        self.center = None
+        self.centers = ()
+        self.active = []
+
+    def chunk_coords(self, x, y):
+        """Chunk que contém o ponto (x, y) do mundo (pontos fora são trazidos para a borda)."""
+        cs = self.chunk_size
+        return (clamp(int(x // cs), 0, self.chunks_x - 1), clamp(int(y // cs), 0, self.chunks_y - 1))
+
+    def coords_around(self, center, radius):
+        """Chunks do mundo a até radius chunks de center, linha por linha."""
+        c0, r0 = center
+        return [(c, r)
+                for r in range(max(0, r0 - radius), min(self.chunks_y, r0 + radius + 1))
+                for c in range(max(0, c0 - radius), min(self.chunks_x, c0 + radius + 1))]
+
+    def region(self, radius, center=None):
+        """Retângulo coberto pelos chunks a até radius do jogador (ou de center)."""
+        if center is None:
+            center = self.center if self.center is not None else self.chunk_coords(player.x, player.y)
+        cs = self.chunk_size
+        c0, r0 = center
+        rect = Rect((c0 - radius) * cs, (r0 - radius) * cs, (2 * radius + 1) * cs, (2 * radius + 1) * cs)
+        return rect.clip(self.bounds)
+
+    def update(self, player_list):
+        """Cria os chunks que os jogadores alcançaram e refaz a lista active quando algum troca de chunk."""
+        centers = tuple(self.chunk_coords(p.x, p.y) for p in player_list)
+        if centers == self.centers:
+            return
+        self.centers = centers
+        self.center = centers[0]
+        for center in centers:
+            for coords in self.coords_around(center, CHUNK_LOAD_RADIUS):
+                if coords not in self.chunks:
+                    self.create_chunk(coords)
+        self.refresh_active()
+
+    def create_chunk(self, coords):
+        cs = self.chunk_size
+        chunk = self.chunks[coords] = Chunk(coords, Rect(coords[0] * cs, coords[1] * cs, cs, cs))
+        # No modo horda os inimigos vivem na EnemyHorde, não nos chunks
+        if horde is None and CHUNK_ENEMIES:
+            # Proporcional à área de chão do chunk, com arredondamento aleatório
+            floor = len(dungeon.floor_tiles(chunk.rect))
+            count = enemy_room(int(CHUNK_ENEMIES * floor / (CHUNK_TILES * CHUNK_TILES) + rng.random()))
+            if count:
+                add_enemies(spawn_enemies(count, chunk.rect))
+        return chunk
+
+    def refresh_active(self):
+        if len(self.centers) > 1:
+            # Vizinhanças que se sobrepõem contam uma vez só
+            around = dict.fromkeys(coords for center in self.centers
+                                   for coords in self.coords_around(center, CHUNK_ACTIVE_RADIUS))
+        elif self.center is not None:
+            around = self.coords_around(self.center, CHUNK_ACTIVE_RADIUS)
+        else:
+            self.active = []
+            return
+        self.active = [e for coords in around if coords in self.chunks
+                       for e in self.chunks[coords].enemies]
+
+    def adopt(self, enemy_list):
+        """Registra inimigos novos no chunk do centro de seu território."""
+        for e in enemy_list:
+            coords = self.chunk_coords(*e.territory_center)
+            chunk = self.chunks.get(coords)
+            if chunk is None:
+                chunk = self.create_chunk(coords)
+            chunk.enemies.append(e)
+        self.refresh_active()
+
+    def restore(self, coords_list, center, enemy_list):
+        """Refaz os chunks de um snapshot (sem povoá-los) e devolve cada inimigo ao seu chunk.
+
+        Os inimigos são distribuídos na ordem de enemy_list, que é a mesma em
+        que foram adotados, então a ordem dentro de cada chunk se mantém.
+        """
+        cs = self.chunk_size
+        old = self.chunks
+        self.chunks = {}
+        for coords in coords_list:
+            chunk = old.get(coords)
+            if chunk is None:
+                chunk = Chunk(coords, Rect(coords[0] * cs, coords[1] * cs, cs, cs))
+            else:
+                chunk.enemies.clear()
+            self.chunks[coords] = chunk
+        # Centros de território ficam sempre dentro do mundo: dispensa o clamp de chunk_coords
+        chunks = self.chunks
+        for e in enemy_list:
+            cx, cy = e.territory_center
+            chunks[(int(cx // cs), int(cy // cs))].enemies.append(e)
+        self.center = center
+        self.centers = (center,) if center is not None else ()
+        self.refresh_active()
+
+    def clear_enemies(self):
+        for chunk in self.chunks.values():
+            chunk.enemies.clear()
+        self.active = []
+
+    def enemies_near(self, rect: Rect):
+        """Inimigos que podem estar dentro de rect: os dos chunks ao alcance de seus territórios."""
+        reach = 2 * (ENEMY_MAX_PATROL + 10)
+        area = rect.inflate(reach, reach)
+        c0, r0 = self.chunk_coords(area.left, area.top)
+        c1, r1 = self.chunk_coords(area.right - 1, area.bottom - 1)
+        chunks = self.chunks
+        return [e for r in range(r0, r1 + 1) for c in range(c0, c1 + 1) if (c, r) in chunks
+                for e in chunks[(c, r)].enemies]
+
+
+class Camera:
+    """Canto superior esquerdo da tela no mundo; segue o jogador sem sair do mapa."""
+
+    __slots__ = ("x", "y", "width", "height")
+
+    def __init__(self, width=WIDTH, height=HEIGHT):
+        self.x = 0
+        self.y = 0
+        self.width = width
+        self.height = height
+
+    def follow(self, x, y):
+        """Centraliza em (x, y), limitado às bordas do mundo."""
+        self.x = int(clamp(x - self.width // 2, 0, max(0, WORLD_WIDTH - self.width)))
+        self.y = int(clamp(y - self.height // 2, 0, max(0, WORLD_HEIGHT - self.height)))
+
+    def view_rect(self):
+        """Área visível, em coordenadas do mundo."""
+        return Rect(self.x, self.y, self.width, self.height)
+
+
+world = World()
+camera = Camera()
 
 
 # ----------------------------
 # CONFIGURAÇÃO DO JOGO
 # ----------------------------
-# Ponto de surgimento do jogador
-player = Player(WIDTH // 2, HEIGHT // 2)
+# Ponto de surgimento do jogador: o centro do mundo
+player = Player(WORLD_WIDTH // 2, WORLD_HEIGHT // 2)
+# Todos os jogadores da partida; player é sempre o primeiro (o único, fora do servidor multijogador)
+players = [player]
 
 # Lista de inimigos
 enemies = []
-
-def spawn_enemies(count):
-    """Gera inimigos espalhados pelo mapa, cada um com seu próprio território."""
+# Inimigos e itens descartados (nova partida, item coletado) voltam para estes
+# pools e são reaproveitados em vez de alocados de novo
+enemy_pool = EntityPool(Enemy)
+item_pool = EntityPool(Item)
+# Broadphase de colisões com os inimigos e itens ativos
+entity_grid = SpatialHash(TILE_SIZE)
+# Horda vetorizada (EnemyHorde) quando a partida está no modo horda
+horde = None
+
+def spawn_enemies(count, area=None, separation=None):
+    """Gera até count inimigos espalhados por area (padrão: os chunks em volta do jogador), cada um com seu território.
+
+    As posições saem de place_spawns: separadas entre si e dos itens e
+    inimigos que já existem, longe dos jogadores; sem espaço, vêm menos.
+    """
+    if area is None:
+        area = world.region(ITEM_SPAWN_RADIUS)
+    half = TILE_SIZE // 2
     result = []
-    for i in range(count):
-        # Escolhe um ponto central, evitando sobreposição direta com o jogador
-        while True:
-            cx = random.randint(80, WIDTH - 80)
-            cy = random.randint(80, HEIGHT - 80)
-            if distance((cx, cy), (player.x, player.y)) > 120:
-                break
-        territory_radius = random.randint(ENEMY_MIN_PATROL, ENEMY_MAX_PATROL)
-        e = Enemy(cx, cy, territory_radius)
-        # varia a posição inicial do inimigo dentro do território
-        e.x = cx + random.uniform(-territory_radius / 2, territory_radius / 2)
-        e.y = cy + random.uniform(-territory_radius / 2, territory_radius / 2)
+    # A caixa do inimigo (20x26) cabe inteira no ladrilho sorteado, então nunca nasce dentro de parede
+    for x, y in place_spawns(count, spawn_area(area, 80), "enemy", spread=half - 14, separation=separation):
+        # O território fica centrado no ladrilho onde o inimigo nasce
+        cx = x // TILE_SIZE * TILE_SIZE + half
+        cy = y // TILE_SIZE * TILE_SIZE + half
+        e = enemy_pool.acquire(cx, cy, rng.randint(ENEMY_MIN_PATROL, ENEMY_MAX_PATROL))
+        e.x = e.prev_x = x
+        e.y = e.prev_y = y
         result.append(e)
     return result
 
-# Itens
-items = generate_items(10)
+
+def add_enemies(new_enemies):
+    """Coloca inimigos recém-gerados no jogo: na lista, na grade espacial e em seus chunks."""
+    enemies.extend(new_enemies)
+    for e in new_enemies:
+        entity_grid.insert(e, e.rect())
+    world.adopt(new_enemies)
+
+
+def add_player():
+    """Coloca mais um jogador na partida, na sala inicial, e o devolve (usado pelo servidor)."""
+    n = len(players)
+    # Em volta do centro da sala inicial, um ladrilho e meio para cada lado
+    angle = n * 2.4
+    x = WORLD_WIDTH // 2 + math.cos(angle) * TILE_SIZE * 1.5
+    y = WORLD_HEIGHT // 2 + math.sin(angle) * TILE_SIZE * 1.5
+    p = Player(x, y)
+    if not dungeon.box_free(x, y, p.width / 2, p.height / 2):
+        p.reset(WORLD_WIDTH // 2, WORLD_HEIGHT // 2)
+    players.append(p)
+    return p
+
+
+def remove_player(p):
+    """Tira um jogador da partida; se era player, o próximo da lista assume o papel."""
+    global player
+    players.remove(p)
+    if p is player and players:
+        player = players[0]
+
+
+def nearest_player(x, y, player_list):
+    """Jogador de player_list mais próximo de (x, y)."""
+    return min(player_list, key=lambda p: (p.x - x) ** 2 + (p.y - y) ** 2)
+
+
+def enemy_count():
+    """Inimigos em jogo (na lista ou na horda)."""
+    return len(horde) if horde is not None else len(enemies)
+
+
+def enemy_room(count):
+    """Quantos de count inimigos novos cabem antes do teto (ENEMY_CAP, ou HORDE_CAP no modo horda)."""
+    cap = HORDE_CAP if horde is not None else ENEMY_CAP
+    return max(0, min(count, cap - enemy_count()))
+
+
+def collect_item(it):
+    """Tira o item coletado do jogo e o devolve ao item_pool."""
+    it.collected = True
+    entity_grid.remove(it)
+    items.remove(it)
+    item_pool.release(it)
+
 
 # Botões do menu
 btn_start = Button("Start Game", WIDTH // 2 - 120, HEIGHT // 2 - 60, 240, 48)
@@ -414,37 +2320,156 @@ btn_exit = Button("Exit", WIDTH // 2 - 120, HEIGHT // 2 + 72, 240, 48)
 # ----------------------------
 # Hooks do Pygame Zero
 # ----------------------------
-def start_new_game():
-    """Inicializa / reseta todas as variáveis de jogabilidade para iniciar uma nova partida."""
-    global player, enemies, items, player_score, level_time, mode
-    player = Player(WIDTH // 2, HEIGHT // 2)
-    enemies = spawn_enemies(ENEMY_COUNT)
-    items = generate_items(10)
+def start_new_game(seed=None):
+    """Inicializa / reseta todas as variáveis de jogabilidade para iniciar uma nova partida.
+
+    seed fixa o gerador aleatório da sessão; sem ela uma semente nova é sorteada.
+    """
+    global enemies, items, players, player_score, level_time, mode, horde, waves_cleared
+    global session_seed, sim_accumulator, render_alpha, enemy_speed_scale, replay_recorder
+    session_seed = seed if seed is not None else random.getrandbits(32)
+    rng.seed(session_seed)
+    sim_accumulator = 0.0
+    render_alpha = 1.0
+    enemy_speed_scale = 1.0
+    ai_scheduler.reset()
+    rollback_buffer.clear()
+    if particles is not None:
+        particles.clear()
+    player.reset(WORLD_WIDTH // 2, WORLD_HEIGHT // 2)
+    players = [player]
+    horde = None
+    # Os objetos da partida anterior voltam para os pools
+    enemy_pool.release_all(enemies)
+    item_pool.release_all(items)
+    enemies = []
+    items = []
+    entity_grid.clear()
+    # Masmorra nova, com a sala inicial em volta do jogador
+    dungeon.generate(dungeon.tile_at(player.x, player.y))
+    flow_field.reset()
+    flow_field.update([(player.x, player.y)])
+    # Cria e povoa os chunks em volta do ponto de partida
+    world.reset()
+    world.update(players)
+    items = generate_items(START_ITEMS)
+    rebuild_entity_grid()
     player_score = 0
     level_time = 0.0
+    waves_cleared = 0
     mode = "playing"
+    # Grava a partida (o primeiro keyframe sai no primeiro tick)
+    finish_recording()
+    replay_recorder = Replay(session_seed) if REPLAY_RECORD and not headless else None
     # Inicia a música de fundo (com tratamento de erros)
     safe_play_music(BGM_FILENAME)
 
 
-# gera inimigos inicialmente
-enemies = spawn_enemies(ENEMY_COUNT)
+def rebuild_entity_grid():
+    """Reindexa do zero os inimigos e os itens não coletados em entity_grid."""
+    entity_grid.clear()
+    for e in enemies:
+        entity_grid.insert(e, e.rect())
+    for it in items:
+        entity_grid.insert(it, it.rect())
+
+
+def start_horde_game(count=HORDE_SIZE, seed=None):
+    """Inicia uma partida no modo horda: os inimigos vivem numa EnemyHorde vetorizada."""
+    global enemies, horde, replay_recorder
+    start_new_game(seed)
+    # Keyframes com milhares de inimigos ficariam grandes demais: o modo horda não é gravado
+    replay_recorder = None
+    enemy_pool.release_all(enemies)
+    enemies = []
+    world.clear_enemies()
+    horde = EnemyHorde(count)
+    rebuild_entity_grid()
+
+
+# Gera a masmorra, o mundo, os inimigos e os itens iniciais
+dungeon.generate(dungeon.tile_at(player.x, player.y))
+world.update(players)
+items = generate_items(START_ITEMS)
 
 
 def on_key_down(key):
     """Lida com pressionamentos de teclas globais: M alterna a música; ESC retorna ao menu."""
     global music_enabled, mode
+    # Qualquer tecla pode mudar uma tela estática; o próximo frame é completo
+    dirty_renderer.invalidate()
+    if key == keys.F2:
+        # Overlay do profiler (liga a medição junto)
+        profiler.overlay = not profiler.overlay
+        profiler.enabled = profiler.overlay or profiler.csv_file is not None
+    if key == keys.F3:
+        set_dirty_rendering(not dirty_rendering)
+    if key == keys.F8:
+        # Qualidade adaptativa: desligada, o desenho fica na qualidade completa
+        governor.toggle()
+    if key == keys.F4:
+        # Gravação CSV do profiler
+        if profiler.csv_file is None:
+            profiler.start_csv()
+        else:
+            profiler.stop_csv()
+            profiler.enabled = profiler.overlay
     if key == keys.M:
         music_enabled = not music_enabled
         if music_enabled:
             safe_play_music(BGM_FILENAME)
         else:
             safe_stop_music()
+    if replay_player is not None:
+        on_replay_key(key)
+        return
+    if key == keys.F5 and mode == "playing":
+        quick_save()
+    if key == keys.F9:
+        # A gravação do replay não sobrevive a um salto para outro estado: a
+        # atual é salva e uma nova começa no estado carregado
+        finish_recording()
+        if quick_load():
+            restart_recording()
+            if mode == "playing":
+                safe_play_music(BGM_FILENAME)
+    if key == keys.F6:
+        # Liga/desliga a gravação do buffer de rollback
+        rollback_buffer.enabled = not rollback_buffer.enabled
+        rollback_buffer.clear()
+    if key == keys.F7 and mode in ("playing", "gameover") and rollback_buffer.rollback(int(ROLLBACK_SECONDS * SIM_HZ)):
+        if replay_recorder is not None and ai_scheduler.tick >= replay_recorder.start_tick:
+            replay_recorder.truncate(ai_scheduler.tick - replay_recorder.start_tick)
+        else:
+            # A gravação acabou no fim de jogo (ou começou depois do ponto restaurado): grava a partir daqui
+            restart_recording()
+        if mode == "playing":
+            safe_play_music(BGM_FILENAME)
+    if key == keys.H and mode == "menu" and np is not None:
+        # Atalho para o modo horda
+        start_horde_game()
     if key == keys.ESCAPE:
         if mode == "playing":
             # volta para o menu (pausa)
             mode = "menu"
             safe_stop_music()
+            finish_recording()
+
+
+def on_replay_key(key):
+    """Teclas enquanto um replay passa: ←/→ navegam, +/- mudam a velocidade, ESC sai."""
+    if key == keys.ESCAPE:
+        stop_replay()
+        return
+    if key in (keys.LEFT, keys.RIGHT):
+        step = int(REPLAY_SEEK_SECONDS * SIM_HZ)
+        replay_player.seek(replay_player.tick + (step if key == keys.RIGHT else -step))
+        return
+    if key in (keys.EQUALS, keys.PLUS, keys.KP_PLUS, keys.MINUS, keys.KP_MINUS):
+        faster = key in (keys.EQUALS, keys.PLUS, keys.KP_PLUS)
+        i = REPLAY_SPEEDS.index(replay_player.speed) if replay_player.speed in REPLAY_SPEEDS else 2
+        i = min(len(REPLAY_SPEEDS) - 1, i + 1) if faster else max(0, i - 1)
+        replay_player.speed = REPLAY_SPEEDS[i]
 
 
 def on_mouse_down(pos):
@@ -452,6 +2477,7 @@ def on_mouse_down(pos):
     global mode, music_enabled
     if mode != "menu":
         return
+    dirty_renderer.invalidate()
     if btn_start.clicked(pos):
         safe_play_sound(SOUND_CLICK)
         start_new_game()
@@ -472,7 +2498,11 @@ def on_mouse_down(pos):
 
 def update(dt):
     """Loop de atualização principal — chamado com dt (segundos desde a última chamada)."""
-    global player_score, level_time, mode
+    governor.begin_frame()
+    if startup_time is None and frames_drawn:
+        record_startup_time()
+    if pending_music is not None and audio_ready:
+        flush_pending_music()
 
     if mode == "quit":
         # Congela o estado do jogo; não atualiza
@@ -484,70 +2514,867 @@ def update(dt):
         return
 
     if mode == "playing":
-        # Atualiza os temporizadores
-        level_time += dt
-        now = level_time
+        if replay_player is not None:
+            advance_simulation(dt, replay_player.next_input, replay_player.speed)
+            if replay_player.done() and mode == "playing":
+                stop_replay()
+        else:
+            advance_simulation(dt, read_keyboard_input())
+            if mode == "gameover":
+                finish_recording()
+
+    # As partículas continuam (e se apagam) também na tela de fim de jogo
+    if particles is not None:
+        particles.update(dt)
+
+    # Nenhum outro modo requer atualização
 
-        # Atualiza o jogador
-        player.update(dt)
 
-        # Atualiza os itens
+def advance_simulation(dt, inputs, speed=1.0):
+    """Consome dt de tempo real em ticks fixos de SIM_DT e prepara a interpolação do desenho.
+
+    inputs é a máscara de todos os ticks ou uma função chamada a cada tick
+    (a reprodução de replays); speed acelera ou desacelera o tempo de jogo.
+    """
+    global sim_accumulator, render_alpha
+    sim_accumulator += min(dt, MAX_FRAME_TIME) * speed
+    while sim_accumulator >= SIM_DT and mode == "playing":
+        simulate_tick(SIM_DT, inputs() if callable(inputs) else inputs)
+        sim_accumulator -= SIM_DT
+    render_alpha = sim_accumulator / SIM_DT
+
+
+def simulate_tick(dt, inputs):
+    """Avança a partida em um tick de dt segundos com a máscara de entrada dada.
+
+    Não lê o teclado nem desenha nada, então serve tanto ao loop do PgZero
+    quanto à simulação headless (step_many). Com vários jogadores, inputs é
+    uma sequência com uma máscara por jogador de players; jogadores sem vida
+    ficam parados e os inimigos os ignoram, e a partida acaba quando não
+    sobra nenhum.
+    """
+    global level_time, mode, waves_cleared, enemy_speed_scale
+    prof = profiler.enabled
+    t = time.perf_counter() if prof else 0.0
+
+    if replay_recorder is not None:
+        replay_recorder.record(inputs)
+
+    # Atualiza os temporizadores
+    level_time += dt
+    now = level_time
+
+    # Atualiza o jogador, cria os chunks de que ele se aproximou e, se ele
+    # mudou de ladrilho, recalcula o campo de fluxo dos inimigos
+    if len(players) == 1:
+        living = players
+        player.update(dt, inputs)
+    else:
+        living = [p for p in players if p.health > 0]
+        for p, mask in zip(players, inputs):
+            if p.health > 0:
+                p.update(dt, mask)
+    world.update(players)
+    flow_field.update([(p.x, p.y) for p in living])
+    if prof:
+        t = profiler.lap("player", t)
+
+    # Atualiza os itens (a lista só tem os que ainda não foram coletados)
+    for it in items:
+        it.update(dt)
+    if prof:
+        t = profiler.lap("items", t)
+
+    # Atualiza os inimigos dos chunks ativos (conforme o nível de detalhe da IA), mantendo a grade espacial em dia
+    ai_scheduler.update(world.active, dt, living, now)
+    if prof:
+        t = profiler.lap("enemies", t)
+
+    # Colisões com o jogador: só as entidades das células vizinhas são testadas
+    for p in living:
+        player_rect = p.rect()
+        for obj in entity_grid.query(player_rect):
+            if not rect_collide(obj.rect(), player_rect):
+                continue
+            if isinstance(obj, Item):
+                collect_item(obj)
+                p.score += ITEM_SCORE
+                safe_play_sound(SOUND_PICKUP)
+                spawn_burst(obj.x, obj.y, "pickup")
+            # Causa dano se não estiver invulnerável
+            elif p.take_damage(1, now):
+                # Quando o último jogador morre
+                if p.health <= 0 and all(q.health <= 0 for q in living):
+                    # Fim de jogo
+                    mode = "gameover"
+                    safe_stop_music()
+    if prof:
+        t = profiler.lap("collisions", t)
+
+    # Atualiza a horda vetorizada, se houver
+    if horde is not None:
+        horde.update(dt, player, now)
+        if prof:
+            t = profiler.lap("enemies", t)
+        if horde.collides(player.rect()) and player.take_damage(1, now):
+            if player.health <= 0:
+                mode = "gameover"
+                safe_stop_music()
+        if prof:
+            t = profiler.lap("collisions", t)
+
+    # Condição de vitória: coletar todos os itens
+    if not items:
+        # Pequena recompensa, gera novos itens e inimigos adicionais (progressivo)
+        for p in living:
+            p.score += WAVE_BONUS
+            spawn_burst(p.x, p.y, "wave")
+        waves_cleared += 1
+        new_enemy_count = enemy_room(WAVE_NEW_ENEMIES)
+        if new_enemy_count < WAVE_NEW_ENEMIES:
+            # No teto de inimigos a dificuldade sobe pela velocidade, não pela quantidade
+            enemy_speed_scale = min(ENEMY_MAX_SPEEDUP, enemy_speed_scale
+                                    + ENEMY_OVERFLOW_SPEEDUP * (WAVE_NEW_ENEMIES - new_enemy_count))
+        if new_enemy_count:
+            if horde is not None:
+                horde.spawn(new_enemy_count, area=world.region(ITEM_SPAWN_RADIUS))
+            else:
+                add_enemies(spawn_enemies(new_enemy_count))
+        # gera itens novamente, mas em menor quantidade
+        items.extend(generate_items(WAVE_ITEMS))
         for it in items:
-            if not it.collected:
-                it.update(dt)
-                if rect_collide(it.rect(), player.rect()):
-                    it.collected = True
-                    player_score_plus = 10
-                    player.score += player_score_plus
-                    safe_play_sound(SOUND_PICKUP)
-
-        # Atualiza os inimigos
-        for e in enemies:
-            e.update(dt, player, now)
-
-            # Verifica colisões com o jogador
-            if rect_collide(e.rect(), player.rect()):
-                # Causa dano se não estiver invulnerável
-                if player.take_damage(1, now):
-                    # Quando o jogador morre
-                    if player.health <= 0:
-                        # Fim de jogo
-                        mode = "gameover"
-                        safe_stop_music()
-
-        # Condição de vitória: coletar todos os itens
-        if all(it.collected for it in items):
-            # Pequena recompensa, gera novos itens e inimigos adicionais (progressivo)
-            player.score += 50
-            new_enemy_count = 2
-            enemies.extend(spawn_enemies(new_enemy_count))
-            # gera itens novamente, mas em menor quantidade
-            items[:] = generate_items(6)
+            entity_grid.insert(it, it.rect())
+    if prof:
+        t = profiler.lap("waves", t)
 
-    # Nenhum outro modo requer atualização
+    # Guarda o tick no buffer de rollback, se ligado
+    if rollback_buffer.enabled:
+        rollback_buffer.record()
+        if prof:
+            profiler.lap("snapshot", t)
 
 
-def draw_map():
-    """Desenha um chão de ladrilhos com algumas paredes nas bordas para dar uma sensação de masmorra."""
+# ----------------------------
+# SIMULAÇÃO HEADLESS
+# ----------------------------
+def start_headless_game(seed=None):
+    """Inicia uma partida sem janela: desliga áudio e desenho e prepara step_many()."""
+    global headless
+    headless = True
+    start_new_game(seed)
+
+
+def game_state():
+    """Resumo do estado atual da partida (usado como retorno de step_many)."""
+    return {
+        "mode": mode,
+        "level_time": level_time,
+        "score": player.score,
+        "health": player.health,
+        "player": (player.x, player.y),
+        "enemies": len(enemies) + (len(horde) if horde is not None else 0),
+        "items_left": len(items),
+        "enemy_speed": enemy_speed_scale,
+        "waves_cleared": waves_cleared,
+        "chunks": len(world.chunks),
+        "seed": session_seed,
+    }
+
+
+def bot_path_target(item):
+    """Ponto para onde o bot deve andar para chegar ao item pelo campo de fluxo (ou None).
+
+    O campo aponta de cada ladrilho rumo ao jogador; refazendo a corrente a
+    partir do ladrilho do item, o último ladrilho antes do jogador é o próximo passo.
+    """
+    col, row = dungeon.tile_at(item.x, item.y)
+    i = row * dungeon.cols + col
+    nxt = flow_field.next
+    if flow_field.origin is None or nxt[i] < 0 or nxt[i] == i:
+        return None
+    # A corrente termina num ladrilho de origem, o único que aponta para si mesmo
+    while nxt[nxt[i]] != nxt[i]:
+        i = nxt[i]
+    half = TILE_SIZE / 2
+    return ((i % dungeon.cols) * TILE_SIZE + half, (i // dungeon.cols) * TILE_SIZE + half)
+
+
+# Detecção de bot empacado: (x, y, instante) de referência e até quando forçar passagem
+_bot_anchor = None
+_bot_brave_until = 0.0
+
+
+def bot_input(tick=0):
+    """Bot roteirizado simples: vai até o item mais próximo e se afasta de inimigos por perto.
+
+    Serve como entrada para step_many (inputs=bot_input) em testes e no
+    balanceamento. O item mais próximo é medido pelo campo de fluxo (caminho
+    pelos corredores); só consulta os inimigos das células vizinhas da grade.
+    Se ficar BOT_STALL_TIME sem sair do lugar (um inimigo guardando o
+    corredor), ignora os inimigos por um tempo e força a passagem.
+    """
+    global _bot_anchor, _bot_brave_until
+    px, py = player.x, player.y
+    vx = vy = 0.0
+
+    if _bot_anchor is None or level_time < _bot_anchor[2]:
+        # Nova partida
+        _bot_anchor = (px, py, level_time)
+        _bot_brave_until = 0.0
+    elif level_time - _bot_anchor[2] >= BOT_STALL_TIME:
+        if math.hypot(px - _bot_anchor[0], py - _bot_anchor[1]) < TILE_SIZE:
+            _bot_brave_until = level_time + BOT_STALL_TIME
+        _bot_anchor = (px, py, level_time)
+
+    # Atração pelo item mais próximo: primeiro os alcançáveis pelo campo de fluxo,
+    # depois, em linha reta, os que estão além do alcance dele
+    best = None
+    best_key = (2, 0)
+    dist = flow_field.dist
+    cols = dungeon.cols
+    for it in items:
+        col, row = dungeon.tile_at(it.x, it.y)
+        steps = dist[row * cols + col] if dist else -1
+        key = (0, steps) if steps >= 0 else (1, (it.x - px) ** 2 + (it.y - py) ** 2)
+        if key < best_key:
+            best, best_key = it, key
+    if best is not None:
+        target = bot_path_target(best) or (best.x, best.y)
+        d = math.hypot(target[0] - px, target[1] - py)
+        if d > 0:
+            vx += (target[0] - px) / d
+            vy += (target[1] - py) / d
+
+    # Repulsão dos inimigos próximos, mais forte quanto mais perto
+    radius = BOT_DANGER_RADIUS if level_time >= _bot_brave_until else 0
+    area = Rect(int(px - radius), int(py - radius), 2 * radius, 2 * radius)
+    for obj in entity_grid.query(area):
+        if isinstance(obj, Enemy):
+            dx = px - obj.x
+            dy = py - obj.y
+            d = math.hypot(dx, dy)
+            if 0 < d < radius:
+                weight = 2.0 * (1 - d / radius)
+                vx += dx / d * weight
+                vy += dy / d * weight
+
+    # Não insiste contra paredes: descarta o eixo cujo movimento está bloqueado
+    hw = player.width / 2
+    hh = player.height / 2
+    if vx and not dungeon.box_free(px + math.copysign(4, vx), py, hw, hh):
+        vx = 0.0
+    if vy and not dungeon.box_free(px, py + math.copysign(4, vy), hw, hh):
+        vy = 0.0
+
+    inputs = 0
+    threshold = 0.35 * math.hypot(vx, vy)
+    if vx < -threshold:
+        inputs |= INPUT_LEFT
+    elif vx > threshold:
+        inputs |= INPUT_RIGHT
+    if vy < -threshold:
+        inputs |= INPUT_UP
+    elif vy > threshold:
+        inputs |= INPUT_DOWN
+    return inputs
+
+
+def state_digest():
+    """Hash do estado completo da simulação, para verificar reprodução bit a bit."""
+    h = hashlib.sha1()
+    p = player
+    h.update(struct.pack("<11d", level_time, p.x, p.y, p.health, p.score, p.invulnerable_until,
+                         p.direction[0], p.direction[1], p.frame, p.frame_timer, p.idle_timer))
+    h.update(struct.pack("<qd", ai_scheduler.tick, enemy_speed_scale))
+    for q in players[1:]:
+        h.update(struct.pack("<5d", q.x, q.y, q.health, q.score, q.invulnerable_until))
+    h.update(repr(sorted(world.chunks)).encode())
+    h.update(dungeon.tiles)
+    for e in enemies:
+        h.update(struct.pack("<12d", e.x, e.y, e.speed, e.target[0], e.target[1], e.frame,
+                             e.frame_timer, e.pause_until, e.is_alert, e.chase_timeout,
+                             e.ai_next_tick, e.ai_dt))
+    for it in items:
+        h.update(struct.pack("<4d", it.x, it.y, it.collected, it.pulse_timer))
+    if horde is not None:
+        for name in EnemyHorde.FIELDS:
+            h.update(getattr(horde, name).tobytes())
+    h.update(repr(rng.getstate()).encode())
+    return h.hexdigest()
+
+
+def step_many(ticks, inputs=0, dt=SIM_DT):
+    """Avança a simulação ticks vezes o mais rápido possível, sem desenhar.
+
+    inputs pode ser uma máscara INPUT_* fixa, uma sequência de máscaras (uma
+    por tick; depois que acaba o jogador fica parado) ou uma função
+    inputs(tick) -> máscara para bots roteirizados. Para antes se a partida
+    terminar. Retorna game_state() com o número de ticks realmente simulados
+    em "ticks".
+    """
+    if callable(inputs):
+        next_input = inputs
+    elif isinstance(inputs, int):
+        next_input = lambda tick: inputs
+    else:
+        recorded = list(inputs)
+        next_input = lambda tick: recorded[tick] if tick < len(recorded) else 0
+
+    done = 0
+    for tick in range(ticks):
+        if mode != "playing":
+            break
+        simulate_tick(dt, next_input(tick))
+        if profiler.enabled:
+            profiler.end_frame()
+        done += 1
+
+    state = game_state()
+    state["ticks"] = done
+    return state
+
+
+# ----------------------------
+# SNAPSHOTS (SALVAR, RESTAURAR E ROLLBACK)
+# ----------------------------
+SNAPSHOT_MAGIC = b"CLE\x01"  # muda quando o formato muda
+SNAPSHOT_MODES = ("menu", "playing", "gameover", "quit")
+# Cabeçalho: modo, relógio e contadores da partida, tamanho da masmorra e de cada seção
+_SNAP_HEADER = struct.Struct("<4sBdqqdqdqhhHHIIIi")
+_SNAP_PLAYER = struct.Struct("<10d3q")
+_SNAP_RNG = struct.Struct("<625I?d")  # estado do Mersenne Twister de rng
+_SNAP_ENEMY = struct.Struct("<14db?q")
+_SNAP_ITEM = struct.Struct("<3d")
+_SNAP_HORDE_RNG = struct.Struct("<16s16s?I")  # estado do PCG64 da horda
+
+
+def save_snapshot():
+    """Estado completo da simulação, geradores aleatórios incluídos, num buffer binário compacto.
+
+    Só entra o que não dá para refazer: a grade espacial, o campo de fluxo e a
+    lista de inimigos ativos são recalculados por restore_snapshot(). Cobre a
+    partida de um jogador; os jogadores extras do servidor não entram.
+    """
+    p = player
+    center = world.center if world.center is not None else (-1, -1)
+    parts = [
+        _SNAP_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_MODES.index(mode), level_time, player_score,
+                          waves_cleared, enemy_speed_scale,
+                          session_seed if session_seed is not None else -1, sim_accumulator,
+                          ai_scheduler.tick, center[0], center[1], dungeon.cols, dungeon.rows,
+                          len(world.chunks), len(enemies), len(items),
+                          len(horde) if horde is not None else -1),
+        _SNAP_PLAYER.pack(p.x, p.y, p.prev_x, p.prev_y, p.direction[0], p.direction[1], p.speed,
+                          p.frame_timer, p.idle_timer, p.invulnerable_until, p.frame, p.health, p.score),
+    ]
+    _, internal, gauss = rng.getstate()
+    parts.append(_SNAP_RNG.pack(*internal, gauss is not None, gauss or 0.0))
+    parts.append(dungeon.packed())
+    coords = [v for c in world.chunks for v in c]
+    parts.append(struct.pack("<%dh" % len(coords), *coords))
+    pack = _SNAP_ENEMY.pack
+    parts += [pack(e.x, e.y, e.prev_x, e.prev_y, e.territory_center[0], e.territory_center[1],
+                   e.territory_radius, e.speed, e.target[0], e.target[1], e.frame_timer,
+                   e.pause_until, e.chase_timeout, e.ai_dt, e.frame, e.is_alert, e.ai_next_tick)
+              for e in enemies]
+    pack = _SNAP_ITEM.pack
+    parts += [pack(it.x, it.y, it.pulse_timer) for it in items]
+    if horde is not None:
+        state = horde.rng.bit_generator.state
+        parts.append(_SNAP_HORDE_RNG.pack(state["state"]["state"].to_bytes(16, "little"),
+                                          state["state"]["inc"].to_bytes(16, "little"),
+                                          bool(state["has_uint32"]), state["uinteger"]))
+        parts += [getattr(horde, name).tobytes() for name in EnemyHorde.FIELDS]
+    return b"".join(parts)
+
+
+def restore_snapshot(data):
+    """Volta a simulação exatamente ao estado salvo por save_snapshot(data).
+
+    Reaproveita os Enemy e Item em jogo (e os dos pools) em vez de criar
+    objetos novos. Lança ValueError, sem mexer em nada, se data não for um
+    snapshot válido para esta masmorra.
+    """
+    global mode, level_time, player_score, waves_cleared, enemy_speed_scale
+    global session_seed, sim_accumulator, render_alpha, horde
+    if len(data) < _SNAP_HEADER.size or data[:4] != SNAPSHOT_MAGIC:
+        raise ValueError("não é um snapshot deste jogo (ou é de uma versão antiga)")
+    (_, mode_index, time_, score, waves, speed_scale, seed, accumulator, tick, center_c, center_r,
+     cols, rows, n_chunks, n_enemies, n_items, n_horde) = _SNAP_HEADER.unpack_from(data)
+    if (cols, rows) != (dungeon.cols, dungeon.rows):
+        raise ValueError(f"snapshot de uma masmorra {cols}x{rows}, esperado {dungeon.cols}x{dungeon.rows}")
+    tiles_size = (cols * rows + 7) // 8
+    size = (_SNAP_HEADER.size + _SNAP_PLAYER.size + _SNAP_RNG.size + tiles_size + 4 * n_chunks
+            + _SNAP_ENEMY.size * n_enemies + _SNAP_ITEM.size * n_items)
+    target = None
+    if n_horde >= 0:
+        if np is None:
+            raise ValueError("snapshot do modo horda, que requer NumPy")
+        target = horde if horde is not None else EnemyHorde(seed=0)
+        size += _SNAP_HORDE_RNG.size + n_horde * sum(getattr(target, name).dtype.itemsize
+                                                     for name in EnemyHorde.FIELDS)
+    if len(data) != size:
+        raise ValueError(f"snapshot com {len(data)} bytes, esperado {size}")
+
+    view = memoryview(data)
+    offset = _SNAP_HEADER.size
+    p = player
+    (p.x, p.y, p.prev_x, p.prev_y, dx, dy, p.speed, p.frame_timer, p.idle_timer,
+     p.invulnerable_until, p.frame, p.health, p.score) = _SNAP_PLAYER.unpack_from(data, offset)
+    p.direction = (dx, dy)
+    offset += _SNAP_PLAYER.size
+    rng_state = _SNAP_RNG.unpack_from(data, offset)
+    offset += _SNAP_RNG.size
+    if dungeon.load_packed(bytes(view[offset:offset + tiles_size])):
+        flow_field.reset()
+    offset += tiles_size
+    coords = struct.unpack_from("<%dh" % (2 * n_chunks), data, offset)
+    offset += 4 * n_chunks
+
+    # Inimigos e itens: sobras saem da grade espacial e voltam ao pool, faltas
+    # saem do pool (o sorteio que reset() faz não importa, rng é restaurado no fim)
+    for obj in enemies[n_enemies:] + items[n_items:]:
+        entity_grid.remove(obj)
+    enemy_pool.release_all(enemies[n_enemies:])
+    del enemies[n_enemies:]
+    while len(enemies) < n_enemies:
+        enemies.append(enemy_pool.acquire(0.0, 0.0, ENEMY_MIN_PATROL))
+    end = offset + _SNAP_ENEMY.size * n_enemies
+    for e, rec in zip(enemies, _SNAP_ENEMY.iter_unpack(view[offset:end])):
+        (e.x, e.y, e.prev_x, e.prev_y, cx, cy, e.territory_radius, e.speed, tx, ty, e.frame_timer,
+         e.pause_until, e.chase_timeout, e.ai_dt, e.frame, e.is_alert, e.ai_next_tick) = rec
+        e.territory_center = (cx, cy)
+        e.target = (tx, ty)
+    offset = end
+    item_pool.release_all(items[n_items:])
+    del items[n_items:]
+    while len(items) < n_items:
+        items.append(item_pool.acquire(0, 0))
+    end = offset + _SNAP_ITEM.size * n_items
+    for it, rec in zip(items, _SNAP_ITEM.iter_unpack(view[offset:end])):
+        it.x, it.y, it.pulse_timer = rec
+        it.collected = False
+    offset = end
+
+    if target is not None:
+        state_bytes, inc_bytes, has_uint32, uinteger = _SNAP_HORDE_RNG.unpack_from(data, offset)
+        offset += _SNAP_HORDE_RNG.size
+        target.rng.bit_generator.state = {
+            "bit_generator": "PCG64",
+            "state": {"state": int.from_bytes(state_bytes, "little"),
+                      "inc": int.from_bytes(inc_bytes, "little")},
+            "has_uint32": int(has_uint32),
+            "uinteger": uinteger,
+        }
+        for name in EnemyHorde.FIELDS:
+            dtype = getattr(target, name).dtype
+            setattr(target, name, np.frombuffer(data, dtype, n_horde, offset).copy())
+            offset += dtype.itemsize * n_horde
+    horde = target
+
+    # Estado derivado: chunks e inimigos ativos, grade espacial (insert() só
+    # mexe nas células de quem mudou de lugar), campo de fluxo
+    world.restore([(coords[i], coords[i + 1]) for i in range(0, len(coords), 2)],
+                  (center_c, center_r) if center_c >= 0 else None, enemies)
+    insert = entity_grid.insert
+    for e in enemies:
+        insert(e, e.rect())
+    for it in items:
+        insert(it, it.rect())
+    flow_field.update([(p.x, p.y)])
+    ai_scheduler.tick = tick
+
+    mode = SNAPSHOT_MODES[mode_index]
+    level_time = time_
+    player_score = score
+    waves_cleared = waves
+    enemy_speed_scale = speed_scale
+    session_seed = seed if seed >= 0 else None
+    sim_accumulator = accumulator
+    render_alpha = accumulator / SIM_DT
+    rng.setstate((3, rng_state[:625], rng_state[626] if rng_state[625] else None))
+    dirty_renderer.invalidate()
+
+
+class SnapshotRing:
+    """Buffer circular com os snapshots dos últimos capacity ticks, base para o rollback.
+
+    Com enabled ligado, simulate_tick() grava um snapshot no fim de cada tick;
+    rollback(n) restaura o estado de n ticks atrás e descarta os mais novos.
+    """
+
+    def __init__(self, capacity=ROLLBACK_FRAMES):
+        self.frames = deque(maxlen=capacity)
+        self.enabled = False
+
+    def __len__(self):
+        return len(self.frames)
+
+    def clear(self):
+        self.frames.clear()
+
+    def record(self):
+        self.frames.append(save_snapshot())
+
+    def rollback(self, ticks=1):
+        """Volta ticks ticks (no máximo até o snapshot mais antigo); retorna quantos voltou."""
+        if not self.frames:
+            return 0
+        ticks = min(ticks, len(self.frames) - 1)
+        for _ in range(ticks):
+            self.frames.pop()
+        restore_snapshot(self.frames[-1])
+        return ticks
+
+
+rollback_buffer = SnapshotRing()
+
+
+def quick_save(path=QUICKSAVE_FILE):
+    """Grava um snapshot da partida em path (com tratamento de erros)."""
+    try:
+        with open(path, "wb") as f:
+            f.write(save_snapshot())
+    except OSError as e:
+        print(f"Não foi possível salvar a partida em {path}: {e}")
+        return False
+    return True
+
+
+def quick_load(path=QUICKSAVE_FILE):
+    """Retoma a partida gravada por quick_save() (com tratamento de erros)."""
+    try:
+        with open(path, "rb") as f:
+            restore_snapshot(f.read())
+    except (OSError, ValueError) as e:
+        print(f"Não foi possível carregar a partida de {path}: {e}")
+        return False
+    rollback_buffer.clear()
+    return True
+
+
+# ----------------------------
+# REPLAYS (ENTRADAS GRAVADAS E KEYFRAMES)
+# ----------------------------
+REPLAY_MAGIC = b"CLR\x03"  # muda quando o formato muda (ou quando as mesmas entradas deixam de dar a mesma partida)
+# semente, SIM_HZ, tick da partida em que a gravação começa, ticks, número de trechos RLE e de keyframes
+_REPLAY_HEADER = struct.Struct("<4sqHIIII")
+_REPLAY_RUN = struct.Struct("<BH")  # máscara, ticks seguidos com ela
+_REPLAY_KEYFRAME = struct.Struct("<II")  # tick, bytes do snapshot comprimido
+
+
+class Replay:
+    """Partida gravada: a máscara de entrada de cada tick em RLE e keyframes periódicos.
+
+    Os keyframes são snapshots (save_snapshot, comprimidos com zlib) tirados
+    a cada keyframe_interval ticks, antes de o tick rodar; o de número 0 é o
+    início da gravação. Com eles ReplayPlayer.seek() vai a qualquer tick
+    simulando no máximo keyframe_interval ticks. Os ticks são contados a
+    partir de start_tick, o tick da partida em que a gravação começou (0,
+    exceto depois de carregar um snapshot ou voltar no tempo).
+    """
+
+    def __init__(self, seed=None, keyframe_interval=int(REPLAY_KEYFRAME_SECONDS * SIM_HZ), start_tick=0):
+        self.seed = seed
+        self.keyframe_interval = keyframe_interval
+        self.start_tick = start_tick
+        self.ticks = 0
+        self.run_masks = []  # máscara de cada trecho
+        self.run_ends = []  # tick (exclusivo) em que cada trecho acaba
+        self.keyframes = []  # (tick, snapshot comprimido), em ordem de tick
+
+    def record(self, mask):
+        """Grava a entrada do próximo tick (chamado por simulate_tick antes de simular)."""
+        if self.ticks % self.keyframe_interval == 0:
+            self.keyframes.append((self.ticks, zlib.compress(save_snapshot(), 1)))
+        self.ticks += 1
+        if self.run_masks and self.run_masks[-1] == mask:
+            self.run_ends[-1] = self.ticks
+        else:
+            self.run_masks.append(mask)
+            self.run_ends.append(self.ticks)
+
+    def truncate(self, tick):
+        """Descarta o que foi gravado a partir de tick (depois de um rollback)."""
+        if tick >= self.ticks:
+            return
+        i = bisect_left(self.run_ends, tick)
+        start = self.run_ends[i - 1] if i else 0
+        if start == tick:
+            del self.run_masks[i:], self.run_ends[i:]
+        else:
+            self.run_ends[i] = tick
+            del self.run_masks[i + 1:], self.run_ends[i + 1:]
+        while self.keyframes and self.keyframes[-1][0] > tick:
+            self.keyframes.pop()
+        self.ticks = tick
+
+    def input_at(self, tick):
+        """Máscara de entrada do tick (0 depois do fim)."""
+        i = bisect_right(self.run_ends, tick)
+        return self.run_masks[i] if i < len(self.run_masks) else 0
+
+    def keyframe_before(self, tick):
+        """(tick, snapshot) do último keyframe em ou antes de tick."""
+        i = bisect_right(self.keyframes, tick, key=lambda k: k[0]) - 1
+        kf_tick, data = self.keyframes[max(0, i)]
+        return kf_tick, zlib.decompress(data)
+
+    def to_bytes(self):
+        runs = []
+        start = 0
+        for mask, end in zip(self.run_masks, self.run_ends):
+            # Trechos mais longos que o contador de 16 bits são divididos
+            count = end - start
+            while count:
+                n = min(count, 0xFFFF)
+                runs.append(_REPLAY_RUN.pack(mask, n))
+                count -= n
+            start = end
+        parts = [_REPLAY_HEADER.pack(REPLAY_MAGIC, self.seed if self.seed is not None else -1, SIM_HZ,
+                                     self.start_tick, self.ticks, len(runs), len(self.keyframes))]
+        parts += runs
+        for tick, data in self.keyframes:
+            parts.append(_REPLAY_KEYFRAME.pack(tick, len(data)))
+            parts.append(data)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Lê um replay de to_bytes(); lança ValueError se não for um replay válido."""
+        if len(data) < _REPLAY_HEADER.size or data[:4] != REPLAY_MAGIC:
+            raise ValueError("não é um replay deste jogo (ou é de uma versão antiga)")
+        _, seed, hz, start_tick, ticks, n_runs, n_keyframes = _REPLAY_HEADER.unpack_from(data)
+        if hz != SIM_HZ:
+            raise ValueError(f"replay gravado a {hz} ticks/s, o jogo roda a {SIM_HZ}")
+        replay = cls(seed if seed >= 0 else None, start_tick=start_tick)
+        offset = _REPLAY_HEADER.size
+        end = 0
+        try:
+            for mask, count in _REPLAY_RUN.iter_unpack(data[offset:offset + n_runs * _REPLAY_RUN.size]):
+                end += count
+                if replay.run_masks and replay.run_masks[-1] == mask:
+                    replay.run_ends[-1] = end
+                else:
+                    replay.run_masks.append(mask)
+                    replay.run_ends.append(end)
+            offset += n_runs * _REPLAY_RUN.size
+            for _ in range(n_keyframes):
+                tick, size = _REPLAY_KEYFRAME.unpack_from(data, offset)
+                offset += _REPLAY_KEYFRAME.size
+                replay.keyframes.append((tick, data[offset:offset + size]))
+                offset += size
+        except struct.error as e:
+            raise ValueError(f"replay truncado: {e}") from None
+        if end != ticks or not replay.keyframes or replay.keyframes[0][0] != 0:
+            raise ValueError("replay corrompido")
+        if len(replay.keyframes) > 1:
+            replay.keyframe_interval = replay.keyframes[1][0]
+        replay.ticks = ticks
+        return replay
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+class ReplayPlayer:
+    """Reproduz um Replay: headless o mais rápido possível (step) ou no loop do jogo (next_input)."""
+
+    def __init__(self, replay, speed=1.0):
+        self.replay = replay
+        self.speed = speed
+
+    @property
+    def tick(self):
+        return ai_scheduler.tick - self.replay.start_tick  # ticks simulados desde o início da gravação
+
+    def done(self):
+        return self.tick >= self.replay.ticks
+
+    def next_input(self):
+        """Máscara do próximo tick; é o inputs de advance_simulation durante a reprodução."""
+        return self.replay.input_at(self.tick)
+
+    def seek(self, tick):
+        """Vai ao tick: restaura o keyframe anterior (se preciso) e simula só o trecho que falta."""
+        global headless
+        tick = max(0, min(tick, self.replay.ticks))
+        kf_tick, data = self.replay.keyframe_before(tick)
+        if not (kf_tick <= self.tick <= tick and mode == "playing"):
+            restore_snapshot(data)
+        # Sem sons enquanto avança
+        was_headless = headless
+        headless = True
+        try:
+            while self.tick < tick and mode == "playing":
+                simulate_tick(SIM_DT, self.next_input())
+        finally:
+            headless = was_headless
+        dirty_renderer.invalidate()
+
+    def step(self, ticks=None):
+        """Avança headless até ticks ticks (padrão: o fim do replay); retorna game_state()."""
+        remaining = self.replay.ticks - self.tick
+        return step_many(remaining if ticks is None else min(ticks, remaining),
+                         lambda _: self.next_input())
+
+
+replay_recorder = None  # Replay da partida em andamento, se estiver gravando
+replay_player = None  # ReplayPlayer do replay que está passando na tela
+
+
+def finish_recording():
+    """Para a gravação e salva o replay em REPLAY_DIR (com tratamento de erros)."""
+    global replay_recorder
+    replay, replay_recorder = replay_recorder, None
+    if replay is None or not replay.ticks:
+        return None
+    path = os.path.join(REPLAY_DIR, time.strftime("%Y%m%d-%H%M%S") + f"-{replay.seed}.replay")
+    try:
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+        replay.save(path)
+    except OSError as e:
+        print(f"Não foi possível salvar o replay em {path}: {e}")
+        return None
+    print(f"Replay salvo em {path}")
+    return path
+
+
+def restart_recording():
+    """Salva a gravação em andamento e começa outra a partir do estado atual (depois de um snapshot)."""
+    global replay_recorder
+    finish_recording()
+    if REPLAY_RECORD and not headless and horde is None and mode == "playing":
+        replay_recorder = Replay(session_seed, start_tick=ai_scheduler.tick)
+
+
+def start_replay(replay, speed=1.0):
+    """Passa um Replay (ou o arquivo de um) na tela, do começo."""
+    global replay_player, replay_recorder
+    if not isinstance(replay, Replay):
+        try:
+            replay = Replay.load(replay)
+        except (OSError, ValueError) as e:
+            print(f"Não foi possível abrir o replay {replay}: {e}")
+            return False
+    finish_recording()
+    replay_player = ReplayPlayer(replay, speed)
+    replay_player.seek(0)
+    rollback_buffer.clear()
+    safe_play_music(BGM_FILENAME)
+    return True
+
+
+def stop_replay():
+    global replay_player, mode
+    replay_player = None
+    mode = "menu"
+    safe_stop_music()
+
+
+def run_replay(replay):
+    """Reproduz o replay inteiro headless, o mais rápido possível; retorna game_state() no fim."""
+    global headless
+    headless = True
+    if not isinstance(replay, Replay):
+        replay = Replay.load(replay)
+    playback = ReplayPlayer(replay)
+    playback.seek(0)
+    return playback.step()
+
+
+# ----------------------------
+# CAMADA DE FUNDO PRÉ-RENDERIZADA
+# ----------------------------
+# O chão e as paredes nunca mudam durante a partida, então o chão de cada chunk
+# é desenhado uma única vez numa Surface fora da tela (quando aparece pela
+# primeira vez) e depois apenas copiado (blit). Só os chunks que cruzam a
+# visão da câmera são desenhados; os menos usados saem do cache.
+_chunk_layers = OrderedDict()  # (coluna, linha) -> Surface
+_map_layer_key = None
+
+
+def map_layer_key():
+    """Tudo aquilo de que a camada de fundo depende; se algo mudar, ela é refeita."""
+    return (TILE_SIZE, CHUNK_SIZE, MAP_COLS, MAP_ROWS, dungeon.version,
+            COLOR_BG, COLOR_FLOOR, COLOR_FLOOR_ALT, COLOR_WALL)
+
+
+def render_chunk_layer(coords):
+    """Renderiza o chão e as paredes dos ladrilhos de um chunk numa nova Surface."""
+    cs = CHUNK_SIZE
+    left = coords[0] * cs
+    top = coords[1] * cs
+    surf = pygame.Surface((cs, cs))
     # fundo do chão
-    screen.fill(COLOR_BG)
-    # chão com padrão simples: ladrilhos alternados
-    for r in range(MAP_ROWS):
-        for c in range(MAP_COLS):
-            x = c * TILE_SIZE
-            y = r * TILE_SIZE
-            # pequena variação
-            if (r + c) % 2 == 0:
-                screen.draw.filled_rect(Rect(x, y, TILE_SIZE, TILE_SIZE), COLOR_FLOOR)
+    surf.fill(COLOR_BG)
+    # chão com padrão simples (ladrilhos alternados) e paredes da masmorra
+    for r in range(top // TILE_SIZE, min(MAP_ROWS, (top + cs) // TILE_SIZE)):
+        for c in range(left // TILE_SIZE, min(MAP_COLS, (left + cs) // TILE_SIZE)):
+            if dungeon.solid(c, r):
+                color = COLOR_WALL
             else:
-                screen.draw.filled_rect(Rect(x, y, TILE_SIZE, TILE_SIZE), (24, 24, 34))
+                # pequena variação
+                color = COLOR_FLOOR if (r + c) % 2 == 0 else COLOR_FLOOR_ALT
+            surf.fill(color, Rect(c * TILE_SIZE - left, r * TILE_SIZE - top, TILE_SIZE, TILE_SIZE))
+
+    # Converte para o formato da tela (quando já existe) para acelerar o blit
+    if pygame.display.get_surface() is not None:
+        surf = surf.convert()
+    return surf
+
+
+def get_chunk_layer(coords):
+    """Retorna o chão do chunk em cache, refazendo tudo se o tamanho, a paleta ou o mapa mudaram."""
+    global _map_layer_key
+    key = map_layer_key()
+    if key != _map_layer_key:
+        _chunk_layers.clear()
+        _map_layer_key = key
+    surf = _chunk_layers.get(coords)
+    if surf is None:
+        surf = _chunk_layers[coords] = render_chunk_layer(coords)
+        if len(_chunk_layers) > CHUNK_SURFACE_CACHE:
+            _chunk_layers.popitem(last=False)
+    else:
+        _chunk_layers.move_to_end(coords)
+    return surf
+
+
+def invalidate_map_layer():
+    """Descarta a camada de fundo; ela será refeita no próximo draw_map()."""
+    global _map_layer_key
+    _chunk_layers.clear()
+    _map_layer_key = None
+    dirty_renderer.invalidate()
+
+
+def draw_background(target, area: Rect):
+    """Copia para target o fundo sob area (em coordenadas de tela), chunk a chunk."""
+    ox, oy = camera.x, camera.y
+    view = area.move(ox, oy).clip(world.bounds)
+    if view.size != area.size:
+        # Parte da área cai fora do mundo (mundo menor que a tela)
+        target.fill(COLOR_BG, area)
+    if not view:
+        return
+    cs = CHUNK_SIZE
+    for r in range(view.top // cs, (view.bottom - 1) // cs + 1):
+        for c in range(view.left // cs, (view.right - 1) // cs + 1):
+            part = view.clip(Rect(c * cs, r * cs, cs, cs))
+            target.blit(get_chunk_layer((c, r)), (part.x - ox, part.y - oy),
+                        part.move(-c * cs, -r * cs))
 
-    # paredes simples: borda
-    wall_thickness = 6
-    screen.draw.filled_rect(Rect(0, 0, WIDTH, wall_thickness), COLOR_WALL)
-    screen.draw.filled_rect(Rect(0, 0, wall_thickness, HEIGHT), COLOR_WALL)
-    screen.draw.filled_rect(Rect(0, HEIGHT - wall_thickness, WIDTH, wall_thickness), COLOR_WALL)
-    screen.draw.filled_rect(Rect(WIDTH - wall_thickness, 0, wall_thickness, HEIGHT), COLOR_WALL)
+
+def draw_map():
+    """Desenha o chão de ladrilhos e as paredes da masmorra visíveis pela câmera."""
+    draw_background(screen.surface, screen.surface.get_rect())
 
 
 def draw_hud():
@@ -557,76 +3384,269 @@ def draw_hud():
         x = 12 + i * 28
         y = 12
         if i < player.health:
-            screen.draw.filled_rect(Rect(x, y, 20, 12), (220, 50, 50))
+            render.fill((x, y, 20, 12), (220, 50, 50))
         else:
-            screen.draw.rect(Rect(x, y, 20, 12), (90, 90, 90))
+            render.outline((x, y, 20, 12), (90, 90, 90))
 
     # Pontuação
-    screen.draw.text(f"Score: {player.score}", (WIDTH - 180, 12), fontsize=28, color=COLOR_TEXT)
-    # Dicas
-    screen.draw.text("M para alternar música  •  ESC para ir ao menu", (12, HEIGHT - 28), fontsize=18, color=(160, 160, 160))
+    draw_text(score_text(player.score), (WIDTH - 180, 12), fontsize=28, color=COLOR_TEXT)
+    # Dicas (ou a posição e a velocidade do replay que está passando)
+    if replay_player is not None:
+        draw_text(replay_status_text(), (12, HEIGHT - 28), fontsize=18, color=COLOR_HIGHLIGHT)
+    else:
+        draw_text("M para alternar música  •  ESC para ir ao menu", (12, HEIGHT - 28), fontsize=18, color=(160, 160, 160))
+    render.flush()
+
+
+def replay_status_text():
+    """Linha de status do replay; muda só a cada segundo de jogo (o texto fica no TextCache)."""
+    now = replay_player.tick // SIM_HZ
+    total = replay_player.replay.ticks // SIM_HZ
+    return (f"REPLAY {replay_player.speed:g}x   {now // 60:02d}:{now % 60:02d} / {total // 60:02d}:{total % 60:02d}"
+            f"   •  setas {REPLAY_SEEK_SECONDS:g} s  •  +/- velocidade  •  ESC sai")
 
 
 def draw():
     """Hook de desenho principal chamado pelo PgZero a cada frame."""
+    global frames_drawn
+    frames_drawn += 1
     screen.surface.set_alpha(None)  # garante que não haja alfa estranho
+    if mode in ("playing", "gameover"):
+        # A câmera segue a posição interpolada do jogador
+        camera.follow(*player.render_pos())
+    if dirty_rendering and draw_dirty():
+        render.end_frame()
+        governor.end_frame()
+        if profiler.enabled:
+            profiler.end_frame()
+        return
+    draw_frame()
+    if profiler.enabled and profiler.overlay:
+        render.flush()
+        draw_profiler_overlay()
+    render.end_frame()
+    governor.end_frame()
+    if dirty_rendering:
+        dirty_renderer.full_frame_drawn()
+    if profiler.enabled:
+        profiler.end_frame()
+
+
+def draw_frame():
+    """Desenha a tela inteira do modo atual."""
     if mode == "menu":
         # Fundo do menu
         screen.fill(MENU_BG_COLOR)
         # Título
-        screen.draw.text(TITLE, center=(WIDTH // 2, HEIGHT // 2 - 140), fontsize=46, color=COLOR_TEXT, owidth=1)
+        draw_text(TITLE, center=(WIDTH // 2, HEIGHT // 2 - 140), fontsize=46, color=COLOR_TEXT, owidth=1)
         # Subtítulo
-        screen.draw.text("Um projeto prático compacto de rogue-lite", center=(WIDTH // 2, HEIGHT // 2 - 100), fontsize=20, color=(180, 180, 200))
+        draw_text("Um projeto prático compacto de rogue-lite", center=(WIDTH // 2, HEIGHT // 2 - 100), fontsize=20, color=(180, 180, 200))
         # Botões
         btn_start.draw()
         btn_music.draw()
         btn_exit.draw()
 
         # Pequenos créditos
-        screen.draw.text("Controles: Setas / WASD para mover", (WIDTH // 2, HEIGHT - 60), fontsize=16, color=(170, 170, 170), align="center")
-        screen.draw.text("Música e som: alterne com o botão ou pressione M", (WIDTH // 2, HEIGHT - 40), fontsize=14, color=(140, 140, 140), align="center")
+        draw_text("Controles: Setas / WASD para mover", (WIDTH // 2, HEIGHT - 60), fontsize=16, color=(170, 170, 170), align="center")
+        draw_text("Música e som: alterne com o botão ou pressione M", (WIDTH // 2, HEIGHT - 40), fontsize=14, color=(140, 140, 140), align="center")
         return
 
     if mode == "quit":
         screen.fill((10, 10, 12))
-        screen.draw.text("Até logo!", center=(WIDTH // 2, HEIGHT // 2), fontsize=48, color=COLOR_TEXT)
-        screen.draw.text("Feche esta janela para sair.", center=(WIDTH // 2, HEIGHT // 2 + 64), fontsize=20, color=(160, 160, 160))
+        draw_text("Até logo!", center=(WIDTH // 2, HEIGHT // 2), fontsize=48, color=COLOR_TEXT)
+        draw_text("Feche esta janela para sair.", center=(WIDTH // 2, HEIGHT // 2 + 64), fontsize=20, color=(160, 160, 160))
         return
 
     if mode == "gameover":
         # Desenha o mapa do último frame como fundo (simples)
         draw_map()
-        for it in items:
-            if not it.collected:
-                it.draw()
-        for e in enemies:
-            e.draw(level_time)
-        player.draw(level_time)
+        draw_playfield()
 
         # Sobrepõe a tela de fim de jogo
-        screen.draw.filled_rect(Rect(WIDTH // 2 - 200, HEIGHT // 2 - 80, 400, 160), (20, 20, 30))
-        screen.draw.text("FIM DE JOGO", center=(WIDTH // 2, HEIGHT // 2 - 20), fontsize=48, color=(210, 60, 60))
-        screen.draw.text(f"Pontuação Final: {player.score}", center=(WIDTH // 2, HEIGHT // 2 + 20), fontsize=28, color=COLOR_TEXT)
-        screen.draw.text("Pressione Start no menu para tentar novamente", center=(WIDTH // 2, HEIGHT // 2 + 56), fontsize=16, color=(160, 160, 160))
+        render.fill((WIDTH // 2 - 200, HEIGHT // 2 - 80, 400, 160), (20, 20, 30))
+        draw_text("FIM DE JOGO", center=(WIDTH // 2, HEIGHT // 2 - 20), fontsize=48, color=(210, 60, 60))
+        draw_text(f"Pontuação Final: {player.score}", center=(WIDTH // 2, HEIGHT // 2 + 20), fontsize=28, color=COLOR_TEXT)
+        draw_text("Pressione Start no menu para tentar novamente", center=(WIDTH // 2, HEIGHT // 2 + 56), fontsize=16, color=(160, 160, 160))
         return
 
     # modo == "playing" (jogando)
+    prof = profiler.enabled
+    t = time.perf_counter() if prof else 0.0
     draw_map()
+    if prof:
+        t = profiler.lap("draw_map", t)
+    draw_playfield()
+    if prof:
+        t = profiler.lap("draw_entities", t)
 
+    # HUD
+    draw_hud()
+    if prof:
+        profiler.lap("draw_hud", t)
+
+
+def visible_entities():
+    """Itens não coletados e inimigos cujos sprites cruzam a visão da câmera."""
+    view = camera.view_rect()
+    ew, eh = ENEMY_SPRITE_SIZE
+    enemy_view = view.inflate(2 * ew, 2 * eh)
+    item_view = view.inflate(20, 20)
+    visible_items = [it for it in items if item_view.collidepoint(it.x, it.y)]
+    visible_enemies = [e for e in world.enemies_near(view) if enemy_view.collidepoint(e.x, e.y)]
+    return visible_items, visible_enemies
+
+
+def draw_playfield():
+    """Desenha itens, inimigos e jogador visíveis por cima do mapa."""
+    visible_items, visible_enemies = visible_entities()
     # Desenha os itens
-    for it in items:
-        if not it.collected:
-            it.draw()
+    for it in visible_items:
+        it.draw()
 
-    # Desenha os inimigos
-    for e in enemies:
-        e.draw(level_time)
+    # Desenha os inimigos (em qualidade baixa, só os perto do jogador)
+    if governor.level >= QUALITY_NEAR_ONLY:
+        px, py = player.x, player.y
+        near2 = QUALITY_NEAR_RADIUS ** 2
+        visible_enemies = [e for e in visible_enemies if (e.x - px) ** 2 + (e.y - py) ** 2 < near2]
+    draw_enemies(visible_enemies)
+    if horde is not None:
+        horde.draw(level_time)
 
     # Desenha o jogador
     player.draw(level_time)
+    render.flush()
 
-    # HUD
+    # Partículas por cima dos sprites, escritas direto nos pixels da tela
+    if particles is not None:
+        particles.draw(screen.surface)
+
+
+# ----------------------------
+# RENDERIZAÇÃO POR RETÂNGULOS SUJOS
+# ----------------------------
+# Regiões do HUD, restauradas e redesenhadas a cada frame no modo sujo
+HUD_RECTS = (
+    Rect(12, 12, 28 * PLAYER_MAX_HEALTH, 12),  # corações
+    Rect(WIDTH - 180, 12, 180, 32),  # pontuação
+    Rect(0, HEIGHT - 30, WIDTH, 30),  # dicas
+)
+
+
+class DirtyRectRenderer:
+    """Guarda os limites desenhados no frame anterior e os retângulos a apresentar.
+
+    O PgZero sempre chama pygame.display.flip() depois de draw(); no modo
+    sujo esse flip é trocado por present(), que envia à tela apenas os
+    retângulos pendentes (ou nada, numa tela estática já desenhada).
+    """
+
+    def __init__(self):
+        self.full = True  # o próximo frame precisa ser completo
+        self.last_mode = None
+        self.view = None  # posição da câmera e camada de fundo do último frame completo
+        self.prev = []  # limites das entidades no frame anterior
+        self.pending = []  # retângulos a apresentar no próximo flip
+
+    def invalidate(self):
+        self.full = True
+
+    def full_frame_drawn(self):
+        self.full = False
+        self.last_mode = mode
+        self.view = (camera.x, camera.y, map_layer_key())
+        self.prev = playfield_bounds() if mode == "playing" else []
+        self.pending = [screen.surface.get_rect()]
+
+    def present(self):
+        if self.pending:
+            pygame.display.update(self.pending)
+            self.pending = []
+
+
+dirty_renderer = DirtyRectRenderer()
+_pgzero_flip = None
+
+
+def _present_frame():
+    """Substitui pygame.display.flip enquanto o modo sujo está ativo."""
+    if dirty_rendering:
+        dirty_renderer.present()
+    else:
+        _pgzero_flip()
+
+
+def set_dirty_rendering(enabled):
+    """Liga/desliga a renderização por retângulos sujos."""
+    global dirty_rendering, _pgzero_flip
+    dirty_rendering = enabled
+    if enabled and _pgzero_flip is None:
+        _pgzero_flip = pygame.display.flip
+        pygame.display.flip = _present_frame
+    dirty_renderer.invalidate()
+
+
+def playfield_bounds():
+    """Retângulos (em coordenadas de tela) cobertos pelos sprites visíveis de itens, inimigos e jogador."""
+    pw, ph = PLAYER_SPRITE_SIZE
+    pox, poy = PLAYER_SPRITE_ORIGIN
+    ew, eh = ENEMY_SPRITE_SIZE
+    eox, eoy = ENEMY_SPRITE_ORIGIN
+    pox += camera.x
+    poy += camera.y
+    eox += camera.x
+    eoy += camera.y
+    visible_items, visible_enemies = visible_entities()
+    bounds = [Rect(int(it.x) - 9 - camera.x, int(it.y) - 9 - camera.y, 18, 18) for it in visible_items]
+    for e in visible_enemies:
+        x, y = e.render_pos()
+        bounds.append(Rect(x - eox, y - eoy, ew, eh))
+    x, y = player.render_pos()
+    bounds.append(Rect(x - pox, y - poy, pw, ph))
+    return bounds
+
+
+def draw_dirty():
+    """Desenha só o que mudou desde o último frame; retorna False se for preciso um frame completo."""
+    r = dirty_renderer
+    if r.full or r.last_mode != mode:
+        return False
+    # Partículas vivas (ou desenhadas no frame anterior) cobrem a tela toda, em
+    # qualquer modo: a explosão do fim de jogo também precisa de frames completos
+    if particles is not None and (particles.count or particles.visible):
+        return False
+    if mode != "playing":
+        # Tela estática já desenhada: não há nada a redesenhar nem apresentar
+        return True
+    # Com a câmera em movimento a tela inteira muda: frame completo
+    if (camera.x, camera.y, map_layer_key()) != r.view:
+        return False
+    current = playfield_bounds()
+    if (horde is not None or profiler.overlay
+            or len(current) + len(r.prev) > DIRTY_RECT_LIMIT):
+        return False
+
+    # Restaura o fundo sob as posições antigas e o HUD
+    prof = profiler.enabled
+    t = time.perf_counter() if prof else 0.0
+    surf = screen.surface
+    for rect in r.prev:
+        draw_background(surf, rect)
+    for rect in HUD_RECTS:
+        draw_background(surf, rect)
+    if prof:
+        t = profiler.lap("draw_map", t)
+
+    draw_playfield()
+    if prof:
+        t = profiler.lap("draw_entities", t)
     draw_hud()
+    if prof:
+        profiler.lap("draw_hud", t)
+
+    r.pending = r.prev + current
+    r.pending.extend(HUD_RECTS)
+    r.prev = current
+    return True
 
 
 # ----------------------------
@@ -638,7 +3658,6 @@ def init_audio():
     global audio_initialized
     try:
         # Força a inicialização do mixer do pygame
-        import pygame
         pygame.mixer.pre_init(frequency=22050, size=-16, channels=2, buffer=512)
         pygame.mixer.init()
         audio_initialized = True
@@ -647,134 +3666,203 @@ def init_audio():
         print(f"Erro ao inicializar áudio: {e}")
         audio_initialized = False
 
-# Verifica se o arquivo de música existe (sem depender de módulos externos)
-def music_resource_exists(name: str) -> bool:
-    try:
-        # PgZero espera um arquivo .ogg em music/<name>.ogg
-        with open(f"music/{name}.ogg", "rb") as f:
-            # lê alguns bytes para garantir não ser vazio
-            _ = f.read(4)
-            return True
-    except Exception:
-        return False
+class AudioRegistry:
+    """Inventário dos arquivos de áudio, feito uma única vez na inicialização.
+
+    scan() lê music/ e sounds/, detecta o formato real de cada música (OGG de
+    verdade, MP3 renomeado para .ogg ou MP3) e decodifica os efeitos sonoros
+    em objetos Sound. Depois disso tocar, parar e alternar não abrem arquivos:
+    a música carregada no mixer é reaproveitada enquanto for a mesma faixa.
+    """
+
+    MUSIC_EXTENSIONS = (".ogg", ".mp3", ".wav")  # em ordem de preferência
+    SOUND_EXTENSIONS = (".wav", ".ogg", ".mp3")
+
+    def __init__(self):
+        self.music = {}  # nome -> (caminho, formato)
+        self.sounds = {}  # nome -> pygame.mixer.Sound
+        self.loaded_music = None  # faixa atualmente carregada em pygame.mixer.music
+
+    @staticmethod
+    def detect_music_format(path):
+        """"ogg" para um OGG de verdade, "mp3-as-ogg" para um MP3 renomeado; senão, a extensão."""
+        if not path.endswith(".ogg"):
+            return os.path.splitext(path)[1][1:]
+        with open(path, "rb") as f:
+            return "ogg" if f.read(4) == b"OggS" else "mp3-as-ogg"
+
+    def scan(self, music_dir=MUSIC_DIR, sounds_dir=SOUNDS_DIR):
+        self.music.clear()
+        self.sounds.clear()
+        self.loaded_music = None
+        ranks = {}
+        for filename in sorted(os.listdir(music_dir)) if os.path.isdir(music_dir) else []:
+            name, ext = os.path.splitext(filename)
+            if ext not in self.MUSIC_EXTENSIONS:
+                continue
+            # Com vários formatos para o mesmo nome, fica o preferido (.ogg, depois .mp3)
+            rank = self.MUSIC_EXTENSIONS.index(ext)
+            if rank < ranks.get(name, len(self.MUSIC_EXTENSIONS)):
+                ranks[name] = rank
+                path = os.path.join(music_dir, filename)
+                try:
+                    self.music[name] = (path, self.detect_music_format(path))
+                except OSError as e:
+                    print(f"Erro ao verificar música {path}: {e}")
+        for filename in sorted(os.listdir(sounds_dir)) if os.path.isdir(sounds_dir) else []:
+            name, ext = os.path.splitext(filename)
+            if ext in self.SOUND_EXTENSIONS and name not in self.sounds:
+                path = os.path.join(sounds_dir, filename)
+                try:
+                    self.sounds[name] = pygame.mixer.Sound(path)
+                except Exception as e:
+                    print(f"Erro ao carregar som {path}: {e}")
+
+    def play_music(self, name):
+        """Toca a faixa em loop; só carrega o arquivo se ela ainda não estiver no mixer."""
+        entry = self.music.get(name)
+        if entry is None:
+            return False
+        path, fmt = entry
+        if self.loaded_music != name:
+            pygame.mixer.music.load(path)
+            self.loaded_music = name
+            if fmt == "mp3-as-ogg":
+                print(f"Reproduzindo música via mixer: {path} (provável MP3 renomeado)")
+        pygame.mixer.music.set_volume(MUSIC_VOLUME)
+        pygame.mixer.music.play(-1)
+        return True
 
-def music_mp3_exists(name: str) -> bool:
-    try:
-        with open(f"music/{name}.mp3", "rb") as f:
-            _ = f.read(4)
-            return True
-    except Exception:
-        return False
 
-def ogg_header_is_valid(name: str) -> bool:
-    """Retorna True se o arquivo music/<name>.ogg começar com 'OggS'."""
-    try:
-        with open(f"music/{name}.ogg", "rb") as f:
-            sig = f.read(4)
-            return sig == b"OggS"
-    except Exception:
-        return False
+audio = AudioRegistry()
 
 # Tenta carregar os sons necessários; se faltarem, cria placeholders silenciosos para evitar erros de execução.
 def safe_load_sound(name):
-    try:
-        if audio_initialized:
-            return sounds[name]
-        else:
-            return None
-    except Exception as e:
-        print(f"Erro ao carregar som {name}: {e}")
-        # sounds[...] levanta um KeyError se estiver faltando; cria um objeto fictício com o método play()
+    if not audio_initialized:
+        return None
+    snd = audio.sounds.get(name)
+    if snd is None:
+        print(f"Erro ao carregar som {name}: arquivo não encontrado em {SOUNDS_DIR}/")
+        # cria um objeto fictício com o método play()
         class Dummy:
             def play(self, *a, **k): pass
         return Dummy()
+    return snd
 
 def safe_play_sound(sound_name):
     """Reproduz um som de forma segura, com tratamento de erros."""
-    if not music_enabled or not audio_initialized:
+    # Antes do áudio ficar pronto os efeitos são descartados (estariam fora de hora depois)
+    if headless or not music_enabled or not audio_ready or not audio_initialized:
+        return
+    snd = audio.sounds.get(sound_name)
+    if snd is None:
+        # Recurso de som ausente; ignore silenciosamente
         return
     try:
-        snd = getattr(sounds, sound_name, None)
-        if snd is None:
-            # Recurso de som ausente; ignore silenciosamente
-            return
         snd.play()
     except Exception as e:
         print(f"Erro ao reproduzir som {sound_name}: {e}")
 
 def safe_play_music(music_name):
     """Reproduz música de forma segura, com tratamento de erros."""
-    if not music_enabled or not audio_initialized:
+    global pending_music
+    if headless or not music_enabled:
         return
-    # Primeiro tenta OGG via PgZero quando cabeçalho parece válido
-    if music_resource_exists(music_name) and ogg_header_is_valid(music_name):
-        try:
-            music.play(music_name)
-            music.set_volume(0.6)
-            return
-        except Exception as e:
-            print(f"Erro ao reproduzir música {music_name} (OGG): {e}")
-    # Caso exista .ogg mas não seja OGG de verdade (ex: MP3 renomeado), tenta carregá-lo direto
-    if music_resource_exists(music_name) and not ogg_header_is_valid(music_name):
-        try:
-            import pygame
-            pygame.mixer.music.load(f"music/{music_name}.ogg")
-            pygame.mixer.music.set_volume(0.6)
-            pygame.mixer.music.play(-1)
-            print(f"Reproduzindo música via mixer: music/{music_name}.ogg (provável MP3 renomeado)")
-            return
-        except Exception as e:
-            print(f"Erro ao reproduzir música {music_name} (mixer .ogg): {e}")
-    # Fallback: tenta MP3 via pygame.mixer
-    if music_mp3_exists(music_name):
-        try:
-            import pygame
-            pygame.mixer.music.load(f"music/{music_name}.mp3")
-            pygame.mixer.music.set_volume(0.6)
-            pygame.mixer.music.play(-1)
-            print(f"Reproduzindo música via MP3: music/{music_name}.mp3")
+    if not audio_ready:
+        # A inicialização do áudio ainda roda em segundo plano: toca assim que terminar
+        pending_music = music_name
+        return
+    if not audio_initialized:
+        return
+    try:
+        if audio.play_music(music_name):
             return
-        except Exception as e:
-            print(f"Erro ao reproduzir música {music_name} (MP3): {e}")
+    except Exception as e:
+        print(f"Erro ao reproduzir música {music_name}: {e}")
+        # Não tenta de novo a cada chamada: a faixa sai do inventário
+        audio.music.pop(music_name, None)
+        audio.loaded_music = None
+        return
     # Caso nenhum formato esteja disponível
     print(f"Arquivo de música não encontrado/compatível: music/{music_name}.ogg ou .mp3 — a música será ignorada.")
 
 def safe_stop_music():
     """Para a música de forma segura."""
-    if not audio_initialized:
+    global pending_music
+    pending_music = None
+    if headless or not audio_ready or not audio_initialized:
         return
     try:
-        music.stop()
-        # Também garante parada do mixer.music
-        import pygame
+        # A faixa continua carregada no mixer para a próxima reprodução
         pygame.mixer.music.stop()
     except Exception as e:
         print(f"Erro ao parar música: {e}")
 
 # Variável global para controlar se o áudio foi inicializado
 audio_initialized = False
+# True quando a inicialização em segundo plano terminou (com ou sem sucesso)
+audio_ready = False
+# Música pedida antes do áudio ficar pronto
+pending_music = None
 
-# Inicializa o áudio na importação
-init_audio()
 
-# Garante que os sons existam na tabela de recursos; se o usuário não os adicionou, o objeto fictício evitará falhas
-try:
-    # Acessa as entradas de som para levantar erro se estiverem faltando
-    if audio_initialized:
-        # Usa getattr para evitar erro de subscript e apenas validar presença
-        _hit = getattr(sounds, SOUND_HIT, None)
-        _pickup = getattr(sounds, SOUND_PICKUP, None)
-        _click = getattr(sounds, SOUND_CLICK, None)
-        if _hit and _pickup and _click:
-            print("Todos os arquivos de som carregados com sucesso")
-except Exception as e:
-    print(f"Alguns arquivos de som não foram encontrados: {e}")
-    # Se não estiverem presentes, cria chaves fictícias (o 'sounds' do PgZero é um mapeamento somente leitura, então apenas protegemos com o carregador seguro)
-    pass
-
-# Mensagem informativa sobre música ausente
-if not music_resource_exists(BGM_FILENAME) and not music_mp3_exists(BGM_FILENAME):
-    print(f"Arquivo de música não encontrado: music/{BGM_FILENAME}.ogg/.mp3 — a música será ignorada.")
+def init_audio_background():
+    """Faz o inventário de músicas e sons (roda numa thread).
+
+    Sob o pgzrun o mixer já foi iniciado pelo runner antes do import do
+    main.py, e init_audio() não faz nada de novo; só a varredura das pastas
+    sai do caminho do primeiro frame. Importado sem o runner, o mixer também
+    é iniciado aqui.
+    """
+    global audio_ready
+    try:
+        init_audio()
+        # Faz o inventário de músicas e sons uma única vez; sons ausentes são apenas ignorados
+        if audio_initialized:
+            audio.scan()
+            missing = [name for name in (SOUND_HIT, SOUND_PICKUP, SOUND_CLICK) if name not in audio.sounds]
+            if missing:
+                print(f"Alguns arquivos de som não foram encontrados: {', '.join(missing)}")
+            else:
+                print("Todos os arquivos de som carregados com sucesso")
+
+        # Mensagem informativa sobre música ausente
+        if BGM_FILENAME not in audio.music:
+            print(f"Arquivo de música não encontrado: music/{BGM_FILENAME}.ogg/.mp3 — a música será ignorada.")
+    finally:
+        audio_ready = True
+
+
+def wait_for_audio(timeout=None):
+    """Bloqueia até o áudio ficar pronto (para ferramentas que precisam dele de imediato)."""
+    audio_thread.join(timeout)
+    return audio_ready
+
+
+def flush_pending_music():
+    """Toca a música que foi pedida enquanto o áudio ainda inicializava."""
+    global pending_music
+    name = pending_music
+    pending_music = None
+    safe_play_music(name)
+
+
+def record_startup_time():
+    """Registra o tempo da importação até o primeiro frame apresentado."""
+    global startup_time
+    startup_time = time.perf_counter() - STARTUP_T0
+    print(f"startup_ms={startup_time * 1000:.1f}")
+    if os.environ.get(STARTUP_EXIT_ENV):
+        sys.exit(0)
+
+
+# Varre music/ e sounds/ em segundo plano, para o menu aparecer sem esperar os arquivos
+audio_thread = threading.Thread(target=init_audio_background, name="audio-init", daemon=True)
+audio_thread.start()
+
+# Replay pedido na linha de comando (CRYPT_REPLAY=arquivo pgzrun main.py)
+if os.environ.get(REPLAY_ENV):
+    start_replay(os.environ[REPLAY_ENV])
 
 # ----------------------------
 # CONFIGURAÇÃO INICIAL DO TEXTO DO MENU
@@ -0,0 +1,12 @@
+"""Ferramentas de linha de comando do Crypt of Little Echoes.
+
+Rode a partir da raiz do projeto, por exemplo:
+
+    python -m tools.balance --sessions 2000
+
+O jogo é importado sem janela e sem áudio (drivers "dummy" do SDL).
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
@@ -0,0 +1,211 @@
+"""Balanceamento Monte Carlo: milhares de partidas headless com o bot, em paralelo.
+
+Cada sessão usa uma semente própria (seed-base + índice), então o mesmo comando
+sempre produz o mesmo relatório. As constantes de TUNABLES podem ser trocadas
+com --set, por exemplo:
+
+    python -m tools.balance --sessions 2000 --set ENEMY_SPEED=80 --set CHUNK_ENEMIES=3
+
+O relatório traz a distribuição de tempo de sobrevivência, pontuação, ondas
+concluídas e dano sofrido, além da vazão (segundos simulados por segundo de
+relógio, por processo).
+"""
+import argparse
+import ast
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+MAX_TIME = 300.0  # segundos de jogo por sessão, se o bot não morrer antes
+SESSIONS = 1000
+SEED_BASE = 1
+METRICS = ("survival", "score", "waves", "damage")
+
+# Constantes que --set aceita: só as que o jogo lê durante a partida. As demais
+# (TILE_SIZE, CHUNK_TILES, SIM_HZ, HORDE_SIZE...) já foram copiadas para valores
+# derivados e singletons na importação, e trocá-las depois não teria efeito
+TUNABLES = frozenset({
+    "PLAYER_SPEED", "ENEMY_SPEED", "PLAYER_MAX_HEALTH", "INVULNERABILITY_TIME",
+    "CHUNK_ENEMIES", "ENEMY_MIN_PATROL", "ENEMY_MAX_PATROL", "ENEMY_PERCEPTION", "ENEMY_CHASE_TIME",
+    "START_ITEMS", "WAVE_ITEMS", "WAVE_NEW_ENEMIES", "WAVE_BONUS", "ITEM_SCORE",
+    "SPAWN_SEPARATION", "SPAWN_PLAYER_CLEARANCE", "SPAWN_ATTEMPTS",
+    "ENEMY_CAP", "ENEMY_OVERFLOW_SPEEDUP", "ENEMY_MAX_SPEEDUP",
+    "DUNGEON_ROOMS", "DUNGEON_ROOM_MIN", "DUNGEON_ROOM_MAX", "DUNGEON_START_ROOM", "DUNGEON_LOOPS",
+    "CORRIDOR_WIDTH", "CHUNK_LOAD_RADIUS", "CHUNK_ACTIVE_RADIUS", "ITEM_SPAWN_RADIUS",
+    "BOT_DANGER_RADIUS", "BOT_STALL_TIME",
+    "AI_LOD_ENABLED", "AI_LOD_NEAR_MARGIN", "AI_LOD_TIERS", "AI_LOD_IDLE_INTERVAL",
+})
+# Lidas só pelo construtor do AIScheduler: o ai_scheduler é recriado depois do --set
+SCHEDULER_TUNABLES = frozenset({"AI_LOD_ENABLED", "AI_LOD_TIERS", "AI_LOD_IDLE_INTERVAL"})
+
+# Estado do processo trabalhador (o jogo é importado uma vez por processo)
+_game = None
+
+
+def _init_worker(overrides):
+    """Importa o jogo no processo trabalhador e aplica as constantes de --set."""
+    global _game
+    # A importação e a thread de áudio imprimem avisos; não poluem o relatório
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+        main.wait_for_audio()
+    for name, value in overrides.items():
+        if name not in TUNABLES:
+            raise AttributeError(f"{name} não pode ser trocada com --set")
+        setattr(main, name, value)
+    if SCHEDULER_TUNABLES & set(overrides):
+        main.ai_scheduler = main.AIScheduler(main.AI_LOD_TIERS, main.AI_LOD_IDLE_INTERVAL)
+    _game = main
+
+
+def run_session(seed, max_time):
+    """Joga uma sessão com o bot e devolve as métricas dela."""
+    game = _game
+    game.start_headless_game(seed)
+    # SIM_DT é o passo real da simulação (fixado na importação, como SIM_HZ)
+    ticks = int(max_time / game.SIM_DT)
+    start = time.perf_counter()
+    state = game.step_many(ticks, game.bot_input)
+    wall = time.perf_counter() - start
+    return {
+        "seed": seed,
+        "survival": state["level_time"],
+        "died": state["mode"] == "gameover",
+        "score": state["score"],
+        "waves": state["waves_cleared"],
+        "damage": game.PLAYER_MAX_HEALTH - state["health"],
+        "wall": wall,
+    }
+
+
+def _run_chunk(seeds, max_time):
+    return [run_session(seed, max_time) for seed in seeds]
+
+
+def percentile(sorted_values, p):
+    """Percentil com interpolação linear (p entre 0 e 100)."""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def distribution(values):
+    values = sorted(values)
+    summary = {"mean": statistics.fmean(values) if values else 0.0}
+    for p in (5, 25, 50, 75, 95):
+        summary[f"p{p}"] = percentile(values, p)
+    return summary
+
+
+def summarize(results, wall, workers):
+    sim_time = sum(r["survival"] for r in results)
+    busy = sum(r["wall"] for r in results)
+    return {
+        "sessions": len(results),
+        "deaths": sum(1 for r in results if r["died"]),
+        **{name: distribution([r[name] for r in results]) for name in METRICS},
+        "sim_seconds": sim_time,
+        "wall_seconds": wall,
+        "workers": workers,
+        # Vazão por processo: tempo simulado sobre o tempo gasto simulando
+        "throughput_per_core": sim_time / busy if busy else 0.0,
+        "throughput_total": sim_time / wall if wall else 0.0,
+    }
+
+
+def run_balance(sessions=SESSIONS, workers=None, max_time=MAX_TIME, overrides=None,
+                seed_base=SEED_BASE):
+    """Roda as sessões num pool de processos e devolve o resumo."""
+    workers = workers or os.cpu_count() or 1
+    seeds = list(range(seed_base, seed_base + sessions))
+    # Lotes pequenos equilibram a carga (sessões variam muito de duração)
+    # sem pagar a ida e volta ao pool a cada partida
+    chunk = max(1, min(16, sessions // (workers * 8)))
+    chunks = [seeds[i:i + chunk] for i in range(0, len(seeds), chunk)]
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(overrides or {},)) as pool:
+        for part in pool.map(_run_chunk, chunks, [max_time] * len(chunks)):
+            results.extend(part)
+    wall = time.perf_counter() - start
+
+    summary = summarize(results, wall, workers)
+    summary["overrides"] = dict(overrides or {})
+    summary["max_time"] = max_time
+    summary["seed_base"] = seed_base
+    return summary
+
+
+def print_report(summary):
+    labels = {
+        "survival": "sobrevivência (s)",
+        "score": "pontuação",
+        "waves": "ondas concluídas",
+        "damage": "dano sofrido",
+    }
+    print(f"sessões: {summary['sessions']}  mortes: {summary['deaths']}  "
+          f"(limite de {summary['max_time']:.0f} s por sessão)")
+    if summary["overrides"]:
+        print("constantes: " + ", ".join(f"{k}={v!r}" for k, v in summary["overrides"].items()))
+    print(f"{'':18}{'média':>9}{'p5':>9}{'p25':>9}{'p50':>9}{'p75':>9}{'p95':>9}")
+    for name in METRICS:
+        d = summary[name]
+        row = "".join(f"{d[key]:9.1f}" for key in ("mean", "p5", "p25", "p50", "p75", "p95"))
+        print(f"{labels[name]:18}{row}")
+    print(f"vazão: {summary['throughput_per_core']:.0f} s simulados/s por processo, "
+          f"{summary['throughput_total']:.0f} s/s no total "
+          f"({summary['workers']} processos, {summary['wall_seconds']:.1f} s de relógio)")
+
+
+def parse_override(text):
+    """Converte NOME=VALOR; o valor é lido como literal Python quando possível."""
+    name, sep, value = text.partition("=")
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f"esperado NOME=VALOR, recebido {text!r}")
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return name.strip(), value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=SESSIONS)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processos no pool (padrão: número de núcleos)")
+    parser.add_argument("--max-time", type=float, default=MAX_TIME,
+                        help="segundos de jogo por sessão")
+    parser.add_argument("--seed-base", type=int, default=SEED_BASE)
+    parser.add_argument("--set", dest="overrides", type=parse_override, action="append",
+                        default=[], metavar="NOME=VALOR",
+                        help="troca uma constante de jogo do main.py (pode repetir; veja TUNABLES)")
+    parser.add_argument("--json", metavar="ARQUIVO", help="também grava o resumo em JSON")
+    args = parser.parse_args(argv)
+    rejected = sorted(set(dict(args.overrides)) - TUNABLES)
+    if rejected:
+        parser.error("constante que não pode ser trocada com --set (é lida só na importação "
+                     "ou não existe): " + ", ".join(rejected)
+                     + "\naceitas: " + ", ".join(sorted(TUNABLES)))
+
+    summary = run_balance(args.sessions, args.workers, args.max_time, dict(args.overrides),
+                          args.seed_base)
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,399 @@
+"""Servidor multijogador local: a simulação do main.py, autoritativa, para vários jogadores via asyncio.
+
+Cada cliente abre uma conexão TCP e só manda sua máscara de entrada
+(INPUT_*) quando ela muda. O servidor avança a simulação em passo fixo pelo
+mesmo caminho de update() (main.advance_simulation, com uma máscara por
+jogador) e, SEND_HZ vezes por segundo, manda a cada cliente um snapshot das
+entidades perto do jogador dele, com posições quantizadas em 1/POS_SCALE de
+pixel e codificado como delta do último snapshot enviado àquele cliente:
+entidades que não mudaram não vão, deslocamentos pequenos vão em um byte por
+eixo e entidades que saíram de vista vão só como id. Como a conexão é TCP
+(ordem e entrega garantidas), a base do delta é sempre o snapshot anterior.
+
+    python -m tools.server --port 7777
+
+Quando todos os jogadores morrem, a partida recomeça depois de
+RESTART_DELAY segundos. Sem clientes conectados a simulação fica parada.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import struct
+import sys
+import time
+from collections import deque
+
+HOST = "127.0.0.1"
+PORT = 7777
+SEND_HZ = 20  # snapshots por segundo para cada cliente
+POS_SCALE = 2  # posições vão em unidades de 1/POS_SCALE pixel
+VIEW_MARGIN = 120  # além da tela em volta do jogador, em pixels, que o cliente recebe
+RESTART_DELAY = 2.0
+TIMING_WINDOW = 2000  # amostras guardadas para os percentis de tempo
+
+# Tipos de mensagem (primeiro byte de cada mensagem)
+MSG_INPUT = 1  # cliente -> servidor: máscara de entrada
+MSG_STATE = 2  # servidor -> cliente: snapshot delta
+
+# Tipos de entidade
+KIND_PLAYER = 0
+KIND_ENEMY = 1
+KIND_ITEM = 2
+
+# Campos presentes em cada registro de entidade
+FIELD_NEW = 0x80  # entidade nova para o cliente: segue o tipo
+FIELD_POS = 0x01  # posição absoluta (2 x uint16)
+FIELD_POS_DELTA = 0x02  # deslocamento pequeno (2 x int8)
+FIELD_ANIM = 0x04  # frame da animação e alerta
+FIELD_HEALTH = 0x08
+FIELD_SCORE = 0x10
+
+_LENGTH = struct.Struct("<H")
+_INPUT = struct.Struct("<BB")
+# tipo, tick do servidor, modo, id do jogador do cliente, registros alterados, ids removidos
+_STATE_HEADER = struct.Struct("<BIBHHH")
+_RECORD = struct.Struct("<HB")
+_POS = struct.Struct("<HH")
+_POS_DELTA = struct.Struct("<bb")
+_SCORE = struct.Struct("<I")
+MODES = ("menu", "playing", "gameover", "quit")
+
+
+def frame(payload):
+    """Mensagem com o tamanho na frente, pronta para o socket."""
+    return _LENGTH.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    """Próxima mensagem do stream (sem o tamanho)."""
+    (size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(size)
+
+
+# ----------------------------
+# CODIFICAÇÃO DOS SNAPSHOTS
+# ----------------------------
+# Cada entidade é vista como (tipo, x, y, anim, vida, pontos), já quantizada.
+
+def encode_state(tick, mode, you, view, sent):
+    """Snapshot delta de view (id -> entidade) em relação a sent, que é atualizado no lugar."""
+    parts = []
+    changed = 0
+    pack_record = _RECORD.pack
+    for net_id, ent in view.items():
+        old = sent.get(net_id)
+        if old == ent:
+            continue
+        changed += 1
+        kind, x, y, anim, health, score = ent
+        if old is None:
+            flags = FIELD_NEW | FIELD_POS | FIELD_ANIM
+            if kind == KIND_PLAYER:
+                flags |= FIELD_HEALTH | FIELD_SCORE
+            parts.append(pack_record(net_id, flags) + bytes((kind,)) + _POS.pack(x, y)
+                         + bytes((anim,)))
+            if kind == KIND_PLAYER:
+                parts.append(bytes((health,)) + _SCORE.pack(score))
+        else:
+            flags = 0
+            body = []
+            dx = x - old[1]
+            dy = y - old[2]
+            if dx or dy:
+                if -128 <= dx <= 127 and -128 <= dy <= 127:
+                    flags |= FIELD_POS_DELTA
+                    body.append(_POS_DELTA.pack(dx, dy))
+                else:
+                    flags |= FIELD_POS
+                    body.append(_POS.pack(x, y))
+            if anim != old[3]:
+                flags |= FIELD_ANIM
+                body.append(bytes((anim,)))
+            if health != old[4]:
+                flags |= FIELD_HEALTH
+                body.append(bytes((health,)))
+            if score != old[5]:
+                flags |= FIELD_SCORE
+                body.append(_SCORE.pack(score))
+            parts.append(pack_record(net_id, flags))
+            parts += body
+        sent[net_id] = ent
+    removed = [net_id for net_id in sent if net_id not in view]
+    for net_id in removed:
+        del sent[net_id]
+    header = _STATE_HEADER.pack(MSG_STATE, tick, MODES.index(mode), you, changed, len(removed))
+    return header + b"".join(parts) + struct.pack("<%dH" % len(removed), *removed)
+
+
+def decode_state(payload, entities):
+    """Aplica um snapshot de encode_state a entities (id -> [tipo, x, y, anim, vida, pontos]).
+
+    Retorna (tick, modo, id do jogador do cliente).
+    """
+    _, tick, mode_index, you, changed, removed = _STATE_HEADER.unpack_from(payload)
+    offset = _STATE_HEADER.size
+    for _ in range(changed):
+        net_id, flags = _RECORD.unpack_from(payload, offset)
+        offset += _RECORD.size
+        if flags & FIELD_NEW:
+            ent = entities[net_id] = [payload[offset], 0, 0, 0, 0, 0]
+            offset += 1
+        else:
+            ent = entities[net_id]
+        if flags & FIELD_POS:
+            ent[1], ent[2] = _POS.unpack_from(payload, offset)
+            offset += _POS.size
+        if flags & FIELD_POS_DELTA:
+            dx, dy = _POS_DELTA.unpack_from(payload, offset)
+            ent[1] += dx
+            ent[2] += dy
+            offset += _POS_DELTA.size
+        if flags & FIELD_ANIM:
+            ent[3] = payload[offset]
+            offset += 1
+        if flags & FIELD_HEALTH:
+            ent[4] = payload[offset]
+            offset += 1
+        if flags & FIELD_SCORE:
+            (ent[5],) = _SCORE.unpack_from(payload, offset)
+            offset += _SCORE.size
+    for net_id in struct.unpack_from("<%dH" % removed, payload, offset):
+        del entities[net_id]
+    return tick, MODES[mode_index], you
+
+
+# ----------------------------
+# SERVIDOR
+# ----------------------------
+class ClientConnection:
+    """Um cliente conectado: o jogador dele, a última máscara recebida e o que já lhe foi enviado."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.player = None
+        self.mask = 0
+        self.sent = {}  # id -> entidade, base do próximo delta
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+
+class GameServer:
+    """Roda o jogo (o módulo main) para os clientes conectados."""
+
+    def __init__(self, game, send_hz=SEND_HZ, seed=None):
+        self.game = game
+        self.send_hz = send_hz
+        self.seed = seed
+        self.clients = []
+        self.ids = {}  # objeto do jogo -> id de rede
+        self._next_id = itertools.count(1)
+        self.restart_at = None
+        # Tempos de CPU do servidor, em segundos
+        self.tick_times = deque(maxlen=TIMING_WINDOW)  # por tick de simulação
+        self.send_times = deque(maxlen=TIMING_WINDOW)  # por rodada de snapshots (todos os clientes)
+        self.busy = 0.0
+        self.ticks = 0
+
+    # Jogadores
+    def start_game(self):
+        """Partida nova com um jogador para cada cliente conectado."""
+        game = self.game
+        game.start_headless_game(self.seed)
+        self.ids.clear()
+        for i, conn in enumerate(self.clients):
+            conn.player = game.player if i == 0 else game.add_player()
+        self.restart_at = None
+
+    def join(self, conn):
+        self.clients.append(conn)
+        if len(self.clients) == 1 or self.game.mode != "playing":
+            self.start_game()
+        else:
+            conn.player = self.game.add_player()
+
+    def leave(self, conn):
+        self.clients.remove(conn)
+        if self.clients:
+            self.game.remove_player(conn.player)
+
+    def net_id(self, obj):
+        net_id = self.ids.get(obj)
+        if net_id is None:
+            net_id = self.ids[obj] = next(self._next_id) & 0xFFFF
+        return net_id
+
+    # Conexões
+    async def handle(self, reader, writer):
+        conn = ClientConnection(writer)
+        self.join(conn)
+        try:
+            while True:
+                payload = await read_frame(reader)
+                conn.bytes_in += len(payload) + _LENGTH.size
+                if payload[0] == MSG_INPUT:
+                    conn.mask = _INPUT.unpack(payload)[1]
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.leave(conn)
+            writer.close()
+
+    # Simulação e envio
+    def step(self, dt):
+        """Avança a simulação dt segundos com as máscaras atuais dos clientes."""
+        game = self.game
+        if game.mode == "gameover":
+            if self.restart_at is None:
+                self.restart_at = time.perf_counter() + RESTART_DELAY
+            elif time.perf_counter() >= self.restart_at:
+                self.start_game()
+            return
+        masks = {conn.player: conn.mask for conn in self.clients}
+        inputs = [masks.get(p, 0) for p in game.players]
+        start = time.perf_counter()
+        before = game.ai_scheduler.tick
+        game.advance_simulation(dt, inputs if len(inputs) > 1 else inputs[0])
+        done = game.ai_scheduler.tick - before
+        if done:
+            elapsed = time.perf_counter() - start
+            self.tick_times.extend([elapsed / done] * done)
+            self.ticks += done
+
+    def view(self, p):
+        """Entidades que o cliente do jogador p recebe: todos os jogadores e o que está perto de p."""
+        game = self.game
+        scale = POS_SCALE
+        net_id = self.net_id
+        half_w = game.WIDTH / 2 + VIEW_MARGIN
+        half_h = game.HEIGHT / 2 + VIEW_MARGIN
+        x0, x1 = p.x - half_w, p.x + half_w
+        y0, y1 = p.y - half_h, p.y + half_h
+        view = {net_id(q): (KIND_PLAYER, int(q.x * scale), int(q.y * scale), q.frame,
+                            max(0, q.health), q.score)
+                for q in game.players}
+        for e in game.enemies:
+            if x0 < e.x < x1 and y0 < e.y < y1:
+                view[net_id(e)] = (KIND_ENEMY, int(e.x * scale), int(e.y * scale),
+                                   e.frame | (4 if e.is_alert else 0), 0, 0)
+        for it in game.items:
+            if x0 < it.x < x1 and y0 < it.y < y1:
+                view[net_id(it)] = (KIND_ITEM, int(it.x * scale), int(it.y * scale), 0, 0, 0)
+        return view
+
+    def broadcast(self):
+        """Manda o snapshot delta de cada cliente."""
+        start = time.perf_counter()
+        game = self.game
+        tick = game.ai_scheduler.tick
+        for conn in self.clients:
+            data = frame(encode_state(tick, game.mode, self.net_id(conn.player),
+                                      self.view(conn.player), conn.sent))
+            conn.writer.write(data)
+            conn.bytes_out += len(data)
+        self.send_times.append(time.perf_counter() - start)
+
+    async def run(self, stop=None):
+        """Laço principal: a cada 1/send_hz s avança a simulação e manda os snapshots."""
+        interval = 1 / self.send_hz
+        last = time.perf_counter()
+        while stop is None or not stop.is_set():
+            now = time.perf_counter()
+            dt = now - last
+            last = now
+            if self.clients:
+                start = time.perf_counter()
+                self.step(dt)
+                self.broadcast()
+                self.busy += time.perf_counter() - start
+            await asyncio.sleep(max(0.0, interval - (time.perf_counter() - now)))
+
+    async def serve(self, host=HOST, port=PORT):
+        """Abre o socket; devolve o asyncio.Server (port=0 escolhe uma porta livre)."""
+        return await asyncio.start_server(self.handle, host, port)
+
+
+# ----------------------------
+# CLIENTE
+# ----------------------------
+class GameClient:
+    """Cliente fino: manda entradas e mantém a última visão do mundo que o servidor mandou."""
+
+    def __init__(self):
+        self.entities = {}  # id -> [tipo, x, y, anim, vida, pontos], posições em 1/POS_SCALE px
+        self.player_id = None
+        self.mode = None
+        self.tick = 0
+        self.mask = None
+        self.snapshots = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, host=HOST, port=PORT):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    def send_input(self, mask):
+        """Manda a máscara de entrada, se mudou desde a última."""
+        if mask == self.mask:
+            return
+        self.mask = mask
+        data = frame(_INPUT.pack(MSG_INPUT, mask))
+        self.writer.write(data)
+        self.bytes_out += len(data)
+
+    async def receive(self):
+        """Aplica os snapshots até a conexão fechar."""
+        try:
+            while True:
+                payload = await read_frame(self.reader)
+                self.bytes_in += len(payload) + _LENGTH.size
+                if payload[0] == MSG_STATE:
+                    self.tick, self.mode, self.player_id = decode_state(payload, self.entities)
+                    self.snapshots += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def me(self):
+        """Entidade do próprio jogador (ou None antes do primeiro snapshot)."""
+        return self.entities.get(self.player_id)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def load_game():
+    """Importa o jogo sem janela (a importação e o áudio imprimem avisos; não poluem a saída)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+        main.wait_for_audio()
+    return main
+
+
+async def serve_forever(host, port, send_hz, seed):
+    server = GameServer(load_game(), send_hz, seed)
+    listener = await server.serve(host, port)
+    addr = listener.sockets[0].getsockname()
+    print(f"servidor em {addr[0]}:{addr[1]} ({send_hz} snapshots/s)")
+    async with listener:
+        await server.run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--send-hz", type=int, default=SEND_HZ)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve_forever(args.host, args.port, args.send_hz, args.seed))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])